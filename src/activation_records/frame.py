@@ -1,4 +1,5 @@
-from typing import List, Dict
+import re
+from typing import List, Dict, Optional, Tuple
 
 from dataclasses import dataclass
 
@@ -82,10 +83,12 @@ class Access(ABC):
     pass
 
 
-# InFrame(X) indicates a memory location at offset X from the frame pointer.
+# InFrame(X) indicates a memory location at offset X from the frame pointer. It is a
+# pointer if it holds the address of a record, an array or a string.
 @dataclass
 class InFrame(Access):
     offset: int
+    pointer: bool = False
 
 
 # InReg(t84) indicates storage in the "register" t84.
@@ -101,8 +104,14 @@ class InRegister(Access):
 class Frame:
     # Creates a new frame for function "name" with "formalEscapes" list of
     # booleans (list of parameters for function "name"). True means
-    # escaped variable.
-    def __init__(self, name: TempLabel, formal_escapes: List[bool]):
+    # escaped variable. "formal_pointers" tells which parameters are pointers (none of
+    # them, if it is not given).
+    def __init__(
+        self,
+        name: TempLabel,
+        formal_escapes: List[bool],
+        formal_pointers: Optional[List[bool]] = None,
+    ):
         self.name = name
         # The previous %rbp value is stored at 0(%rbp).
         # Non-volatile registers are stored starting at -8(%rbp).
@@ -113,30 +122,65 @@ class Frame:
         # kept at run time, as seen from inside the callee.
         self.formal_parameters = []
         self.local_variables = []
-
+        # Size of the area at the bottom of the frame where the arguments that do not
+        # fit in registers are passed to the called functions.
+        self.outgoing_arguments_size = 0
+        # Offsets of the slots holding pointers, which the garbage collector must find
+        # at every call.
+        self.pointer_slots: List[int] = []
+
+        if formal_pointers is None:
+            formal_pointers = [False for _ in formal_escapes]
         # Process the parameters passed by registers.
-        for escape in formal_escapes[: len(argument_registers)]:
-            self._alloc_single_var(escape, self.formal_parameters)
+        for escape, pointer in list(zip(formal_escapes, formal_pointers))[
+            : len(argument_registers)
+        ]:
+            self._alloc_single_var(escape, self.formal_parameters, pointer)
 
         # Process the extra parameters (stored in the previous frame).
         extra_argument_offset = 16
-        for escape in formal_escapes[len(argument_registers) :]:
-            self.formal_parameters.append(InFrame(extra_argument_offset))
+        for pointer in formal_pointers[len(argument_registers) :]:
+            self.formal_parameters.append(InFrame(extra_argument_offset, pointer))
+            if pointer:
+                self.pointer_slots.append(extra_argument_offset)
             extra_argument_offset += word_size
 
     # Allocates a new local variable in the frame. The "escape"
-    # variable indicates whether the variable escapes or not.
-    def alloc_local(self, escape: bool) -> Access:
-        return self._alloc_single_var(escape, self.local_variables)
+    # variable indicates whether the variable escapes or not, and "pointer" whether it
+    # holds pointers.
+    def alloc_local(self, escape: bool, pointer: bool = False) -> Access:
+        return self._alloc_single_var(escape, self.local_variables, pointer)
+
+    # Allocates consecutive slots in the frame for the elements of an array, returning
+    # the offset of the first element, which is the lowest one.
+    def alloc_array(self, size: int, pointer: bool = False) -> int:
+        self.offset -= word_size * size
+        if pointer:
+            self.pointer_slots.extend(
+                self.offset + index * word_size for index in range(size)
+            )
+        return self.offset
+
+    # Makes room in the outgoing arguments area for a call with the given amount of
+    # arguments.
+    def reserve_outgoing_arguments(self, argument_amount: int):
+        stack_arguments = max(argument_amount - len(argument_registers), 0)
+        self.outgoing_arguments_size = max(
+            self.outgoing_arguments_size, word_size * stack_arguments
+        )
 
     # Allocates a single variable or parameter in the frame and adds it
     # to access_list.
-    def _alloc_single_var(self, escape: bool, access_list: List[Access]) -> Access:
+    def _alloc_single_var(
+        self, escape: bool, access_list: List[Access], pointer: bool = False
+    ) -> Access:
         if escape:
             self.offset -= word_size
-            access_list.append(InFrame(self.offset))
+            access_list.append(InFrame(self.offset, pointer))
+            if pointer:
+                self.pointer_slots.append(self.offset)
         else:
-            access_list.append(InRegister(TempManager.new_temp()))
+            access_list.append(InRegister(TempManager.new_temp(pointer)))
         return access_list[-1]
 
 
@@ -149,7 +193,8 @@ def access_to_exp(access: Access, frame_pointer: IRT.Expression) -> IRT.Expressi
         return IRT.Memory(
             IRT.BinaryOperation(
                 IRT.BinaryOperator.plus, frame_pointer, IRT.Constant(access.offset)
-            )
+            ),
+            access.pointer,
         )
     if isinstance(access, InRegister):
         return IRT.Temporary(access.register)
@@ -158,9 +203,11 @@ def access_to_exp(access: Access, frame_pointer: IRT.Expression) -> IRT.Expressi
 # Sometimes we will need to call external functions that as written in C or assembly language
 # (such as a function that allocates memory for a Tiger array).
 def external_call(
-    function_name: str, arguments: List[IRT.Expression]
+    function_name: str, arguments: List[IRT.Expression], pointer: bool = False
 ) -> IRT.Expression:
-    return IRT.Call(IRT.Name(TempManager.named_label(function_name)), arguments)
+    return IRT.Call(
+        IRT.Name(TempManager.named_label(function_name)), arguments, pointer
+    )
 
 
 # This applies the view shift of calling a function.
@@ -194,49 +241,113 @@ def shift_view(frame: Frame, function_body: IRT.Statement) -> IRT.Statement:
     return IRT.Sequence(shift_parameters + [function_body])
 
 
-# This preserves the callee_saved registers across a function call.
-# We need to make up new temporaries for each callee-save register. On entry, we move
-# all these registers to their new temporary locations, and on exit, we move them back.
-def preserve_callee_registers(
-    frame: Frame, function_body: IRT.Statement
-) -> IRT.Statement:
-    save_registers = []
-    restore_registers = []
-    for callee_register in callee_saved_registers:
-        temp = TempManager.new_temp()
-        save_registers.append(
-            IRT.Move(
-                IRT.Temporary(temp),
-                IRT.Temporary(TempMap.register_to_temp[callee_register]),
-            )
-        )
-        restore_registers.append(
-            IRT.Move(
-                IRT.Temporary(TempMap.register_to_temp[callee_register]),
-                IRT.Temporary(temp),
-            )
-        )
-    return IRT.Sequence(save_registers + [function_body] + restore_registers)
-
-
 # This function appends a “sink” instruction to the function body to tell the
 # register allocator that certain registers are live at procedure exit.
 def sink(function_body: List[Assembly.Instruction]) -> List[Assembly.Instruction]:
-    sink_registers = callee_saved_registers + ["rsp", "rip"]
-    sink_temps = [TempMap.register_to_temp[register] for register in sink_registers]
     function_body.append(
-        Assembly.Operation(line="", source=sink_temps, destination=[], jump=None)
+        Assembly.Operation(line="", source=exit_temps(), destination=[], jump=None)
     )
     return function_body
 
 
+# Temporaries of the registers that are live when leaving the function, either at the
+# end of its body or through a tail call. The other callee-saved registers are free to
+# be allocated, since the ones that are used get saved in the prologue and restored in
+# the epilogue.
+def exit_temps() -> List[Temp]:
+    exit_registers = ["rbp", "rsp", "rip"]
+    return [TempMap.register_to_temp[register] for register in exit_registers]
+
+
+# Callee-saved registers (besides rbp, which is always preserved) assigned to some
+# temporary of the allocated function body.
+def used_callee_saved_registers(body: List[Assembly.Instruction]) -> List[str]:
+    assigned_registers = {
+        temp_to_str(temp)
+        for instruction in body
+        if isinstance(instruction, (Assembly.Operation, Assembly.Move))
+        for temp in instruction.destination
+    }
+    return [
+        register
+        for register in callee_saved_registers
+        if register != "rbp" and register in assigned_registers
+    ]
+
+
+# Functions of the runtime that never allocate, so calling them never runs the garbage
+# collector. Any other call may do it.
+non_collecting_functions = [
+    "char_to_num",
+    "exit_program",
+    "flush",
+    "not",
+    "print_num",
+    "print_string",
+    "read_num",
+    "string_compare",
+    "string_equal",
+    "string_length",
+]
+
+
+def may_collect(instruction: Assembly.Instruction) -> bool:
+    if not isinstance(instruction, Assembly.Operation):
+        return False
+    match = re.fullmatch(r"call (\S+)\n", instruction.line)
+    return match is not None and match.group(1) not in non_collecting_functions
+
+
+# The garbage collector finds the pointers of each frame from the address its function
+# returns to, so a label is put after each call that may collect. Its stack map lists
+# the offsets from the frame pointer of the slots holding pointers during the call:
+# the spill slots given by the register allocator (indexed by the id of the call) and
+# the slots of the frame that hold pointers.
 def assembly_procedure(
-    frame: Frame, body: List[Assembly.Instruction]
+    frame: Frame,
+    body: List[Assembly.Instruction],
+    spilled_pointers: Optional[Dict[int, List[int]]] = None,
 ) -> Assembly.Procedure:
-    # Prologue
-    prologue = f"# PROCEDURE {frame.name}\n"
-    prologue += f"{frame.name}:\n"
+    saved_registers = used_callee_saved_registers(body)
+    if is_frameless(body):
+        prologue, teardown = leaf_frame(frame, body, saved_registers)
+    else:
+        prologue, teardown = full_frame(frame, saved_registers)
+
+    stack_maps = []
+    labeled_body = []
+    for instruction in body:
+        labeled_body.append(instruction)
+        if may_collect(instruction):
+            label = TempManager.new_label()
+            labeled_body.append(Assembly.Label(f"{label}:\n", label))
+            offsets = (spilled_pointers or {}).get(id(instruction), [])
+            stack_maps.append(
+                Assembly.StackMap(label, sorted(offsets + frame.pointer_slots))
+            )
+    body = labeled_body
+    prologue = f"# PROCEDURE {frame.name}\n" + f"{frame.name}:\n" + prologue
+    prologue += "\n\n"
+
+    # Tail calls also free the frame before jumping, restoring the saved registers.
+    for instruction in body:
+        if isinstance(instruction, Assembly.Operation):
+            instruction.line = instruction.line.replace(
+                free_frame_placeholder, teardown
+            )
+
+    # Epilogue
+    epilogue = "\n\n"
+    epilogue += teardown
+    epilogue += "ret\n"
+    epilogue += f"# END {frame.name}\n"
+
+    return Assembly.Procedure(prologue, body, epilogue, stack_maps)
+
 
+# Builds the prologue that sets up the frame pointer and the instructions that free the
+# frame, for functions that make calls or use the frame pointer as a value.
+def full_frame(frame: Frame, saved_registers: List[str]) -> Tuple[str, str]:
     # After the call instruction the stack looks like this:
     # *       ...        *
     # *      arg 7       *<- %rsp + 8
@@ -255,31 +366,213 @@ def assembly_procedure(
     # *   previous rbp   *<- %rbp
     # *   local 1 (sl)   *<- %rbp - 8
     # *       ...        *<- %rbp - 16
-    # *     local n      *<- %rsp
+    # *     local n      *
+    # *  saved register  *
+    # *       ...        *
+    # *   ------------   *
+    # *  outgoing arg 8  *<- %rsp + 8
+    # *  outgoing arg 7  *<- %rsp
 
-    prologue += "pushq %rbp\n"  # push rbp onto the stack
+    prologue = "pushq %rbp\n"  # push rbp onto the stack
     prologue += "movq %rsp, %rbp\n"  # rbp <- rsp, now rbp points to the old rbp
 
-    # Here stack space is reserved only for formal parameters and local variables.
-    # Stack space for outgoing arguments is reserved in codegen (when munching
-    # IRT.Call).
+    # The callee-saved registers used by the function are saved in slots of the frame,
+    # below the ones of the formal parameters and local variables.
+    saved_slots = [
+        (register, frame.alloc_local(True).offset) for register in saved_registers
+    ]
+
+    # Here stack space is reserved for formal parameters, local variables, saved
+    # registers and the arguments passed in the stack to the called functions, whose
+    # area is the one needed by the call with the most arguments.
     # The amount of stack space necessary for formal parameters and local variables
     # is equal to word_size * amount of InFrames.
     # Each time an InFrame is created, frame.offset decreases by word_size.
-    # Align the stack_size to 16 bytes.
-    stack_size = -frame.offset - (frame.offset % -16)
+    # Align the stack_size to 16 bytes, so that rsp stays aligned at every call.
+    frame_size = -frame.offset + frame.outgoing_arguments_size
+    stack_size = frame_size - (frame_size % -16)
     prologue += f"subq ${stack_size}, %rsp\n"
-    prologue += "\n\n"
-    # Epilogue
-    epilogue = "\n\n"
-    # Move rsp to where the old rbp value was stored.
-    epilogue += "movq %rbp, %rsp\n"
-    epilogue += "popq %rbp\n"  # Restore old rbp value.
-    epilogue += "ret\n"
-    epilogue += f"# END {frame.name}\n"
+    for register, offset in saved_slots:
+        prologue += f"movq %{register}, {offset}(%rbp)\n"
+    # The slots holding pointers are in the stack maps of every call, so the garbage
+    # collector must not find garbage in the ones that are not assigned yet.
+    for offset in frame.pointer_slots:
+        if offset < 0:
+            prologue += f"movq $0, {offset}(%rbp)\n"
+
+    return prologue, free_frame(saved_slots)
+
+
+# Builds the prologue and the instructions that free the frame of a leaf function,
+# which never sets up the frame pointer. Its slots are addressed relative to rsp, and
+# since it makes no calls, the stack does not need to be aligned.
+# After the prologue, the stack looks like this:
+# *       ...        *
+# *      arg 7       *<- %rsp + stack_size + saved_size + 8
+# *   ------------   *
+# * return  adddress *<- %rsp + stack_size + saved_size
+# *   local 1 (sl)   *<- %rsp + stack_size + saved_size - 8
+# *       ...        *
+# *     local n      *
+# *   ------------   *
+# *  saved register  *
+# *       ...        *<- %rsp
+def leaf_frame(
+    frame: Frame, body: List[Assembly.Instruction], saved_registers: List[str]
+) -> Tuple[str, str]:
+    stack_size = -frame.offset
+    saved_size = word_size * len(saved_registers)
+    address_slots_from_stack_pointer(body, stack_size + saved_size)
+
+    prologue = ""
+    teardown = pop_registers(saved_registers)
+    if stack_size > 0:
+        prologue += f"subq ${stack_size}, %rsp\n"
+        teardown += f"addq ${stack_size}, %rsp\n"
+    prologue += push_registers(saved_registers)
+    return prologue, teardown
+
+
+# Matches a frame slot access through the source of the given index, capturing the
+# offset of the slot.
+def frame_slot_pattern(index: int) -> str:
+    return rf"(-?\d+)\(%'s{index}\)"
+
+
+# A function can do without a frame pointer if it makes no calls, and if it only uses
+# the frame pointer to access the slots of its frame.
+def is_frameless(body: List[Assembly.Instruction]) -> bool:
+    for instruction in body:
+        if not isinstance(instruction, (Assembly.Operation, Assembly.Move)):
+            continue
+        if instruction.line.startswith("call "):
+            return False
+        if frame_pointer() in instruction.destination:
+            return False
+        for index, temp in enumerate(instruction.source):
+            if temp != frame_pointer():
+                continue
+            other_uses = re.sub(frame_slot_pattern(index), "", instruction.line)
+            if isinstance(instruction, Assembly.Move) or re.search(
+                rf"'s{index}(?!\d)", other_uses
+            ):
+                return False
+    return True
+
+
+# Rewrites the frame slot accesses of a frameless function to use rsp, given the
+# distance from rsp to the return address once the prologue is executed. The slots of
+# the locals start right below the return address, where the frame pointer would be
+# saved, and the ones of the arguments passed in the stack start right above it.
+def address_slots_from_stack_pointer(
+    body: List[Assembly.Instruction], return_address_offset: int
+):
+    def stack_pointer_offset(offset: int) -> int:
+        if offset > 0:
+            return return_address_offset + offset - word_size
+        return return_address_offset + offset
+
+    for instruction in body:
+        if not isinstance(instruction, Assembly.Operation):
+            continue
+        for index, temp in enumerate(instruction.source):
+            if temp == frame_pointer():
+                instruction.line = re.sub(
+                    frame_slot_pattern(index),
+                    lambda match: f"{stack_pointer_offset(int(match.group(1)))}"
+                    + f"(%'s{index})",
+                    instruction.line,
+                )
+                instruction.source[index] = TempMap.register_to_temp["rsp"]
+
 
-    return Assembly.Procedure(prologue, body, epilogue)
+def push_registers(registers: List[str]) -> str:
+    return "".join(f"pushq %{register}\n" for register in registers)
+
+
+def pop_registers(registers: List[str]) -> str:
+    return "".join(f"popq %{register}\n" for register in reversed(registers))
+
+
+# Placeholder for the instructions that free the frame in a tail call, since they are
+# only known once the registers of the function have been allocated.
+free_frame_placeholder = "'free_frame\n"
+
+
+# Restores the saved callee-saved registers and frees the stack frame of the current
+# function, leaving the return address at the top of the stack. Besides the epilogue,
+# this is used by tail calls before jumping to the called function, which then returns
+# directly to the caller of the current one.
+def free_frame(saved_slots: List[Tuple[str, int]]) -> str:
+    result = ""
+    for register, offset in saved_slots:
+        result += f"movq {offset}(%rbp), %{register}\n"
+    # Move rsp to where the old rbp value was stored.
+    result += "movq %rbp, %rsp\n"
+    result += "popq %rbp\n"  # Restore old rbp value.
+    return result
+
+
+# Strings start with their length and a hash of their characters, which let the
+# runtime know the length without walking the string and tell most different strings
+# apart without comparing them. The characters follow, ending with a zero byte. A hash
+# of zero means it is not computed yet, so it is never the hash of a string.
+string_length_offset = 0
+string_hash_offset = word_size
+string_characters_offset = 2 * word_size
+
+
+# FNV-1a hash of the characters, which the runtime computes in the same way.
+def string_hash(characters: bytes) -> int:
+    result = 14695981039346656037
+    for character in characters:
+        result = ((result ^ character) * 1099511628211) % 2 ** 64
+    return result or 1
+
+
+# Characters of a string literal, given as written in the program (between quotes and
+# with its escape sequences). The rest of the text is kept in UTF-8.
+def string_characters(string: str) -> bytes:
+    def escape_sequence(sequence: str) -> bytes:
+        if sequence == "n":
+            return b"\n"
+        if sequence == "t":
+            return b"\t"
+        if sequence.startswith("^"):
+            return bytes([ord(sequence[1]) & 0x1F])
+        if sequence.isdigit():
+            return bytes([int(sequence) % 256])
+        if sequence in ('"', "\\"):
+            return sequence.encode()
+        # A backslash, blank characters and another backslash are ignored, to split
+        # long strings across lines.
+        return b""
+
+    result = b""
+    position = 1
+    for match in re.finditer(r'\\(n|t|\^.|\d{3}|"|\\|\s+\\)', string[:-1]):
+        result += string[position : match.start()].encode()
+        result += escape_sequence(match.group(1))
+        position = match.end()
+    return result + string[position:-1].encode()
 
 
 def string_literal(label: TempLabel, string: str) -> str:
-    return f"{label}:\n\t.asciz {string}\n"
+    characters = string_characters(string)
+    # The hash is written as a signed number, which is how the assembler takes a quad.
+    hash_value = string_hash(characters)
+    if hash_value >= 2 ** 63:
+        hash_value -= 2 ** 64
+    text = "".join(
+        (
+            chr(character)
+            if 32 <= character < 127 and chr(character) not in '"\\'
+            else f"\\{character:03o}"
+        )
+        for character in characters
+    )
+    return (
+        f"\t.balign {word_size}\n{label}:\n"
+        + f"\t.quad {len(characters)}, {hash_value}\n"
+        + f'\t.asciz "{text}"\n'
+    )
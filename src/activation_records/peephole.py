@@ -0,0 +1,331 @@
+import copy
+import re
+from abc import ABC
+from typing import Callable, Dict, List, Optional, Set
+
+from dataclasses import dataclass
+
+import instruction_selection.assembly as Assembly
+from activation_records.frame import TempMap, temp_to_str
+from liveness_analysis.flow_graph import assembler_flow_graph
+
+# Peephole optimization over the instructions of a procedure after register allocation.
+# Each rule describes a window of consecutive instructions with a regular expression per
+# instruction, which is matched against the instruction as it would be printed. The
+# expressions of a window are matched together, so later ones can refer to the groups of
+# earlier ones. When a window matches, the rule builds the instructions that replace it,
+# or returns None if some condition that the expressions can not express does not hold.
+# New instructions refer to machine registers through their precolored temporaries, so
+# they can be printed and analyzed just like the ones built by the code generator.
+
+
+# Information about the instructions surrounding a matched window.
+class PeepholeContext:
+    def __init__(
+        self, instructions: List[Assembly.Instruction], live_out: List[Set[str]]
+    ):
+        self.instructions = instructions
+        self.live_out = live_out
+        self.end = 0
+
+    # Whether the register may be read after the last instruction of the window.
+    def is_live_after(self, register: str) -> bool:
+        return register in self.live_out[self.end - 1]
+
+    # Whether the flags may be read after the last instruction of the window, before
+    # another instruction sets them. Control does not reach a flag reader through a
+    # jump in the generated code, so only the instructions that follow are checked.
+    def flags_are_read_after(self) -> bool:
+        for instruction in self.instructions[self.end :]:
+            if isinstance(instruction, Assembly.Label):
+                continue
+            operation = instruction_text(instruction).split(" ")[0]
+            if operation in flag_readers or (
+                operation.startswith("j") and operation != "jmp"
+            ):
+                return True
+            if operation in flag_writers or operation in ("jmp", "call", "ret"):
+                return False
+        return False
+
+
+Rewrite = Callable[
+    [Dict[str, str], List[Assembly.Instruction], PeepholeContext],
+    Optional[List[Assembly.Instruction]],
+]
+
+
+@dataclass
+class PeepholeRule:
+    name: str
+    pattern: List[str]
+    rewrite: Rewrite
+
+    def __post_init__(self):
+        self.expression = re.compile("\n".join(self.pattern))
+
+
+# Number of times each rule was applied since the last reset.
+class PeepholeStatistics(ABC):
+    hits: Dict[str, int] = {}
+
+    @classmethod
+    def reset(cls):
+        cls.hits = {}
+
+    @classmethod
+    def record(cls, rule: PeepholeRule):
+        cls.hits[rule.name] = cls.hits.get(rule.name, 0) + 1
+
+
+# Operations that read the flags (conditional jumps aside) and that overwrite them.
+flag_readers = (
+    "adcq",
+    "sbbq",
+    "cmove",
+    "cmovne",
+    "cmovl",
+    "cmovg",
+    "cmovle",
+    "cmovge",
+    "cmovb",
+    "cmovbe",
+    "cmova",
+    "cmovae",
+)
+flag_writers = (
+    "cmpq",
+    "testq",
+    "addq",
+    "subq",
+    "andq",
+    "orq",
+    "xorq",
+    "xorl",
+    "imulq",
+    "idivq",
+    "negq",
+    "salq",
+    "sarq",
+    "shrq",
+)
+
+# Names of the lower 32 bits of each 64 bits register.
+double_word_registers = {
+    "rax": "eax",
+    "rbx": "ebx",
+    "rcx": "ecx",
+    "rdx": "edx",
+    "rsi": "esi",
+    "rdi": "edi",
+    "rbp": "ebp",
+    "rsp": "esp",
+    "r8": "r8d",
+    "r9": "r9d",
+    "r10": "r10d",
+    "r11": "r11d",
+    "r12": "r12d",
+    "r13": "r13d",
+    "r14": "r14d",
+    "r15": "r15d",
+}
+
+
+def register_temp(register: str) -> int:
+    return TempMap.register_to_temp[register]
+
+
+def operation(
+    line: str, source: List[str], destination: List[str]
+) -> Assembly.Instruction:
+    return Assembly.Operation(
+        line=line + "\n",
+        source=[register_temp(register) for register in source],
+        destination=[register_temp(register) for register in destination],
+        jump=None,
+    )
+
+
+def move(source: str, destination: str) -> Assembly.Instruction:
+    return Assembly.Move(
+        line="movq %'s0, %'d0\n",
+        source=[register_temp(source)],
+        destination=[register_temp(destination)],
+    )
+
+
+# movq %a, k(%b)
+# movq k(%b), %c
+# The value is still in %a, so the reload becomes a move between registers (which
+# disappears if %c is %a).
+def forward_stored_value(
+    groups: Dict[str, str],
+    matched: List[Assembly.Instruction],
+    context: PeepholeContext,
+) -> Optional[List[Assembly.Instruction]]:
+    if groups["value"] == groups["target"]:
+        return [matched[0]]
+    return [matched[0], move(groups["value"], groups["target"])]
+
+
+# movq $0, %a
+# cmpq %a, %b
+# Comparing against zero is the same as testing the register against itself, as long
+# as the zero is not used afterwards.
+def test_against_zero(
+    groups: Dict[str, str],
+    matched: List[Assembly.Instruction],
+    context: PeepholeContext,
+) -> Optional[List[Assembly.Instruction]]:
+    if groups["zero"] == groups["value"] or context.is_live_after(groups["zero"]):
+        return None
+    value = groups["value"]
+    return [operation("testq %'s0, %'s0", [value], [])]
+
+
+# movq $0, %a
+# Writing the lower half of a register clears the upper one, and xorl has a shorter
+# encoding. Unlike the move, it sets the flags.
+def clear_with_xor(
+    groups: Dict[str, str],
+    matched: List[Assembly.Instruction],
+    context: PeepholeContext,
+) -> Optional[List[Assembly.Instruction]]:
+    register = groups["register"]
+    if register not in double_word_registers or context.flags_are_read_after():
+        return None
+    half = double_word_registers[register]
+    return [
+        Assembly.Operation(
+            line=f"xorl %{half}, %{half}\n",
+            source=[],
+            destination=[register_temp(register)],
+            jump=None,
+        )
+    ]
+
+
+# jmp L
+# L:
+def fall_through(
+    groups: Dict[str, str],
+    matched: List[Assembly.Instruction],
+    context: PeepholeContext,
+) -> Optional[List[Assembly.Instruction]]:
+    return [matched[1]]
+
+
+# addq $a, %rsp
+# subq $b, %rsp
+# (or the other way around) become a single adjustment of b - a bytes.
+def merge_stack_adjustments(
+    groups: Dict[str, str],
+    matched: List[Assembly.Instruction],
+    context: PeepholeContext,
+) -> Optional[List[Assembly.Instruction]]:
+    if context.flags_are_read_after():
+        return None
+    sign = 1 if groups["first_operation"] == "sub" else -1
+    size = sign * (int(groups["first"]) - int(groups["second"]))
+    if size == 0:
+        return []
+    adjustment = "subq" if size > 0 else "addq"
+    return [operation(f"{adjustment} ${abs(size)}, %'d0", ["rsp"], ["rsp"])]
+
+
+# Rules are tried in order at each instruction, so the ones matching longer windows
+# should come before the ones matching their prefixes.
+peephole_rules = [
+    PeepholeRule(
+        "store_reload",
+        [
+            r"movq %(?P<value>\w+), (?P<slot>-?\d*\(%\w+\))",
+            r"movq (?P=slot), %(?P<target>\w+)",
+        ],
+        forward_stored_value,
+    ),
+    PeepholeRule(
+        "compare_zero",
+        [
+            r"movq \$0, %(?P<zero>\w+)",
+            r"cmpq %(?P=zero), %(?P<value>\w+)",
+        ],
+        test_against_zero,
+    ),
+    PeepholeRule("zero_register", [r"movq \$0, %(?P<register>\w+)"], clear_with_xor),
+    PeepholeRule(
+        "jump_to_next_label",
+        [r"jmp (?P<label>\w+)", r"(?P=label):"],
+        fall_through,
+    ),
+    PeepholeRule(
+        "stack_pointer_adjustments",
+        [
+            r"(?P<first_operation>add|sub)q \$(?P<first>\d+), %rsp",
+            r"(?!(?P=first_operation))(add|sub)q \$(?P<second>\d+), %rsp",
+        ],
+        merge_stack_adjustments,
+    ),
+]
+
+
+def instruction_text(instruction: Assembly.Instruction) -> str:
+    return copy.copy(instruction).format(temp_to_str).strip()
+
+
+# Registers that may be read after each instruction. Coalesced temporaries keep their
+# own names in the instructions, so liveness is computed on the registers themselves.
+def live_registers(instructions: List[Assembly.Instruction]) -> List[Set[str]]:
+    register_instructions = []
+    for instruction in instructions:
+        if isinstance(instruction, (Assembly.Operation, Assembly.Move)):
+            instruction = copy.copy(instruction)
+            instruction.source = [
+                register_temp(temp_to_str(temp)) for temp in instruction.source
+            ]
+            instruction.destination = [
+                register_temp(temp_to_str(temp)) for temp in instruction.destination
+            ]
+        register_instructions.append(instruction)
+    flow_graph = assembler_flow_graph(register_instructions).flow_graph
+    return [
+        {temp_to_str(temp) for temp in node.information.live_out}
+        for node in flow_graph.get_nodes()
+    ]
+
+
+# Applies the rules over the whole procedure until none of them matches.
+def peephole_optimize(
+    instructions: List[Assembly.Instruction],
+) -> List[Assembly.Instruction]:
+    changed = True
+    while changed and instructions:
+        changed = False
+        texts = [instruction_text(instruction) for instruction in instructions]
+        context = PeepholeContext(instructions, live_registers(instructions))
+        result = []
+        index = 0
+        while index < len(instructions):
+            replacement = None
+            for rule in peephole_rules:
+                end = index + len(rule.pattern)
+                if end > len(instructions):
+                    continue
+                match = rule.expression.fullmatch("\n".join(texts[index:end]))
+                if match is None:
+                    continue
+                context.end = end
+                replacement = rule.rewrite(
+                    match.groupdict(), instructions[index:end], context
+                )
+                if replacement is not None:
+                    PeepholeStatistics.record(rule)
+                    result.extend(replacement)
+                    index = end
+                    changed = True
+                    break
+            if replacement is None:
+                result.append(instructions[index])
+                index += 1
+        instructions = result
+    return instructions
@@ -1,4 +1,5 @@
 from abc import ABC
+from typing import Set
 
 
 Temp = int
@@ -8,12 +9,21 @@ TempLabel = str
 class TempManager(ABC):
     temp_count = 0
     label_count = 0
+    # Temporaries holding the address of a record, an array or a string, which the
+    # garbage collector must be able to find when they are live across a call.
+    pointer_temps: Set[Temp] = set()
 
     @classmethod
-    def new_temp(cls) -> Temp:
+    def new_temp(cls, pointer: bool = False) -> Temp:
         cls.temp_count += 1
+        if pointer:
+            cls.pointer_temps.add(cls.temp_count)
         return cls.temp_count
 
+    @classmethod
+    def is_pointer(cls, temp: Temp) -> bool:
+        return temp in cls.pointer_temps
+
     @classmethod
     def new_label(cls) -> TempLabel:
         cls.label_count += 1
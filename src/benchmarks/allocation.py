@@ -0,0 +1,48 @@
+from benchmarks.measurement import time_variants
+
+# Compares the running time of loops that create records and small arrays that never
+# leave the function, compiled with and without allocating them locally instead of in
+# the heap. Run it from the src directory with
+#   python3 -m benchmarks.allocation
+
+iterations = 10000000
+
+# Programs to measure, each one creating an object in every iteration of a loop.
+benchmark_programs = {
+    "record": f"""
+        let type point = {{x: int, y: int}}
+            function distance(a: int, b: int): int =
+              let var p := point{{x = a, y = b}}
+              in p.x := p.x - p.y; p.x * p.x
+              end
+            var total := 0
+        in for i := 1 to {iterations} do total := total + distance(i, 3);
+           print_num(total);
+           0
+        end
+    """,
+    "array": f"""
+        let type numbers = array of int
+            function sum(a: int): int =
+              let var n := numbers[4] of a
+              in n[1] := n[0] + 1; n[2] := n[1] + 1; n[3] := n[2] + 1;
+                 n[0] + n[1] + n[2] + n[3]
+              end
+            var total := 0
+        in for i := 1 to {iterations} do total := total + sum(i);
+           print_num(total);
+           0
+        end
+    """,
+}
+
+
+def main():
+    print(f"{'program':<16}{'heap (s)':>10}{'local (s)':>11}")
+    for program_name, source in benchmark_programs.items():
+        times = time_variants(source, [(["--no-local-allocation"], []), ([], [])])
+        print(f"{program_name:<16}{times[0]:>10.3f}{times[1]:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
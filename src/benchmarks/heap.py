@@ -0,0 +1,104 @@
+import os
+import subprocess
+from typing import Dict, Tuple
+
+from benchmarks.measurement import best_running_time, time_variants
+
+# Compares the running time of programs that allocate millions of records, arrays and
+# strings in the heap, with the runtime managing them with its garbage collector (its
+# default) and with malloc (when compiled with -DTIGER_MALLOC), which never frees them.
+# It also shows how many times the collector ran and its longest pause. Run it from the
+# src directory with
+#   python3 -m benchmarks.heap
+
+objects = 3000000
+
+# Programs to measure, each one allocating objects that leave the function creating
+# them, so they have to be in the heap. The list of records stays reachable until the
+# end, while the rest of the objects are garbage soon after they are created.
+benchmark_programs = {
+    "records": f"""
+        let type list = {{head: int, tail: list}}
+            function build(n: int): list =
+              let var result: list := nil
+              in for i := 1 to n do result := list{{head = i, tail = result}};
+                 result
+              end
+            var total := 0
+            var node := build({objects})
+        in while node <> nil do (total := total + node.head; node := node.tail);
+           print_num(total);
+           0
+        end
+    """,
+    "arrays": f"""
+        let type numbers = array of int
+            function make(n: int): numbers = numbers[4] of n
+            var total := 0
+        in for i := 1 to {objects} do
+             (let var a := make(i) in total := total + a[3] end);
+           print_num(total);
+           0
+        end
+    """,
+    "strings": f"""
+        let var total := 0
+        in for i := 1 to {objects} do
+             total := total + char_to_num(string_concat(num_to_char(i - i / 64 * 64 + 48), "!"));
+           print_num(total);
+           0
+        end
+    """,
+    "trees": f"""
+        let type tree = {{key: int, left: tree, right: tree}}
+            function build(depth: int): tree =
+              if depth = 0 then nil
+              else tree{{key = depth, left = build(depth - 1), right = build(depth - 1)}}
+            function sum(node: tree): int =
+              if node = nil then 0 else node.key + sum(node.left) + sum(node.right)
+            var kept := build(16)
+            var total := 0
+        in for i := 1 to {objects} / 1024 do total := total + sum(build(10));
+           print_num(total + sum(kept));
+           0
+        end
+    """,
+}
+
+
+# Statistics printed by the garbage collector when the program exits, which are empty
+# if the runtime uses malloc.
+def collector_statistics(binary: str) -> Dict[str, str]:
+    result = subprocess.run(
+        [binary],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        env=dict(os.environ, TIGER_GC_STATS="1"),
+        universal_newlines=True,
+        check=True,
+    )
+    lines = result.stderr.strip().split("\n") if result.stderr.strip() else []
+    return dict(line.split(": ") for line in lines)
+
+
+def measure(binary: str) -> Tuple[float, Dict[str, str]]:
+    return best_running_time(binary), collector_statistics(binary)
+
+
+def main():
+    print(
+        f"{'program':<16}{'malloc (s)':>12}{'collector (s)':>15}"
+        + f"{'collections':>13}{'max pause':>14}"
+    )
+    for program_name, source in benchmark_programs.items():
+        (malloc_time, _), (collector_time, statistics) = time_variants(
+            source, [([], ["-DTIGER_MALLOC"]), ([], [])], measure
+        )
+        print(
+            f"{program_name:<16}{malloc_time:>12.3f}{collector_time:>15.3f}"
+            + f"{statistics['collections']:>13}{statistics['max pause']:>14}"
+        )
+
+
+if __name__ == "__main__":
+    main()
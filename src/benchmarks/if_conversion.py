@@ -0,0 +1,65 @@
+from benchmarks.measurement import time_variants
+
+# Compares the running time of loops that choose between two values, compiled with and
+# without turning those ifs into conditional moves. Run it from the src directory with
+#   python3 -m benchmarks.if_conversion
+# The values come from a pseudo-random sequence, so the branches of the ifs can not be
+# predicted, except in the sorted program, where they can. The array is large enough
+# for the branch predictor not to learn the whole sequence.
+
+size = 100000
+passes = 1000
+
+# Declarations of the programs: an array filled with pseudo-random numbers between
+# -32768 and 32767, or with increasing numbers around zero.
+random_data = f"""
+    type numbers = array of int
+    var data := numbers[{size}] of 0
+    var seed := 12345
+    function min(x: int, y: int): int = if x < y then x else y
+    function max(x: int, y: int): int = if x > y then x else y
+    function abs(x: int): int = if x < 0 then 0 - x else x
+"""
+fill_random = f"""
+    for i := 0 to {size - 1} do
+      (seed := seed * 1103515245 + 12345;
+       seed := seed - seed / 2147483648 * 2147483648;
+       data[i] := seed / 32768 - 32768);
+"""
+fill_sorted = f"""
+    for i := 0 to {size - 1} do data[i] := i - {size // 2};
+"""
+
+
+def program(fill: str, loop_body: str) -> str:
+    return f"""
+        let {random_data}
+            var total := 0
+        in {fill}
+           for j := 1 to {passes} do
+             for i := 0 to {size - 1} do
+               (let var value := data[i] in {loop_body} end);
+           print_num(total);
+           0
+        end
+    """
+
+
+# Programs to measure, each one running an if that chooses a value inside a loop.
+benchmark_programs = {
+    "max": program(fill_random, "total := total + max(value, 0)"),
+    "abs": program(fill_random, "total := total + abs(value)"),
+    "clamp": program(fill_random, "total := total + min(max(value, -1000), 1000)"),
+    "sorted max": program(fill_sorted, "total := total + max(value, 0)"),
+}
+
+
+def main():
+    print(f"{'program':<16}{'branches (s)':>14}{'cmov (s)':>10}")
+    for program_name, source in benchmark_programs.items():
+        times = time_variants(source, [(["--no-if-conversion"], []), ([], [])])
+        print(f"{program_name:<16}{times[0]:>14.3f}{times[1]:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+from benchmarks.measurement import time_variants
+
+# Compares the running time of tight loops calling standard library functions, compiled
+# with and without expanding the intrinsic functions inline. Run it from the src
+# directory with
+#   python3 -m benchmarks.intrinsics
+# The time is measured on the whole program, taking the best of a few runs, since the
+# instruction counts of the other benchmarks leave out the code of the runtime.
+
+iterations = 100000000
+# Programs to measure, each one calling a function inside a loop.
+benchmark_programs = {
+    "not": f"""
+        let var count := 0
+        in for i := 1 to {iterations} do count := count + not(i - count);
+           print_num(count);
+           0
+        end
+    """,
+    "char_to_num": f"""
+        let var text := "tiger" var count := 0
+        in for i := 1 to {iterations} do count := count + char_to_num(text);
+           print_num(count);
+           0
+        end
+    """,
+    "string_length": f"""
+        let var text := "tiger" var count := 0
+        in for i := 1 to {iterations} do count := count + string_length(text);
+           print_num(count);
+           0
+        end
+    """,
+}
+
+
+def main():
+    print(f"{'function':<16}{'call (s)':>10}{'inline (s)':>12}")
+    for function_name, source in benchmark_programs.items():
+        times = time_variants(source, [(["--no-intrinsics"], []), ([], [])])
+        print(f"{function_name:<16}{times[0]:>10.3f}{times[1]:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
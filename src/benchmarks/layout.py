@@ -0,0 +1,58 @@
+import os
+
+from benchmarks.measurement import (
+    source_directory,
+    compile_program,
+    remove_program,
+    backward_jump_targets,
+    run_counting_instructions,
+)
+
+# Compares the code generated with and without loop rotation, reporting how many jumps
+# are taken per loop iteration and the number of instructions executed. Run it from the
+# src directory with
+#   python3 -m benchmarks.layout
+# The iterations are counted as the times the tests of the loops run, which is how many
+# times the code compiled without rotation jumps back to the top of a loop.
+
+# Examples to measure, with the input they read from the console.
+benchmark_programs = {
+    "queens.tig": "",
+    "merge.tig": "1 3 5 6 7 10; 0 2 4 8 9;",
+    "test12.tig": "",
+    "test64.tig": "",
+}
+
+
+def main():
+    print(
+        f"{'program':<12}{'iterations':>11}{'taken branches':>18}"
+        + f"{'per iteration':>18}{'instructions':>22}"
+    )
+    for program_name, console_input in benchmark_programs.items():
+        source_file = os.path.join(source_directory, "examples", program_name)
+        runs = []
+        for arguments in (["--no-loop-rotation"], []):
+            program = compile_program(source_file, arguments)
+            # The tops of the loops are only counted without rotation.
+            loop_tops = backward_jump_targets(program.binary) if arguments else set()
+            runs.append(run_counting_instructions(program, console_input, loop_tops))
+            remove_program(program)
+
+        before, after = runs
+        if before.return_code != after.return_code:
+            raise Exception(f"{program_name} returned a different code when rotated")
+        iterations = sum(before.marked_counts.values())
+        per_iteration = [
+            run.taken_branches / iterations if iterations else 0 for run in runs
+        ]
+        print(
+            f"{program_name:<12}{iterations:>11}"
+            + f"{before.taken_branches:>9}{after.taken_branches:>9}"
+            + f"{per_iteration[0]:>9.2f}{per_iteration[1]:>9.2f}"
+            + f"{before.instruction_count:>11}{after.instruction_count:>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
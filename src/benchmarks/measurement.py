@@ -0,0 +1,360 @@
+import ctypes
+import os
+import re
+import subprocess
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple, TypeVar
+
+from dataclasses import dataclass, field
+
+# Helpers to compile Tiger programs and measure the code generated for them.
+# The dynamic instruction count is obtained by single-stepping the program with ptrace,
+# which only works on x86-64 Linux. Only the instructions generated by the compiler are
+# counted: calls to the runtime run at full speed until they return.
+# Besides the total, the instructions at some given addresses (like the ones labeled by
+# the compiler with --mark-spills) can be counted separately, and so can the jumps that
+# were taken instead of falling through to the next instruction.
+
+T = TypeVar("T")
+
+source_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ptrace_traceme = 0
+ptrace_peekdata = 2
+ptrace_pokedata = 5
+ptrace_cont = 7
+ptrace_kill = 8
+ptrace_singlestep = 9
+ptrace_getregs = 12
+ptrace_setregs = 13
+
+breakpoint_instruction = 0xCC
+
+libc = ctypes.CDLL(None, use_errno=True)
+libc.ptrace.argtypes = [ctypes.c_long, ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p]
+libc.ptrace.restype = ctypes.c_long
+
+
+# Layout of struct user_regs_struct from <sys/user.h>.
+class UserRegisters(ctypes.Structure):
+    _fields_ = [
+        (register, ctypes.c_ulonglong)
+        for register in [
+            "r15",
+            "r14",
+            "r13",
+            "r12",
+            "rbp",
+            "rbx",
+            "r11",
+            "r10",
+            "r9",
+            "r8",
+            "rax",
+            "rcx",
+            "rdx",
+            "rsi",
+            "rdi",
+            "orig_rax",
+            "rip",
+            "cs",
+            "eflags",
+            "rsp",
+            "ss",
+            "fs_base",
+            "gs_base",
+            "ds",
+            "es",
+            "fs",
+            "gs",
+        ]
+    ]
+
+
+@dataclass
+class CompiledProgram:
+    directory: str
+    binary: str
+    # Output of the compiler.
+    output: str
+
+
+@dataclass
+class ExecutionResult:
+    return_code: int
+    instruction_count: int
+    # How many times the instruction at each of the marked addresses was executed.
+    marked_counts: Dict[int, int] = field(default_factory=dict)
+    taken_branches: int = 0
+
+
+# Compiles the Tiger program into a temporary directory, passing the given arguments to
+# the compiler, and the runtime arguments to gcc when compiling the runtime. Raises an
+# exception if the compilation fails.
+def compile_program(
+    source_file: str, arguments: List[str] = (), runtime_arguments: List[str] = ()
+) -> CompiledProgram:
+    directory = tempfile.mkdtemp()
+    outputs = []
+    commands = [
+        ["python3", os.path.join(source_directory, "main.py")]
+        + [os.path.abspath(source_file)]
+        + list(arguments),
+        ["gcc"]
+        + list(runtime_arguments)
+        + [
+            "-c",
+            os.path.join(source_directory, "putting_it_all_together", "runtime.c"),
+        ],
+        ["gcc", "-no-pie", "output.s", "runtime.o"],
+    ]
+    for command in commands:
+        result = subprocess.run(
+            command,
+            cwd=directory,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        if result.returncode != 0 or "error" in result.stdout:
+            raise Exception(
+                f"Failed to compile {source_file}: {result.stdout}{result.stderr}"
+            )
+        outputs.append(result.stdout)
+    return CompiledProgram(directory, os.path.join(directory, "a.out"), outputs[0])
+
+
+def remove_program(program: CompiledProgram):
+    subprocess.run(["rm", "-r", program.directory])
+
+
+# Best wall-clock time of a few runs of the binary, for measuring the whole program
+# including the code of the runtime.
+def best_running_time(binary: str, runs: int = 3) -> float:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([binary], stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+# Compiles the Tiger source once for each variant, given as the arguments to the
+# compiler and the ones to gcc when compiling the runtime, and returns the result of
+# measuring each program (by default, its best running time).
+def time_variants(
+    source: str,
+    variants: List[Tuple[List[str], List[str]]],
+    measure: Callable[[str], T] = best_running_time,
+) -> List[T]:
+    source_file = tempfile.NamedTemporaryFile("w", suffix=".tig", delete=False)
+    source_file.write(source)
+    source_file.close()
+    results = []
+    for arguments, runtime_arguments in variants:
+        program = compile_program(source_file.name, arguments, runtime_arguments)
+        results.append(measure(program.binary))
+        remove_program(program)
+    os.remove(source_file.name)
+    return results
+
+
+# Addresses and names of the code symbols of the binary, sorted by address.
+def code_symbols(binary: str) -> List[Tuple[int, str]]:
+    symbols = subprocess.run(
+        ["nm", "-n", binary], stdout=subprocess.PIPE, universal_newlines=True
+    ).stdout.split("\n")
+    result = []
+    for symbol in symbols:
+        fields = symbol.split()
+        if len(fields) == 3 and fields[1] in "tT":
+            result.append((int(fields[0], 16), fields[2]))
+    return result
+
+
+# Addresses of the code symbols whose names match the regular expression.
+def symbol_addresses(binary: str, pattern: str) -> Set[int]:
+    return {
+        address for address, name in code_symbols(binary) if re.fullmatch(pattern, name)
+    }
+
+
+# Address range of the code generated by the compiler, which is linked before the
+# runtime. Every symbol in it is either tigermain or a label made by TempManager,
+# maybe with a prefix added by the compiler (like spill_load_).
+def generated_code_range(binary: str) -> Tuple[int, int]:
+    start = end = None
+    for address, name in code_symbols(binary):
+        is_generated = name == "tigermain" or re.fullmatch(r"(\w+_)?lab_\d+", name)
+        if is_generated and start is None:
+            start = address
+        elif not is_generated and start is not None:
+            end = address
+            break
+    return start, end
+
+
+# Jump instructions of the generated code, disassembled with objdump, as a dictionary
+# mapping the address of each jump to the address of the next instruction and the
+# address it jumps to (None if it is not a direct jump).
+def generated_jumps(binary: str) -> Dict[int, Tuple[int, Optional[int]]]:
+    start, end = generated_code_range(binary)
+    disassembly = subprocess.run(
+        [
+            "objdump",
+            "-d",
+            "--no-show-raw-insn",
+            f"--start-address={start}",
+            f"--stop-address={end}",
+            binary,
+        ],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+    instructions = []
+    for line in disassembly.split("\n"):
+        instruction = re.match(r"\s+([0-9a-f]+):\s+(\S+)\s*(\S*)", line)
+        if instruction is not None:
+            instructions.append(instruction.groups())
+    jumps = {}
+    for index, (address, mnemonic, operand) in enumerate(instructions):
+        if not mnemonic.startswith("j"):
+            continue
+        next_address = (
+            int(instructions[index + 1][0], 16)
+            if index + 1 < len(instructions)
+            else end
+        )
+        target = int(operand, 16) if re.fullmatch(r"[0-9a-f]+", operand) else None
+        jumps[int(address, 16)] = (next_address, target)
+    return jumps
+
+
+# Addresses that some jump of the generated code goes back to, which are the tops of
+# the loops of the program.
+def backward_jump_targets(binary: str) -> Set[int]:
+    return {
+        target
+        for address, (_, target) in generated_jumps(binary).items()
+        if target is not None and target <= address
+    }
+
+
+def code_size(program: CompiledProgram) -> int:
+    start, end = generated_code_range(program.binary)
+    return end - start
+
+
+def ptrace(request: int, pid: int, address: int = 0, data: int = 0) -> int:
+    ctypes.set_errno(0)
+    result = libc.ptrace(request, pid, ctypes.c_void_p(address), ctypes.c_void_p(data))
+    if result == -1 and ctypes.get_errno() != 0:
+        raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+    return result
+
+
+class TracedProcess:
+    def __init__(self, binary: str, console_input: str):
+        input_file = tempfile.TemporaryFile()
+        input_file.write(console_input.encode())
+        input_file.seek(0)
+        self.process = subprocess.Popen(
+            [binary],
+            stdin=input_file,
+            stdout=subprocess.DEVNULL,
+            preexec_fn=lambda: ptrace(ptrace_traceme, 0),
+        )
+        self.pid = self.process.pid
+        self.return_code = None
+        # The process stops when it executes the binary.
+        self.wait()
+
+    # Waits until the process stops, returning whether it is still alive.
+    def wait(self) -> bool:
+        _, status = os.waitpid(self.pid, 0)
+        if os.WIFEXITED(status):
+            self.return_code = os.WEXITSTATUS(status)
+            return False
+        if os.WIFSIGNALED(status):
+            self.return_code = -os.WTERMSIG(status)
+            return False
+        return True
+
+    def registers(self) -> UserRegisters:
+        registers = UserRegisters()
+        ptrace(ptrace_getregs, self.pid, 0, ctypes.addressof(registers))
+        return registers
+
+    def set_registers(self, registers: UserRegisters):
+        ptrace(ptrace_setregs, self.pid, 0, ctypes.addressof(registers))
+
+    def read_word(self, address: int) -> int:
+        return ptrace(ptrace_peekdata, self.pid, address) & 0xFFFFFFFFFFFFFFFF
+
+    def write_word(self, address: int, word: int):
+        ptrace(ptrace_pokedata, self.pid, address, word)
+
+    def step(self) -> bool:
+        ptrace(ptrace_singlestep, self.pid)
+        return self.wait()
+
+    # Lets the process run until it reaches the address, returning whether it is still
+    # alive.
+    def run_until(self, address: int) -> bool:
+        word = self.read_word(address)
+        self.write_word(address, (word & ~0xFF) | breakpoint_instruction)
+        ptrace(ptrace_cont, self.pid)
+        alive = self.wait()
+        if alive:
+            self.write_word(address, word)
+            registers = self.registers()
+            registers.rip -= 1
+            self.set_registers(registers)
+        return alive
+
+    def finish(self) -> int:
+        if self.return_code is None:
+            ptrace(ptrace_cont, self.pid)
+            while self.wait():
+                ptrace(ptrace_cont, self.pid)
+        return self.return_code
+
+
+# Runs the program counting the instructions executed inside the generated code, and
+# separately the ones executed at the marked addresses and the jumps taken.
+def run_counting_instructions(
+    program: CompiledProgram,
+    console_input: str = "",
+    marked_addresses: Set[int] = frozenset(),
+) -> ExecutionResult:
+    start, end = generated_code_range(program.binary)
+    jumps = generated_jumps(program.binary)
+    (entry,) = symbol_addresses(program.binary, "tigermain")
+    process = TracedProcess(program.binary, console_input)
+    count = 0
+    taken_branches = 0
+    marked_counts = {address: 0 for address in marked_addresses}
+    if process.run_until(entry):
+        exit_address = process.read_word(process.registers().rsp)
+        address = entry
+        alive = True
+        while alive:
+            count += 1
+            if address in marked_counts:
+                marked_counts[address] += 1
+            alive = process.step()
+            if not alive:
+                break
+            registers = process.registers()
+            if address in jumps and registers.rip != jumps[address][0]:
+                taken_branches += 1
+            address = registers.rip
+            if start <= address < end:
+                continue
+            if address == exit_address:
+                break
+            # A call to the runtime, which returns to the address on top of the stack.
+            address = process.read_word(registers.rsp)
+            alive = process.run_until(address)
+    return ExecutionResult(process.finish(), count, marked_counts, taken_branches)
@@ -0,0 +1,69 @@
+import os
+from typing import Dict
+
+from benchmarks.measurement import (
+    source_directory,
+    compile_program,
+    remove_program,
+    code_size,
+    run_counting_instructions,
+)
+
+# Compares the code generated with and without the peephole optimization, reporting the
+# size of the generated code, the number of instructions executed in it and how many
+# times each rule was applied. Run it from the src directory with
+#   python3 -m benchmarks.peephole
+
+# Examples to measure, with the input they read from the console.
+benchmark_programs = {
+    "queens.tig": "",
+    "merge.tig": "1 3 5 6 7 10; 0 2 4 8 9;",
+    "test8.tig": "",
+    "test64.tig": "",
+    "test88.tig": "",
+    "test94.tig": "",
+}
+
+
+def rule_hits(compiler_output: str) -> Dict[str, int]:
+    hits = {}
+    for line in compiler_output.strip().split("\n"):
+        rule, count = line.split(": ")
+        hits[rule] = int(count)
+    return hits
+
+
+def main():
+    total_hits = {}
+    print(f"{'program':<12}{'size':>14}{'instructions':>22}")
+    for program_name, console_input in benchmark_programs.items():
+        source_file = os.path.join(source_directory, "examples", program_name)
+        measurements = []
+        for arguments in (["--no-peephole"], ["--peephole-statistics"]):
+            program = compile_program(source_file, arguments)
+            measurements.append(
+                (
+                    code_size(program),
+                    run_counting_instructions(program, console_input),
+                )
+            )
+            if "--peephole-statistics" in arguments:
+                for rule, count in rule_hits(program.output).items():
+                    total_hits[rule] = total_hits.get(rule, 0) + count
+            remove_program(program)
+
+        (size_before, run_before), (size_after, run_after) = measurements
+        if run_before.return_code != run_after.return_code:
+            raise Exception(f"{program_name} returned a different code when optimized")
+        print(
+            f"{program_name:<12}{size_before:>7}{size_after:>7}"
+            + f"{run_before.instruction_count:>11}{run_after.instruction_count:>11}"
+        )
+
+    print()
+    for rule, count in total_hits.items():
+        print(f"{rule}: {count}")
+
+
+if __name__ == "__main__":
+    main()
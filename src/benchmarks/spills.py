@@ -0,0 +1,48 @@
+import os
+
+from benchmarks.measurement import (
+    source_directory,
+    compile_program,
+    remove_program,
+    symbol_addresses,
+    run_counting_instructions,
+)
+
+# Counts the loads and stores that the register allocator adds for spilled temporaries,
+# both in the generated code and executed at run time, along with the total number of
+# instructions executed. Run it from the src directory with
+#   python3 -m benchmarks.spills
+
+# Examples to measure, with the input they read from the console.
+benchmark_programs = {
+    "queens.tig": "",
+    "merge.tig": "1 3 5 6 7 10; 0 2 4 8 9;",
+    "test42.tig": "",
+    "test56.tig": "",
+}
+
+
+def main():
+    print(
+        f"{'program':<12}{'loads':>7}{'stores':>7}"
+        + f"{'executed loads':>16}{'executed stores':>17}{'instructions':>14}"
+    )
+    for program_name, console_input in benchmark_programs.items():
+        source_file = os.path.join(source_directory, "examples", program_name)
+        program = compile_program(source_file, ["--mark-spills"])
+        loads = symbol_addresses(program.binary, r"spill_load_lab_\d+")
+        stores = symbol_addresses(program.binary, r"spill_store_lab_\d+")
+        result = run_counting_instructions(program, console_input, loads | stores)
+        remove_program(program)
+
+        executed_loads = sum(result.marked_counts[address] for address in loads)
+        executed_stores = sum(result.marked_counts[address] for address in stores)
+        print(
+            f"{program_name:<12}{len(loads):>7}{len(stores):>7}"
+            + f"{executed_loads:>16}{executed_stores:>17}"
+            + f"{result.instruction_count:>14}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,45 @@
 from typing import List
 
+from activation_records.temp import TempLabel, TempManager
 from canonical.basic_block import basic_block
+from canonical.cleanup import clean_up_control_flow
+from canonical.if_conversion import convert_ifs
 from canonical.linearize import linearize
+from canonical.pointers import mark_pointer_temporaries
+from canonical.profile import (
+    Profile,
+    block_keys,
+    instrument_blocks,
+    record_block_counts,
+)
 from canonical.trace import trace_schedule
-from intermediate_representation.tree import Statement
+from canonical.value_numbering import local_value_numbering
+from intermediate_representation.tree import Statement, Label
 
 
-def canonize(statement: Statement) -> List[Statement]:
-    return trace_schedule(basic_block(linearize(statement)))
+def canonize(
+    statement: Statement,
+    function: TempLabel = None,
+    rotate_loops: bool = True,
+    if_conversion: bool = True,
+) -> List[Statement]:
+    first_new_label = TempManager.label_count
+    statements = linearize(statement)
+    # The first block of a function only runs once per call, so its count is the number
+    # of calls to the function.
+    if statements and isinstance(statements[0], Label):
+        statements = [Label(TempManager.new_label())] + statements
+    block = local_value_numbering(basic_block(statements))
+
+    if function is not None:
+        keys = block_keys(function, block, first_new_label)
+        if Profile.instrument:
+            instrument_blocks(block, keys)
+        record_block_counts(block, keys)
+    statements = trace_schedule(block, Profile.block_counts, rotate_loops)
+    statements = clean_up_control_flow(statements)
+    # Converting the ifs leaves fewer blocks and jumps, which may be cleaned up again.
+    if if_conversion:
+        statements = clean_up_control_flow(convert_ifs(statements))
+    mark_pointer_temporaries(statements)
+    return statements
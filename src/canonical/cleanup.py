@@ -0,0 +1,277 @@
+from abc import ABC
+from typing import Dict, List, Optional
+
+from activation_records.temp import TempLabel
+from intermediate_representation.tree import (
+    Statement,
+    Label,
+    Jump,
+    ConditionalJump,
+    Name,
+)
+
+# Cleanup of the control flow of a procedure after trace scheduling.
+# Building the basic blocks and fixing the conditional jumps adds labels and jumps that
+# are not always needed, like blocks that only jump somewhere else or jumps from one
+# block to a block that only it reaches. The statements are split again in blocks
+# (each one starting at a label) and the following rules are applied until none of them
+# changes anything:
+# - Jumps to a block that only jumps somewhere else go there directly, and references
+#   to a block with nothing but its label go to the next block.
+# - Blocks that can not be reached from the first one are removed, along with blocks
+#   with nothing but their label.
+# - Jumps to the next block are removed.
+# - A block only reached by falling through from the previous one is merged into it,
+#   and a block only reached by a jump is moved after the jump (which is removed) if it
+#   does not fall through to the next block itself.
+# Every conditional jump is still followed by its false label afterwards. The first
+# block, where the procedure starts, and the last one, where it ends, are kept.
+
+
+# Number of blocks and jumps removed since the last reset.
+class ControlFlowStatistics(ABC):
+    removed_blocks = 0
+    removed_jumps = 0
+
+    @classmethod
+    def reset(cls):
+        cls.removed_blocks = 0
+        cls.removed_jumps = 0
+
+
+Block = List[Statement]
+
+
+def block_label(block: Block) -> TempLabel:
+    return block[0].label
+
+
+# The label a jump goes to, if it is a jump to a single known label.
+def jump_target(statement: Statement) -> Optional[TempLabel]:
+    if (
+        isinstance(statement, Jump)
+        and isinstance(statement.expression, Name)
+        and len(statement.labels) == 1
+    ):
+        return statement.labels[0]
+    return None
+
+
+def is_jump(statement: Statement) -> bool:
+    return isinstance(statement, (Jump, ConditionalJump))
+
+
+def referenced_labels(statement: Statement) -> List[TempLabel]:
+    if isinstance(statement, Jump):
+        return statement.labels
+    if isinstance(statement, ConditionalJump):
+        return [statement.true, statement.false]
+    return []
+
+
+def reference_counts(blocks: List[Block]) -> Dict[TempLabel, int]:
+    counts = {}
+    for block in blocks:
+        for label in referenced_labels(block[-1]):
+            counts[label] = counts.get(label, 0) + 1
+    return counts
+
+
+def split_blocks(statements: List[Statement]) -> List[Block]:
+    blocks = []
+    for statement in statements:
+        if isinstance(statement, Label) or not blocks:
+            blocks.append([])
+        blocks[-1].append(statement)
+    return blocks
+
+
+def clean_up_control_flow(statements: List[Statement]) -> List[Statement]:
+    if not statements or not isinstance(statements[0], Label):
+        return statements
+    blocks = split_blocks(statements)
+    changed = True
+    while changed:
+        changed = False
+        for rule in (
+            thread_jumps,
+            remove_empty_blocks,
+            remove_unreachable_blocks,
+            remove_jumps_to_next_block,
+            merge_fall_through_blocks,
+            merge_jump_targets,
+        ):
+            changed = rule(blocks) or changed
+    return [statement for block in blocks for statement in block]
+
+
+# Makes every jump skip the blocks that only jump somewhere else. The false label of a
+# conditional jump is left as it is, since it must be the next block.
+def thread_jumps(blocks: List[Block]) -> bool:
+    forwarding = {}
+    for block in blocks[:-1]:
+        if len(block) == 2 and jump_target(block[1]) is not None:
+            forwarding[block_label(block)] = jump_target(block[1])
+
+    # Jumps into a loop of blocks that only jump to each other are left as they are.
+    def destination(label: TempLabel) -> TempLabel:
+        visited = {label}
+        current_label = label
+        while current_label in forwarding:
+            current_label = forwarding[current_label]
+            if current_label in visited:
+                return label
+            visited.add(current_label)
+        return current_label
+
+    changed = False
+    for block in blocks:
+        last_statement = block[-1]
+        target = jump_target(last_statement)
+        if target is not None and destination(target) != target:
+            block[-1] = Jump(Name(destination(target)), [destination(target)])
+            changed = True
+        elif isinstance(last_statement, ConditionalJump):
+            if destination(last_statement.true) != last_statement.true:
+                block[-1] = ConditionalJump(
+                    last_statement.operator,
+                    last_statement.left,
+                    last_statement.right,
+                    destination(last_statement.true),
+                    last_statement.false,
+                )
+                changed = True
+    return changed
+
+
+# Removes the blocks with nothing but their label, which just fall through to the next
+# one, so the jumps to them go to the next block instead.
+def remove_empty_blocks(blocks: List[Block]) -> bool:
+    changed = False
+    index = 1
+    while index < len(blocks) - 1:
+        if len(blocks[index]) > 1:
+            index += 1
+            continue
+        label = block_label(blocks.pop(index))
+        next_label = block_label(blocks[index])
+        for block in blocks:
+            rename_label(block, label, next_label)
+        ControlFlowStatistics.removed_blocks += 1
+        changed = True
+    return changed
+
+
+def rename_label(block: Block, label: TempLabel, new_label: TempLabel):
+    last_statement = block[-1]
+    if isinstance(last_statement, Jump) and label in last_statement.labels:
+        labels = [new_label if old == label else old for old in last_statement.labels]
+        expression = last_statement.expression
+        if jump_target(last_statement) is not None:
+            expression = Name(new_label)
+        block[-1] = Jump(expression, labels)
+    elif isinstance(last_statement, ConditionalJump) and label in (
+        last_statement.true,
+        last_statement.false,
+    ):
+        block[-1] = ConditionalJump(
+            last_statement.operator,
+            last_statement.left,
+            last_statement.right,
+            new_label if last_statement.true == label else last_statement.true,
+            new_label if last_statement.false == label else last_statement.false,
+        )
+
+
+def remove_unreachable_blocks(blocks: List[Block]) -> bool:
+    indexes = {block_label(block): index for index, block in enumerate(blocks)}
+    reachable = {0}
+    worklist = [0]
+    while worklist:
+        index = worklist.pop()
+        successors = [
+            indexes[label]
+            for label in referenced_labels(blocks[index][-1])
+            if label in indexes
+        ]
+        if not is_jump(blocks[index][-1]) and index + 1 < len(blocks):
+            successors.append(index + 1)
+        for successor in successors:
+            if successor not in reachable:
+                reachable.add(successor)
+                worklist.append(successor)
+
+    last_index = len(blocks) - 1
+    removed = [
+        index
+        for index in range(len(blocks))
+        if index not in reachable and index != last_index
+    ]
+    for index in reversed(removed):
+        block = blocks.pop(index)
+        ControlFlowStatistics.removed_blocks += 1
+        ControlFlowStatistics.removed_jumps += sum(map(is_jump, block))
+    return bool(removed)
+
+
+# Merges the blocks only reached by falling through from the previous one into it.
+def merge_fall_through_blocks(blocks: List[Block]) -> bool:
+    references = reference_counts(blocks)
+    changed = False
+    index = 1
+    while index < len(blocks) - 1:
+        label = block_label(blocks[index])
+        if is_jump(blocks[index - 1][-1]) or references.get(label, 0) > 0:
+            index += 1
+            continue
+        blocks[index - 1].extend(blocks.pop(index)[1:])
+        ControlFlowStatistics.removed_blocks += 1
+        changed = True
+    return changed
+
+
+# Moves each block only reached by a jump right after it, replacing the jump, as long
+# as the block ends with a jump itself (so it does not need to stay before the next
+# block). Since nothing falls through to it, the block before it also ends with a jump.
+def merge_jump_targets(blocks: List[Block]) -> bool:
+    references = reference_counts(blocks)
+    changed = False
+    index = 0
+    while index < len(blocks):
+        target = jump_target(blocks[index][-1])
+        target_index = next(
+            (
+                block_index
+                for block_index, block in enumerate(blocks)
+                if block_label(block) == target
+            ),
+            None,
+        )
+        if (
+            target_index is None
+            or target_index in (0, len(blocks) - 1, index, index + 1)
+            or references[target] > 1
+            or not is_jump(blocks[target_index - 1][-1])
+            or jump_target(blocks[target_index][-1]) is None
+        ):
+            index += 1
+            continue
+        target_block = blocks.pop(target_index)
+        if target_index < index:
+            index -= 1
+        blocks[index].pop()
+        blocks[index].extend(target_block[1:])
+        ControlFlowStatistics.removed_blocks += 1
+        ControlFlowStatistics.removed_jumps += 1
+        changed = True
+    return changed
+
+
+def remove_jumps_to_next_block(blocks: List[Block]) -> bool:
+    changed = False
+    for block, next_block in zip(blocks, blocks[1:]):
+        if jump_target(block[-1]) == block_label(next_block):
+            block.pop()
+            ControlFlowStatistics.removed_jumps += 1
+            changed = True
+    return changed
@@ -0,0 +1,178 @@
+from typing import List, Optional
+
+from activation_records.frame import frame_pointer
+from canonical.cleanup import (
+    Block,
+    block_label,
+    is_jump,
+    jump_target,
+    reference_counts,
+    split_blocks,
+)
+from intermediate_representation.tree import (
+    Statement,
+    Expression,
+    Label,
+    ConditionalJump,
+    ConditionalMove,
+    Move,
+    Memory,
+    Temporary,
+    Name,
+    Constant,
+    BinaryOperation,
+    BinaryOperator,
+)
+
+# If conversion of the canonical statements of a procedure.
+# An if expression whose branches only compute its value ends up as
+#   ConditionalJump(operator, a, b, T, F)
+#   F: Move(r, false_value)
+#      (a jump to J, or falling through to it)
+#   ...
+#   T: Move(r, true_value)
+#      (a jump to J, or falling through to it)
+# When both values are cheap and can be computed even if their branch would not run
+# (they can not fail and have no side effects), the branches become
+#   Move(r, false_value)
+#   ConditionalMove(operator, a, b, r, true_value)
+# which the code generator turns into a comparison and a cmov, so there is no branch
+# that depends on the data to mispredict.
+
+# Operations that can not fail, so they can be computed in advance.
+safe_operators = (
+    BinaryOperator.plus,
+    BinaryOperator.minus,
+    BinaryOperator.mul,
+    BinaryOperator.andOp,
+    BinaryOperator.orOp,
+    BinaryOperator.xor,
+)
+
+
+def convert_ifs(statements: List[Statement]) -> List[Statement]:
+    if not statements or not isinstance(statements[0], Label):
+        return statements
+    blocks = split_blocks(statements)
+    index = 0
+    while index < len(blocks):
+        if not convert_if(blocks, index):
+            index += 1
+    return [statement for block in blocks for statement in block]
+
+
+# Replaces the branches of the conditional jump that ends the block at the index with a
+# conditional move, returning whether it could.
+def convert_if(blocks: List[Block], index: int) -> bool:
+    jump = blocks[index][-1]
+    if not isinstance(jump, ConditionalJump) or index + 1 >= len(blocks):
+        return False
+    references = reference_counts(blocks)
+    if references[jump.true] != 1 or references[jump.false] != 1:
+        return False
+    true_index = next(
+        (
+            block_index
+            for block_index, block in enumerate(blocks)
+            if block_label(block) == jump.true
+        ),
+        None,
+    )
+    # The true block must only be reached by the jump, and not by falling through.
+    if true_index is None or true_index in (0, index) or true_index == len(blocks) - 1:
+        return False
+    if not is_jump(blocks[true_index - 1][-1]):
+        return False
+
+    false_value = branch_value(blocks, index + 1)
+    true_value = branch_value(blocks, true_index)
+    if false_value is None or true_value is None:
+        return False
+    result, false_expression, false_end = false_value
+    true_result, true_expression, true_end = true_value
+    if result != true_result or false_end != true_end:
+        return False
+    if any(
+        reads_temporary(expression, result.temporary)
+        for expression in (jump.left, jump.right, true_expression)
+    ):
+        return False
+
+    false_block = blocks[index + 1]
+    blocks[index] = (
+        blocks[index][:-1]
+        + [
+            Move(result, false_expression),
+            ConditionalMove(
+                jump.operator, jump.left, jump.right, result, true_expression
+            ),
+        ]
+        + false_block[2:]
+    )
+    blocks.pop(true_index)
+    blocks.pop(index + 1)
+    return True
+
+
+# If the block only moves a cheap value to a temporary before going to some label,
+# returns the temporary, the value and that label.
+def branch_value(blocks: List[Block], index: int):
+    block = blocks[index]
+    if len(block) == 3 and jump_target(block[2]) is not None:
+        end = jump_target(block[2])
+    elif len(block) == 2 and index + 1 < len(blocks):
+        end = block_label(blocks[index + 1])
+    else:
+        return None
+    move = block[1]
+    if not (
+        isinstance(move, Move)
+        and isinstance(move.temporary, Temporary)
+        and is_cheap(move.expression)
+    ):
+        return None
+    return move.temporary, move.expression, end
+
+
+# A value is cheap if it is a temporary, a constant, a label or a slot of the frame, or
+# a single operation that can not fail over them.
+def is_cheap(expression: Expression) -> bool:
+    if isinstance(expression, BinaryOperation):
+        return (
+            expression.operator in safe_operators
+            and is_leaf(expression.left)
+            and is_leaf(expression.right)
+        )
+    return is_leaf(expression)
+
+
+def is_leaf(expression: Expression) -> bool:
+    if isinstance(expression, (Temporary, Constant, Name)):
+        return True
+    return frame_slot_offset(expression) is not None
+
+
+def frame_slot_offset(expression: Expression) -> Optional[int]:
+    if not isinstance(expression, Memory):
+        return None
+    address = expression.expression
+    if (
+        isinstance(address, BinaryOperation)
+        and address.operator == BinaryOperator.plus
+        and address.left == Temporary(frame_pointer())
+        and isinstance(address.right, Constant)
+    ):
+        return address.right.value
+    return None
+
+
+def reads_temporary(expression: Expression, temporary: int) -> bool:
+    if isinstance(expression, Temporary):
+        return expression.temporary == temporary
+    if isinstance(expression, BinaryOperation):
+        return reads_temporary(expression.left, temporary) or reads_temporary(
+            expression.right, temporary
+        )
+    if isinstance(expression, Memory):
+        return reads_temporary(expression.expression, temporary)
+    return False
@@ -16,6 +16,9 @@ from intermediate_representation.tree import (
     ConditionalJump,
     Move,
     Temporary,
+    TailCall,
+    holds_pointer,
+    derives_pointer,
 )
 
 
@@ -54,7 +57,7 @@ def do_expression(expression: Expression) -> Tuple[Statement, Expression]:
 
     if isinstance(expression, Memory):
         statement, new_expressions = reorder([expression.expression])
-        return statement, Memory(new_expressions[0])
+        return statement, Memory(new_expressions[0], expression.pointer)
 
     if isinstance(expression, EvaluateSequence):
         substatement, subexpression = do_expression(expression.expression)
@@ -67,7 +70,9 @@ def do_expression(expression: Expression) -> Tuple[Statement, Expression]:
         statement, new_expressions = reorder(
             [expression.function] + expression.arguments
         )
-        return statement, Call(new_expressions[0], new_expressions[1:])
+        return statement, Call(
+            new_expressions[0], new_expressions[1:], expression.pointer
+        )
 
     return noop_statement(), expression
 
@@ -112,7 +117,12 @@ def do_statement(statement: Statement) -> Statement:
             return simplified_sequence(
                 new_statement,
                 Move(
-                    statement.temporary, Call(new_expressions[0], new_expressions[1:])
+                    statement.temporary,
+                    Call(
+                        new_expressions[0],
+                        new_expressions[1:],
+                        statement.expression.pointer,
+                    ),
                 ),
             )
         if isinstance(statement.temporary, Temporary):
@@ -147,7 +157,13 @@ def do_statement(statement: Statement) -> Statement:
             statement.expression.arguments = new_expressions[1:]
             return simplified_sequence(
                 new_statement,
-                StatementExpression(Call(new_expressions[0], new_expressions[1:])),
+                StatementExpression(
+                    Call(
+                        new_expressions[0],
+                        new_expressions[1:],
+                        statement.expression.pointer,
+                    )
+                ),
             )
         else:
             new_statement, new_expressions = reorder([statement.expression])
@@ -155,6 +171,14 @@ def do_statement(statement: Statement) -> Statement:
                 new_statement, StatementExpression(new_expressions[0])
             )
 
+    if isinstance(statement, TailCall):
+        new_statement, new_expressions = reorder(
+            [statement.function] + statement.arguments
+        )
+        return simplified_sequence(
+            new_statement, TailCall(new_expressions[0], new_expressions[1:])
+        )
+
     return statement
 
 
@@ -163,12 +187,26 @@ def reorder(expression_list: List[Expression]) -> Tuple[Statement, List[Expressi
         return noop_statement(), []
 
     if isinstance(expression_list[0], Call):
-        temporary = TempManager.new_temp()
+        temporary = TempManager.new_temp(expression_list[0].pointer)
         expression_list[0] = EvaluateSequence(
             Move(Temporary(temporary), expression_list[0]), Temporary(temporary)
         )
         return reorder(expression_list)
 
+    # An address inside an object can not be kept in a temporary while the rest of the
+    # expressions are evaluated, since they may call the garbage collector and move the
+    # object. The values it is computed from are kept instead, and it is computed later.
+    if derives_pointer(expression_list[0]):
+        address = expression_list[0]
+        statement, new_expressions = reorder(
+            [address.left, address.right] + expression_list[1:]
+        )
+        return (
+            statement,
+            [BinaryOperation(address.operator, new_expressions[0], new_expressions[1])]
+            + new_expressions[2:],
+        )
+
     head_statement, head_expression = do_expression(expression_list[0])
     tail_statement, tail_expressions = reorder(expression_list[1:])
     if commute(tail_statement, head_expression):
@@ -177,7 +215,7 @@ def reorder(expression_list: List[Expression]) -> Tuple[Statement, List[Expressi
             [head_expression] + tail_expressions,
         )
 
-    temporary = TempManager.new_temp()
+    temporary = TempManager.new_temp(holds_pointer(head_expression))
     return (
         simplified_sequence(
             simplified_sequence(
@@ -0,0 +1,36 @@
+from typing import List
+
+from activation_records.frame import TempMap
+from activation_records.temp import TempManager
+from intermediate_representation.tree import (
+    Statement,
+    Move,
+    ConditionalMove,
+    Temporary,
+    holds_pointer,
+)
+
+# The translation marks the temporaries of the variables (and of the intermediate
+# values) that hold pointers, which the garbage collector must find if they are live
+# across a call. Any other temporary that a pointer is moved into, like the copies of
+# the parameters of an inlined function, holds pointers too. The machine registers are
+# never marked, since they do not keep their values across calls.
+
+
+def mark_pointer_temporaries(statements: List[Statement]):
+    registers = set(TempMap.register_to_temp.values())
+    moves = [
+        statement
+        for statement in statements
+        if isinstance(statement, (Move, ConditionalMove))
+        and isinstance(statement.temporary, Temporary)
+        and statement.temporary.temporary not in registers
+    ]
+    changed = True
+    while changed:
+        changed = False
+        for move in moves:
+            temp = move.temporary.temporary
+            if not TempManager.is_pointer(temp) and holds_pointer(move.expression):
+                TempManager.pointer_temps.add(temp)
+                changed = True
@@ -0,0 +1,124 @@
+import re
+from abc import ABC
+from typing import Dict, List, Optional
+
+from activation_records.temp import TempLabel
+from canonical.basic_block import BasicBlock
+from intermediate_representation.tree import (
+    Statement,
+    Move,
+    Memory,
+    BinaryOperation,
+    BinaryOperator,
+    Name,
+    Constant,
+)
+
+# Profile-guided optimization.
+# An instrumented build (--profile-generate) increments a counter at the start of each
+# basic block, and the runtime writes every counter to a profile file when the program
+# exits (see dump_profile in runtime.c). A later build of the same program can read that
+# file back (--profile-use) to know how many times each block ran.
+# Both builds create different labels, so blocks are matched by a key instead:
+# - A block starting with a label that existed before canonization (made during the
+#   translation of the program) is identified by that label. If the label belongs to an
+#   inlined copy of a function, the label of the original function is used instead, so
+#   every copy gets the counts of the function.
+# - The first block of a function is identified by the label of the function.
+# - Any other block is identified by the key of the previous block plus a "+".
+# Blocks whose key is not in the profile (for example, because they were inlined into
+# the function only in one of the builds) have no count.
+
+counters_label = "tiger_profile_counters"
+keys_label = "tiger_profile_keys"
+size_label = "tiger_profile_size"
+
+# Name of the file the profile is written to, unless the TIGER_PROFILE environment
+# variable says otherwise.
+default_profile_file = "tiger.profile"
+
+
+class Profile(ABC):
+    # Whether the program being compiled is instrumented, and the key of the block
+    # counted by each of its counters.
+    instrument = False
+    counter_keys: List[str] = []
+    # Execution count of each block key, read from a profile.
+    counts: Dict[str, int] = {}
+    # Execution count of each block of the program being compiled, by its label.
+    block_counts: Dict[TempLabel, int] = {}
+    # Original label of each label made for an inlined copy of a function.
+    label_origins: Dict[TempLabel, TempLabel] = {}
+
+    @classmethod
+    def initialize(cls, instrument: bool = False):
+        cls.instrument = instrument
+        cls.counter_keys = []
+        cls.counts = {}
+        cls.block_counts = {}
+        cls.label_origins = {}
+
+    # Reads a profile written by an instrumented build. Each line holds a block key and
+    # how many times it ran. Blocks with the same key (copies of the same code) add up.
+    @classmethod
+    def load(cls, file_name: str):
+        with open(file_name, "r") as profile_file:
+            for line in profile_file:
+                if not line.strip():
+                    continue
+                key, count = line.split()
+                cls.counts[key] = cls.counts.get(key, 0) + int(count)
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return bool(cls.counts)
+
+    @classmethod
+    def record_copy(cls, copy: TempLabel, original: TempLabel):
+        cls.label_origins[copy] = cls.label_origins.get(original, original)
+
+    # Number of times the function was called, if known.
+    @classmethod
+    def function_count(cls, function: TempLabel) -> Optional[int]:
+        return cls.counts.get(function)
+
+
+# Returns the key of each block of the function. Labels made after first_new_label
+# (which was the value of the label counter before building the blocks) are not kept
+# between builds.
+def block_keys(
+    function: TempLabel, block: BasicBlock, first_new_label: int
+) -> List[str]:
+    keys = []
+    for index, statements in enumerate(block.statement_lists):
+        label = statements[0].label
+        number = re.fullmatch(r"lab_(\d+)", label)
+        if index == 0:
+            key = function
+        elif number is None or int(number.group(1)) <= first_new_label:
+            key = Profile.label_origins.get(label, label)
+        else:
+            key = keys[-1] + "+"
+        keys.append(key)
+    return keys
+
+
+def counter_increment(index: int) -> Statement:
+    counter = Memory(
+        BinaryOperation(BinaryOperator.plus, Name(counters_label), Constant(8 * index))
+    )
+    return Move(counter, BinaryOperation(BinaryOperator.plus, counter, Constant(1)))
+
+
+# Adds a counter increment after the label of each block.
+def instrument_blocks(block: BasicBlock, keys: List[str]):
+    for statements, key in zip(block.statement_lists, keys):
+        statements.insert(1, counter_increment(len(Profile.counter_keys)))
+        Profile.counter_keys.append(key)
+
+
+# Saves the count of each block of the function, if the profile has it.
+def record_block_counts(block: BasicBlock, keys: List[str]):
+    for statements, key in zip(block.statement_lists, keys):
+        if key in Profile.counts:
+            Profile.block_counts[statements[0].label] = Profile.counts[key]
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, List, Optional, Set
 
 from activation_records.temp import TempLabel, TempManager
 from canonical.basic_block import BasicBlock
@@ -10,6 +10,8 @@ from intermediate_representation.tree import (
     Label,
     Name,
 )
+from liveness_analysis.graph import Graph
+from liveness_analysis.loops import loop_bodies
 
 
 def block_label(statements: List[Statement]) -> TempLabel:
@@ -23,26 +25,116 @@ def add_new_false_label(statements: List[Statement]):
     statements.append(Jump(Name(new_false_label), [new_false_label]))
 
 
-def reorder_blocks(statement_lists: List[List[Statement]]) -> List[List[Statement]]:
+# Loops of the function, found in the graph of its blocks. Each loop is indexed by the
+# label of its header and holds the labels of its blocks.
+def block_loops(
+    statement_lists: List[List[Statement]],
+) -> Dict[TempLabel, Set[TempLabel]]:
+    graph = Graph[TempLabel]()
+    nodes = {
+        block_label(statements): graph.add_node(block_label(statements))
+        for statements in statement_lists
+    }
+    for statements in statement_lists:
+        for successor in block_successors(statements):
+            if successor in nodes:
+                graph.add_edge(nodes[block_label(statements)], nodes[successor])
+    labels = [node.information for node in graph.get_nodes()]
+    return {
+        labels[header]: {labels[node_id] for node_id in body}
+        for header, body in loop_bodies(graph).items()
+    }
+
+
+def block_successors(statements: List[Statement]) -> List[TempLabel]:
+    last_statement = statements[-1]
+    if isinstance(last_statement, Jump):
+        return last_statement.labels
+    if isinstance(last_statement, ConditionalJump):
+        return [last_statement.true, last_statement.false]
+    return []
+
+
+# Successors of the conditional jump, in the order in which they should be tried as the
+# next block of the trace. If the block counts are known, the most frequent one comes
+# first. Otherwise, a successor that stays inside more of the loops of the block comes
+# first, and the false one in case of a tie.
+def likely_successors(
+    jump: ConditionalJump,
+    block_counts: Dict[TempLabel, int],
+    enclosing_loops: List[Set[TempLabel]],
+) -> List[TempLabel]:
+    if jump.true in block_counts and jump.false in block_counts:
+        true_weight, false_weight = block_counts[jump.true], block_counts[jump.false]
+    else:
+        true_weight = sum(jump.true in loop for loop in enclosing_loops)
+        false_weight = sum(jump.false in loop for loop in enclosing_loops)
+    if true_weight > false_weight:
+        return [jump.true, jump.false]
+    return [jump.false, jump.true]
+
+
+# Orders the blocks in traces. Each block is followed by its most likely successor that
+# was not placed yet.
+# Loops are rotated: when a trace jumps into a loop whose header can leave it, the
+# block that the header goes to inside the loop is placed instead, so the header ends up
+# after the last block of the loop. Then each iteration only runs the conditional jump
+# back to the top of the loop, instead of both the jump to the header and the
+# conditional jump out of the loop. Without rotating loops, the false branch of
+# conditional jumps is preferred unless the block counts say otherwise.
+def reorder_blocks(
+    statement_lists: List[List[Statement]],
+    block_counts: Optional[Dict[TempLabel, int]] = None,
+    rotate_loops: bool = True,
+) -> List[List[Statement]]:
+    block_counts = block_counts or {}
+    loops = block_loops(statement_lists) if rotate_loops else {}
     unmarked_blocks = {
         block_label(statements): statements for statements in statement_lists
     }
+
+    def enclosing_loops(label: TempLabel) -> List[Set[TempLabel]]:
+        return [loop for loop in loops.values() if label in loop]
+
+    def next_label(statements: List[Statement]) -> Optional[TempLabel]:
+        last_statement = statements[-1]
+        if isinstance(last_statement, Jump):
+            candidates = last_statement.labels[:1]
+        elif isinstance(last_statement, ConditionalJump):
+            candidates = likely_successors(
+                last_statement, block_counts, enclosing_loops(block_label(statements))
+            )
+        else:
+            candidates = []
+        return next((label for label in candidates if label in unmarked_blocks), None)
+
+    # The block inside the loop that the header goes to, if the header can also leave
+    # the loop. It is placed instead of the header when entering the loop.
+    def loop_top(header: TempLabel) -> Optional[TempLabel]:
+        header_statements = unmarked_blocks[header]
+        if not isinstance(header_statements[-1], ConditionalJump):
+            return None
+        top = next_label(header_statements)
+        leaves_loop = any(
+            label not in loops[header] for label in block_successors(header_statements)
+        )
+        return top if leaves_loop and top in loops[header] else None
+
     result = []
     for block in statement_lists:
-        current_block = block
-        while block_label(current_block) in unmarked_blocks:
-            unmarked_blocks.pop(block_label(current_block))
+        current_block = unmarked_blocks.get(block_label(block))
+        while current_block is not None:
+            current_label = block_label(current_block)
+            unmarked_blocks.pop(current_label)
             result.append(current_block)
-            last_statement = current_block[-1]
-            if isinstance(last_statement, Jump):
-                target_label = last_statement.labels[0]
-                if target_label in unmarked_blocks:
-                    current_block = unmarked_blocks[target_label]
-            elif isinstance(last_statement, ConditionalJump):
-                if last_statement.false in unmarked_blocks:
-                    current_block = unmarked_blocks[last_statement.false]
-                elif last_statement.true in unmarked_blocks:
-                    current_block = unmarked_blocks[last_statement.true]
+            following_label = next_label(current_block)
+            if (
+                following_label in loops
+                and isinstance(current_block[-1], Jump)
+                and current_label not in loops[following_label]
+            ):
+                following_label = loop_top(following_label) or following_label
+            current_block = unmarked_blocks.get(following_label)
     return result
 
 
@@ -75,8 +167,15 @@ def fix_jumps(statement_lists: List[List[Statement]]):
         add_new_false_label(last_list)
 
 
-def trace_schedule(block: BasicBlock) -> List[Statement]:
-    reordered_blocks = reorder_blocks(block.statement_lists)
+# Orders the blocks in traces, where each block is followed by one of its successors
+# when possible. If the execution count of the blocks is known, conditional jumps fall
+# through to their most frequent successor.
+def trace_schedule(
+    block: BasicBlock,
+    block_counts: Optional[Dict[TempLabel, int]] = None,
+    rotate_loops: bool = True,
+) -> List[Statement]:
+    reordered_blocks = reorder_blocks(block.statement_lists, block_counts, rotate_loops)
     reordered_blocks.append([Label(block.label)])
     fix_jumps(reordered_blocks)
     return [statement for block in reordered_blocks for statement in block]
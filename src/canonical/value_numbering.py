@@ -0,0 +1,382 @@
+from typing import Dict, List, Optional, Tuple
+
+from activation_records.frame import TempMap, frame_pointer
+from activation_records.temp import Temp, TempManager
+from canonical.basic_block import BasicBlock
+from intermediate_representation.tree import (
+    Statement,
+    Expression,
+    BinaryOperator,
+    BinaryOperation,
+    Memory,
+    Temporary,
+    Name,
+    Constant,
+    Call,
+    Move,
+    StatementExpression,
+    ConditionalJump,
+    holds_pointer,
+    derives_pointer,
+)
+
+# Local value numbering over the canonical basic blocks.
+# Every pure expression (one that performs no calls) gets a value number built from the
+# value numbers of its operands, so two expressions with the same number are guaranteed to
+# compute the same value inside the block. Memory reads are numbered together with the
+# version of the memory they read: slots of the current frame (addressed as a constant
+# offset from the frame pointer) change version when they are stored to, the rest of the
+# memory changes version on every store, and every call changes the version of all of
+# it. A store through any other address may still write a frame slot (the address of
+# the frame can be held by another temporary), so it changes the version of every slot
+# too. Only a store to a known slot leaves the other slots untouched. Addresses computed
+# from pointers are numbered together with the number of calls before them too, since a
+# call may run the garbage collector, which moves the objects they point into.
+# Expressions whose number appears more than once in a block are computed a single time
+# into a temporary, which then replaces every other occurrence.
+
+ValueNumber = int
+
+commutative_operators = (
+    BinaryOperator.plus,
+    BinaryOperator.mul,
+    BinaryOperator.andOp,
+    BinaryOperator.orOp,
+    BinaryOperator.xor,
+)
+
+
+# Value numbering state at a given point of the program. It only describes what is known
+# to hold at that point, so a dominator-based pass could seed each block with a copy of the
+# table left by its immediate dominator instead of an empty one.
+class ValueTable:
+    def __init__(self):
+        self.number_count = 0
+        # Value number of each expression key.
+        self.numbers: Dict[Tuple, ValueNumber] = {}
+        # Value number currently held by each temporary.
+        self.temp_numbers: Dict[Temp, ValueNumber] = {}
+        # Temporary known to hold each value number.
+        self.holders: Dict[ValueNumber, Temp] = {}
+        self.call_version = 0
+        self.memory_version = 0
+        # Number of stores through addresses that are not known frame slots.
+        self.indirect_store_version = 0
+        self.frame_versions: Dict[int, int] = {}
+
+    def new_number(self) -> ValueNumber:
+        self.number_count += 1
+        return self.number_count
+
+    def key_number(self, key: Tuple) -> ValueNumber:
+        if key not in self.numbers:
+            self.numbers[key] = self.new_number()
+        return self.numbers[key]
+
+    def temp_number(self, temp: Temp) -> ValueNumber:
+        if temp not in self.temp_numbers:
+            self.temp_numbers[temp] = self.new_number()
+        return self.temp_numbers[temp]
+
+    # Gives a value number to every pure subexpression of the expression, storing them
+    # in numbers by node identity. Returns None if the expression is not pure.
+    def number_expression(
+        self, expression: Expression, numbers: Dict[int, ValueNumber]
+    ) -> Optional[ValueNumber]:
+        number = None
+        if isinstance(expression, Temporary):
+            number = self.temp_number(expression.temporary)
+
+        elif isinstance(expression, Constant):
+            number = self.key_number(("constant", expression.value))
+
+        elif isinstance(expression, Name):
+            number = self.key_number(("name", expression.label))
+
+        elif isinstance(expression, BinaryOperation):
+            left = self.number_expression(expression.left, numbers)
+            right = self.number_expression(expression.right, numbers)
+            if left is not None and right is not None:
+                if expression.operator in commutative_operators:
+                    left, right = min(left, right), max(left, right)
+                key = (expression.operator, left, right)
+                if derives_pointer(expression):
+                    key += (self.call_version,)
+                number = self.key_number(key)
+
+        elif isinstance(expression, Memory):
+            address = self.number_expression(expression.expression, numbers)
+            if address is not None:
+                number = self.key_number(self.memory_key(expression, address))
+
+        elif isinstance(expression, Call):
+            for argument in expression.arguments:
+                self.number_expression(argument, numbers)
+
+        if number is not None:
+            numbers[id(expression)] = number
+        return number
+
+    # Numbers the expressions evaluated by the statement and then applies its effects.
+    def number_statement(self, statement: Statement) -> Dict[int, ValueNumber]:
+        numbers = {}
+        if isinstance(statement, Move) and isinstance(statement.temporary, Temporary):
+            number = self.number_expression(statement.expression, numbers)
+            if isinstance(statement.expression, Call):
+                self.kill_call()
+            self.define_temp(statement.temporary.temporary, number)
+
+        elif isinstance(statement, Move) and isinstance(statement.temporary, Memory):
+            address = self.number_expression(statement.temporary.expression, numbers)
+            value = self.number_expression(statement.expression, numbers)
+            offset = frame_offset(statement.temporary)
+            if offset is not None:
+                self.frame_versions[offset] = self.frame_versions.get(offset, 0) + 1
+            else:
+                self.indirect_store_version += 1
+            self.memory_version += 1
+            # The stored value can be forwarded to later reads of the same address.
+            if address is not None and value is not None:
+                self.numbers[self.memory_key(statement.temporary, address)] = value
+
+        elif isinstance(statement, StatementExpression):
+            self.number_expression(statement.expression, numbers)
+            if isinstance(statement.expression, Call):
+                self.kill_call()
+
+        elif isinstance(statement, ConditionalJump):
+            self.number_expression(statement.left, numbers)
+            self.number_expression(statement.right, numbers)
+
+        return numbers
+
+    def memory_key(self, memory: Memory, address: ValueNumber) -> Tuple:
+        offset = frame_offset(memory)
+        if offset is not None:
+            version = self.frame_versions.get(offset, 0)
+            return (
+                "frame",
+                offset,
+                self.call_version,
+                self.indirect_store_version,
+                version,
+            )
+        return ("memory", address, self.call_version, self.memory_version)
+
+    def define_temp(self, temp: Temp, number: Optional[ValueNumber]):
+        self.temp_numbers[temp] = number if number is not None else self.new_number()
+
+    # A call may write any memory location and trash the machine registers.
+    def kill_call(self):
+        self.call_version += 1
+        for temp in TempMap.register_to_temp.values():
+            if temp != frame_pointer():
+                self.temp_numbers[temp] = self.new_number()
+
+
+# Returns the offset of a memory access to a slot of the current frame, or None if the
+# access is not of the form Memory(frame pointer + constant).
+def frame_offset(memory: Memory) -> Optional[int]:
+    address = memory.expression
+    if (
+        isinstance(address, BinaryOperation)
+        and address.operator == BinaryOperator.plus
+        and isinstance(address.left, Temporary)
+        and address.left.temporary == frame_pointer()
+        and isinstance(address.right, Constant)
+    ):
+        return address.right.value
+    return None
+
+
+def is_precolored(temp: Temp) -> bool:
+    return temp in TempMap.register_to_temp.values()
+
+
+def is_reusable(expression: Expression) -> bool:
+    return isinstance(expression, (BinaryOperation, Memory))
+
+
+def local_value_numbering(block: BasicBlock) -> BasicBlock:
+    return BasicBlock(
+        block.label,
+        [
+            value_number_block(statements, ValueTable())
+            for statements in block.statement_lists
+        ],
+    )
+
+
+# Removes redundant computations from a single basic block, starting from the information
+# in table. After the call, table holds the information available at the end of the block.
+def value_number_block(
+    statements: List[Statement], table: ValueTable
+) -> List[Statement]:
+    holders = {
+        number: temp
+        for number, temp in table.holders.items()
+        if table.temp_numbers.get(temp) == number
+    }
+
+    # First pass: number every statement and count how many times each value is computed.
+    # Once a value has been seen, the subexpressions of its later occurrences are not
+    # counted since those occurrences will disappear entirely.
+    statement_numbers = [table.number_statement(statement) for statement in statements]
+    counts: Dict[ValueNumber, int] = {}
+    for statement, numbers in zip(statements, statement_numbers):
+        for expression in evaluated_expressions(statement):
+            count_occurrences(expression, numbers, counts)
+
+    # Second pass: rewrite the statements, computing repeated values only once.
+    result = []
+    for statement, numbers in zip(statements, statement_numbers):
+        hoisted = []
+        new_statement = rewrite_statement(statement, numbers, counts, holders, hoisted)
+        result.extend(hoisted)
+        result.append(new_statement)
+
+        if isinstance(statement, Move) and isinstance(statement.temporary, Temporary):
+            defined_temp = statement.temporary.temporary
+            for number in [n for n, temp in holders.items() if temp == defined_temp]:
+                holders.pop(number)
+            number = numbers.get(id(statement.expression))
+            if number is not None:
+                add_holder(holders, number, defined_temp)
+
+    # The temporaries introduced by the second pass are never redefined in the block.
+    for number, temp in holders.items():
+        table.temp_numbers.setdefault(temp, number)
+    table.holders = {
+        number: temp
+        for number, temp in holders.items()
+        if table.temp_numbers[temp] == number
+    }
+    return result
+
+
+def add_holder(holders: Dict[ValueNumber, Temp], number: ValueNumber, temp: Temp):
+    if not is_precolored(temp) and number not in holders:
+        holders[number] = temp
+
+
+# Expressions evaluated by a statement, in evaluation order. The destination of a Move is
+# not evaluated, although the address of a memory destination is.
+def evaluated_expressions(statement: Statement) -> List[Expression]:
+    if isinstance(statement, Move):
+        if isinstance(statement.temporary, Memory):
+            return [statement.temporary.expression, statement.expression]
+        return [statement.expression]
+    if isinstance(statement, StatementExpression):
+        return [statement.expression]
+    if isinstance(statement, ConditionalJump):
+        return [statement.left, statement.right]
+    return []
+
+
+def count_occurrences(
+    expression: Expression,
+    numbers: Dict[int, ValueNumber],
+    counts: Dict[ValueNumber, int],
+):
+    number = numbers.get(id(expression))
+    if number is not None and is_reusable(expression):
+        counts[number] = counts.get(number, 0) + 1
+        if counts[number] > 1:
+            return
+    for subexpression in subexpressions(expression):
+        count_occurrences(subexpression, numbers, counts)
+
+
+def subexpressions(expression: Expression) -> List[Expression]:
+    if isinstance(expression, BinaryOperation):
+        return [expression.left, expression.right]
+    if isinstance(expression, Memory):
+        return [expression.expression]
+    if isinstance(expression, Call):
+        return [expression.function] + expression.arguments
+    return []
+
+
+def rewrite_statement(
+    statement: Statement,
+    numbers: Dict[int, ValueNumber],
+    counts: Dict[ValueNumber, int],
+    holders: Dict[ValueNumber, Temp],
+    hoisted: List[Statement],
+) -> Statement:
+    def rewrite(expression: Expression, hoist: bool = True) -> Expression:
+        return rewrite_expression(expression, numbers, counts, holders, hoisted, hoist)
+
+    if isinstance(statement, Move):
+        if isinstance(statement.temporary, Memory):
+            return Move(
+                Memory(
+                    rewrite(statement.temporary.expression),
+                    statement.temporary.pointer,
+                ),
+                rewrite(statement.expression),
+            )
+        # The destination temporary already holds the value after the move, so there is
+        # no need to compute it into yet another temporary.
+        return Move(
+            statement.temporary,
+            rewrite(
+                statement.expression,
+                hoist=is_precolored(statement.temporary.temporary),
+            ),
+        )
+
+    if isinstance(statement, StatementExpression):
+        return StatementExpression(rewrite(statement.expression))
+
+    if isinstance(statement, ConditionalJump):
+        return ConditionalJump(
+            statement.operator,
+            rewrite(statement.left),
+            rewrite(statement.right),
+            statement.true,
+            statement.false,
+        )
+
+    return statement
+
+
+def rewrite_expression(
+    expression: Expression,
+    numbers: Dict[int, ValueNumber],
+    counts: Dict[ValueNumber, int],
+    holders: Dict[ValueNumber, Temp],
+    hoisted: List[Statement],
+    hoist: bool = True,
+) -> Expression:
+    number = numbers.get(id(expression))
+    if number is not None:
+        if number in holders and is_reusable(expression):
+            return Temporary(holders[number])
+        if isinstance(expression, Temporary):
+            add_holder(holders, number, expression.temporary)
+
+    def rewrite(subexpression: Expression) -> Expression:
+        return rewrite_expression(subexpression, numbers, counts, holders, hoisted)
+
+    if isinstance(expression, BinaryOperation):
+        new_expression = BinaryOperation(
+            expression.operator, rewrite(expression.left), rewrite(expression.right)
+        )
+    elif isinstance(expression, Memory):
+        new_expression = Memory(rewrite(expression.expression), expression.pointer)
+    elif isinstance(expression, Call):
+        return Call(
+            expression.function,
+            [rewrite(argument) for argument in expression.arguments],
+            expression.pointer,
+        )
+    else:
+        return expression
+
+    if hoist and counts.get(number, 0) > 1:
+        temp = TempManager.new_temp(holds_pointer(new_expression))
+        hoisted.append(Move(Temporary(temp), new_expression))
+        holders[number] = temp
+        return Temporary(temp)
+    return new_expression
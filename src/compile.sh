@@ -1,8 +1,8 @@
 #!/usr/bin/env bash
 
-python3 main.py "$1"
+python3 main.py "$@"
 if [ $? -eq 0 ]; then
-  gcc -c putting_it_all_together/runtime.c
+  gcc $RUNTIME_CFLAGS -c putting_it_all_together/runtime.c
   gcc -no-pie -g output.s runtime.o
 
   rm "output.s"
@@ -1,6 +1,6 @@
 from activation_records.temp import Temp, TempLabel
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Callable, List, Optional
 
 
@@ -54,11 +54,20 @@ class Move(Instruction):
         return self.line
 
 
+# The offsets from the frame pointer of the slots that hold pointers while a call that
+# returns to the label runs.
+@dataclass
+class StackMap:
+    label: TempLabel
+    offsets: List[int]
+
+
 @dataclass
 class Procedure:
     prologue: str
     body: List[Instruction]
     epilogue: str
+    stack_maps: List[StackMap] = field(default_factory=list)
 
     def format(self, temp_map: Callable[[Temp], str]) -> str:
         return (
@@ -1,9 +1,10 @@
-from typing import List
+from typing import Callable, Dict, List, Optional, Tuple
 from abc import ABC
 import instruction_selection.assembly as Assembly
 import intermediate_representation.tree as IRT
 import activation_records.temp as Temp
 import activation_records.frame as Frame
+from intermediate_representation.intrinsics import Intrinsics
 
 
 # x86-64
@@ -35,6 +36,11 @@ def convert_relational_operator(operator: IRT.RelationalOperator) -> str:
     return conversion_dictionary[operator]
 
 
+# The conditional moves use the same condition codes as the conditional jumps.
+def convert_relational_operator_to_cmov(operator: IRT.RelationalOperator) -> str:
+    return "cmov" + convert_relational_operator(operator)[1:]
+
+
 # There are two operators for multiplication and division, one for
 # signed values and another for unsigned ones.
 # Currently using signed version of mul and div.
@@ -76,25 +82,31 @@ def munch_statement(stmNode: IRT.Statement) -> None:
     elif isinstance(stmNode, IRT.ConditionalJump):
         # The jump itself checks the flags in the EFL register.
         # These are usually set with TEST or CMP.
-        # We swap the order of the expressions to match AT&T syntax's
-        # order of operands.
+        operator = munch_comparison(stmNode.operator, stmNode.left, stmNode.right)
         Codegen.emit(
             Assembly.Operation(
-                line="cmpq %'s0, %'s1\n",
-                source=[
-                    munch_expression(stmNode.right),
-                    munch_expression(stmNode.left),
-                ],
+                line=f"{convert_relational_operator(operator)} 'j0\n",
+                source=[],
                 destination=[],
-                jump=None,
+                jump=[stmNode.true, stmNode.false],
             )
         )
+
+    # ConditionalMove(operator, exp_left, exp_right, temporary, exp): compares like a
+    # ConditionalJump, and then moves the value of 'exp' to 'temporary' with a cmov if
+    # the comparison is true.
+    elif isinstance(stmNode, IRT.ConditionalMove):
+        # The value is computed before the comparison, since the instructions that
+        # compute it may overwrite the flags.
+        value = munch_expression(stmNode.expression)
+        operator = munch_comparison(stmNode.operator, stmNode.left, stmNode.right)
+        temporary = munch_expression(stmNode.temporary)
         Codegen.emit(
             Assembly.Operation(
-                line=f"{convert_relational_operator(stmNode.operator)} 'j0\n",
-                source=[],
-                destination=[],
-                jump=[stmNode.true, stmNode.false],
+                line=f"{convert_relational_operator_to_cmov(operator)} %'s0, %'d0\n",
+                source=[value, temporary],
+                destination=[temporary],
+                jump=None,
             )
         )
 
@@ -118,20 +130,57 @@ def munch_statement(stmNode: IRT.Statement) -> None:
         # Then evaluate 'e2' and store the result into 'WordSize' bytes of memory
         # starting at 'addr'.
         elif isinstance(stmNode.temporary, IRT.Memory):
-            Codegen.emit(
-                Assembly.Move(
-                    line="movq %'s0, (%'s1)\n",
-                    source=[
-                        munch_expression(stmNode.expression),
-                        munch_expression(stmNode.temporary.expression),
-                    ],
-                    destination=[],
+            # Move(mem(e1 + const), e2): stores at a displacement from the value of
+            # 'e1', which is how frame slots are accessed.
+            displacement = displacement_address(stmNode.temporary.expression)
+            if displacement is not None:
+                base, offset = displacement
+                Codegen.emit(
+                    Assembly.Operation(
+                        line=f"movq %'s0, {offset}(%'s1)\n",
+                        source=[
+                            munch_expression(stmNode.expression),
+                            munch_expression(base),
+                        ],
+                        destination=[],
+                        jump=None,
+                    )
+                )
+            else:
+                Codegen.emit(
+                    Assembly.Move(
+                        line="movq %'s0, (%'s1)\n",
+                        source=[
+                            munch_expression(stmNode.expression),
+                            munch_expression(stmNode.temporary.expression),
+                        ],
+                        destination=[],
+                    )
                 )
-            )
 
         else:
             raise Exception("Munching an invalid version of node IRT.Move.")
 
+    # TailCall(function, args): Passes the arguments in registers, frees the current
+    # frame and jumps to 'function'. The instructions that free the frame restore the
+    # callee-saved registers, which are only known after register allocation, so a
+    # placeholder is left for them. The jump has no targets inside the function, since
+    # the called function returns directly to our caller.
+    elif isinstance(stmNode, IRT.TailCall):
+        if not isinstance(stmNode.function, IRT.Name):
+            raise Exception("Found a IRT.TailCall where function is not an IRT.Name.")
+        if len(stmNode.arguments) > len(Frame.argument_registers):
+            raise Exception("Found a IRT.TailCall with arguments passed in the stack.")
+
+        Codegen.emit(
+            Assembly.Operation(
+                line=f"{Frame.free_frame_placeholder}jmp {stmNode.function.label}\n",
+                source=munch_arguments(stmNode.arguments) + Frame.exit_temps(),
+                destination=[],
+                jump=[],
+            )
+        )
+
     # StatementExpression(exp): Evaluates 'exp' and discards the result.
     elif isinstance(stmNode, IRT.StatementExpression):
         munch_expression(stmNode.expression)
@@ -145,6 +194,72 @@ def munch_statement(stmNode: IRT.Statement) -> None:
         raise Exception("No match for IRT node while munching a statement.")
 
 
+# Emits the instruction that sets the flags for comparing 'left' and 'right' with
+# 'operator', and returns the operator whose condition the following instruction must
+# check. The right operand of cmpq can be an immediate, so a constant on the left is
+# swapped to the right, and either operand (but not both) can be read from memory.
+def munch_comparison(
+    operator: IRT.RelationalOperator, left: IRT.Expression, right: IRT.Expression
+) -> IRT.RelationalOperator:
+    if isinstance(left, IRT.Constant) and not isinstance(right, IRT.Constant):
+        left, right = right, left
+        operator = IRT.mirror_relational_operator(operator)
+
+    # testq of a register with itself sets the flags like comparing it against zero,
+    # without an immediate.
+    if right == IRT.Constant(0) and not isinstance(left, IRT.Memory):
+        Codegen.emit(
+            Assembly.Operation(
+                line="testq %'s0, %'s0\n",
+                source=[munch_expression(left)],
+                destination=[],
+                jump=None,
+            )
+        )
+        return operator
+
+    # We swap the order of the expressions to match AT&T syntax's order of operands.
+    if isinstance(right, IRT.Constant) and fits_in_immediate(right.value):
+        right_operand, right_source = f"${right.value}", []
+    else:
+        right_operand, right_source = munch_operand(
+            right, 0, allow_memory=not isinstance(left, IRT.Memory)
+        )
+    left_operand, left_source = munch_operand(
+        left, len(right_source), allow_memory=True
+    )
+    Codegen.emit(
+        Assembly.Operation(
+            line=f"cmpq {right_operand}, {left_operand}\n",
+            source=right_source + left_source,
+            destination=[],
+            jump=None,
+        )
+    )
+    return operator
+
+
+# Returns the text of an instruction operand holding the value of the expression, using
+# the source temporaries from the given index, and the list of those temporaries. The
+# operand reads the memory directly if the expression is a Memory node and it is
+# allowed, or is a register with the value otherwise.
+def munch_operand(
+    expression: IRT.Expression, index: int, allow_memory: bool
+) -> Tuple[str, List[Temp.Temp]]:
+    if allow_memory and isinstance(expression, IRT.Memory):
+        displacement = displacement_address(expression.expression)
+        if displacement is not None:
+            base, offset = displacement
+            return f"{offset}(%'s{index})", [munch_expression(base)]
+        return f"(%'s{index})", [munch_expression(expression.expression)]
+    return f"%'s{index}", [munch_expression(expression)]
+
+
+# Most instructions take immediates of at most 32 bits, which are sign-extended.
+def fits_in_immediate(value: int) -> bool:
+    return -(2 ** 31) <= value < 2 ** 31
+
+
 def munch_arguments(arg_list: List[IRT.Expression]) -> List[Temp.Temp]:
     # Pass arguments through registers.
     temp_list = []
@@ -175,6 +290,307 @@ def munch_arguments(arg_list: List[IRT.Expression]) -> List[Temp.Temp]:
     return temp_list
 
 
+# Returns the base expression and the displacement of an address of the form
+# BinaryOperation(plus, e, Constant), or None if the address has another form.
+def displacement_address(
+    address: IRT.Expression,
+) -> Optional[Tuple[IRT.Expression, int]]:
+    if (
+        isinstance(address, IRT.BinaryOperation)
+        and address.operator == IRT.BinaryOperator.plus
+        and isinstance(address.right, IRT.Constant)
+    ):
+        return address.left, address.right.value
+    return None
+
+
+def emit_operation(
+    line: str, source: List[Temp.Temp], destination: List[Temp.Temp]
+) -> None:
+    Codegen.emit(
+        Assembly.Operation(line=line, source=source, destination=destination, jump=None)
+    )
+
+
+def copy_to_new_temp(temp: Temp.Temp) -> Temp.Temp:
+    new_temp = Temp.TempManager.new_temp()
+    Codegen.emit(
+        Assembly.Move(line="movq %'s0, %'d0\n", source=[temp], destination=[new_temp])
+    )
+    return new_temp
+
+
+# Wraps an integer to the range of a signed 64 bits value, like the machine does.
+def to_signed_word(value: int) -> int:
+    return (value + 2 ** 63) % 2 ** 64 - 2 ** 63
+
+
+# Multiplications and divisions by a constant are lowered without imulq and idivq, which
+# need their operands in rax and rdx, so those registers would interfere with every
+# value live across them. The division by other constants than powers of two still
+# needs rax and rdx to multiply by the reciprocal of the divisor, but that is much
+# faster than idivq. Returns None for the operations that are not strength reduced.
+def munch_strength_reduced(expNode: IRT.BinaryOperation) -> Optional[Temp.Temp]:
+    left, right = expNode.left, expNode.right
+    left_value, right_value = constant_value(left), constant_value(right)
+    if expNode.operator == IRT.BinaryOperator.mul and right_value is None:
+        left, right = right, left
+        left_value, right_value = right_value, left_value
+    if right_value is None:
+        return None
+
+    if expNode.operator == IRT.BinaryOperator.mul:
+        if left_value is not None:
+            return munch_expression(
+                IRT.Constant(to_signed_word(left_value * right_value))
+            )
+        return munch_constant_multiplication(left, right_value)
+
+    if right_value == 0:
+        return None
+    if left_value is not None:
+        quotient = abs(left_value) // abs(right_value)
+        if (left_value < 0) != (right_value < 0):
+            quotient = -quotient
+        return munch_expression(IRT.Constant(to_signed_word(quotient)))
+    return munch_constant_division(left, right_value)
+
+
+# Value of an expression that only adds, subtracts and multiplies constants, such as
+# the negative numbers, which are written as a subtraction from zero.
+def constant_value(expression: IRT.Expression) -> Optional[int]:
+    if isinstance(expression, IRT.Constant):
+        return expression.value
+    if isinstance(expression, IRT.BinaryOperation) and expression.operator in (
+        IRT.BinaryOperator.plus,
+        IRT.BinaryOperator.minus,
+        IRT.BinaryOperator.mul,
+    ):
+        left, right = constant_value(expression.left), constant_value(expression.right)
+        if left is None or right is None:
+            return None
+        if expression.operator == IRT.BinaryOperator.plus:
+            return to_signed_word(left + right)
+        if expression.operator == IRT.BinaryOperator.minus:
+            return to_signed_word(left - right)
+        return to_signed_word(left * right)
+    return None
+
+
+# Additions, and additions or subtractions of a constant, are computed with leaq, which
+# writes the result to any register instead of overwriting its first operand. The
+# operand then does not have to be copied to the destination first. Returns None for
+# the subtractions of a value that is not constant.
+def munch_address_arithmetic(expNode: IRT.BinaryOperation) -> Optional[Temp.Temp]:
+    value = constant_value(expNode)
+    if value is not None:
+        return munch_expression(IRT.Constant(value))
+
+    left, right = expNode.left, expNode.right
+    right_value = constant_value(right)
+    if expNode.operator == IRT.BinaryOperator.plus and right_value is None:
+        left, right = right, left
+        right_value = constant_value(right)
+
+    result = Temp.TempManager.new_temp()
+    if right_value is not None:
+        offset = right_value
+        if expNode.operator == IRT.BinaryOperator.minus:
+            offset = -offset
+        if not fits_in_immediate(offset):
+            return None
+        # leaq k(%a), %d
+        emit_operation(
+            f"leaq {offset}(%'s0), %'d0\n", [munch_expression(left)], [result]
+        )
+    elif expNode.operator == IRT.BinaryOperator.plus:
+        # leaq (%a,%b), %d
+        emit_operation(
+            "leaq (%'s0,%'s1), %'d0\n",
+            [munch_expression(left), munch_expression(right)],
+            [result],
+        )
+    else:
+        return None
+    return result
+
+
+def is_power_of_two(value: int) -> bool:
+    return value > 0 and value & (value - 1) == 0
+
+
+# Multiplies with a shift when the constant is a power of two, with leaq when it is 3, 5
+# or 9, and with the imulq that takes an immediate and any destination register
+# otherwise. Negative constants negate the result of multiplying by their magnitude.
+def munch_constant_multiplication(
+    expression: IRT.Expression, constant: int
+) -> Optional[Temp.Temp]:
+    magnitude = abs(constant)
+    if constant == 0:
+        return munch_expression(IRT.Constant(0))
+    if is_power_of_two(magnitude):
+        product = copy_to_new_temp(munch_expression(expression))
+        if magnitude > 1:
+            emit_operation(
+                f"salq ${magnitude.bit_length() - 1}, %'d0\n", [product], [product]
+            )
+    elif magnitude in (3, 5, 9):
+        product = Temp.TempManager.new_temp()
+        emit_operation(
+            f"leaq (%'s0,%'s0,{magnitude - 1}), %'d0\n",
+            [munch_expression(expression)],
+            [product],
+        )
+    elif fits_in_immediate(constant):
+        product = Temp.TempManager.new_temp()
+        emit_operation(
+            f"imulq ${constant}, %'s0, %'d0\n",
+            [munch_expression(expression)],
+            [product],
+        )
+        return product
+    else:
+        return None
+
+    if constant < 0:
+        emit_operation("negq %'d0\n", [product], [product])
+    return product
+
+
+# Divides rounding towards zero, like idivq. A power of two divisor is a shift, after
+# adding the divisor minus one to negative dividends. Any other divisor multiplies by
+# its reciprocal, scaled by 2 ** (64 + shift): the high half of the product, shifted, is
+# the quotient rounded down, and adding one to it for negative dividends rounds it
+# towards zero instead. Negative divisors negate the quotient of their magnitude.
+def munch_constant_division(expression: IRT.Expression, divisor: int) -> Temp.Temp:
+    dividend = munch_expression(expression)
+    magnitude = abs(divisor)
+    if magnitude == 1:
+        quotient = copy_to_new_temp(dividend)
+    elif is_power_of_two(magnitude):
+        shift = magnitude.bit_length() - 1
+        quotient = copy_to_new_temp(dividend)
+        emit_operation("sarq $63, %'d0\n", [quotient], [quotient])
+        emit_operation(f"shrq ${64 - shift}, %'d0\n", [quotient], [quotient])
+        emit_operation("addq %'s1, %'d0\n", [quotient, dividend], [quotient])
+        emit_operation(f"sarq ${shift}, %'d0\n", [quotient], [quotient])
+    else:
+        rax = Frame.TempMap.register_to_temp["rax"]
+        rdx = Frame.TempMap.register_to_temp["rdx"]
+        multiplier, shift = division_multiplier(magnitude)
+        Codegen.emit(
+            Assembly.Move(
+                line=f"movq ${to_signed_word(multiplier)}, %'d0\n",
+                source=[],
+                destination=[rax],
+            )
+        )
+        emit_operation("imulq %'s1\n", [rax, dividend], [rax, rdx])
+        # imulq is signed, so a multiplier of 64 bits was taken as negative, which
+        # subtracted the dividend from the high half of the product.
+        if multiplier >= 2 ** 63:
+            emit_operation("addq %'s1, %'d0\n", [rdx, dividend], [rdx])
+        if shift > 0:
+            emit_operation(f"sarq ${shift}, %'d0\n", [rdx], [rdx])
+        quotient = copy_to_new_temp(rdx)
+        sign = copy_to_new_temp(dividend)
+        emit_operation("shrq $63, %'d0\n", [sign], [sign])
+        emit_operation("addq %'s1, %'d0\n", [quotient, sign], [quotient])
+
+    if divisor < 0:
+        emit_operation("negq %'d0\n", [quotient], [quotient])
+    return quotient
+
+
+# Multiplier and shift of the division by a positive constant that is not a power of
+# two. The multiplier is 2 ** (64 + shift) / divisor rounded up, which is at most
+# 2 ** 64 and exceeds it by less than 2 ** (shift + 1) / divisor. That excess, times a
+# dividend of at most 2 ** 63, is less than 1 / divisor after scaling the product back,
+# so it never reaches the next integer.
+def division_multiplier(divisor: int) -> Tuple[int, int]:
+    shift = 0
+    while True:
+        multiplier = -(-(2 ** (64 + shift)) // divisor)
+        if multiplier * divisor - 2 ** (64 + shift) < 2 ** (shift + 1):
+            return multiplier, shift
+        shift += 1
+
+
+# not(n): cmpq $1 sets the carry flag only when n is zero, and sbbq turns it into -1 or
+# 0, which is then negated.
+def not_instructions(
+    arguments: List[Temp.Temp], result: Temp.Temp
+) -> List[Assembly.Instruction]:
+    return [
+        Assembly.Operation(
+            line="cmpq $1, %'s0\n", source=arguments, destination=[], jump=None
+        ),
+        Assembly.Operation(
+            line="sbbq %'d0, %'d0\n", source=[], destination=[result], jump=None
+        ),
+        Assembly.Operation(
+            line="negq %'d0\n", source=[result], destination=[result], jump=None
+        ),
+    ]
+
+
+# char_to_num(s): the first character of s, sign-extended like the char of the runtime,
+# or -1 if s is empty. cmpq $1 sets the carry flag only when the length is zero, and
+# sbbq turns it into a mask of ones that replaces the character (the terminating zero).
+def char_to_num_instructions(
+    arguments: List[Temp.Temp], result: Temp
+) -> List[Assembly.Instruction]:
+    empty_mask = Temp.TempManager.new_temp()
+    return [
+        Assembly.Operation(
+            line=f"movsbq {Frame.string_characters_offset}(%'s0), %'d0\n",
+            source=arguments,
+            destination=[result],
+            jump=None,
+        ),
+        Assembly.Operation(
+            line=f"cmpq $1, {Frame.string_length_offset}(%'s0)\n",
+            source=arguments,
+            destination=[],
+            jump=None,
+        ),
+        Assembly.Operation(
+            line="sbbq %'d0, %'d0\n", source=[], destination=[empty_mask], jump=None
+        ),
+        Assembly.Operation(
+            line="orq %'s0, %'d0\n",
+            source=[empty_mask, result],
+            destination=[result],
+            jump=None,
+        ),
+    ]
+
+
+# string_length(s): the length stored at the start of s.
+def string_length_instructions(
+    arguments: List[Temp.Temp], result: Temp
+) -> List[Assembly.Instruction]:
+    return [
+        Assembly.Operation(
+            line=f"movq {Frame.string_length_offset}(%'s0), %'d0\n",
+            source=arguments,
+            destination=[result],
+            jump=None,
+        )
+    ]
+
+
+# Instructions that compute the result of each intrinsic function into the destination
+# temporary, given the temporaries holding the arguments.
+intrinsic_instructions: Dict[
+    str, Callable[[List[Temp.Temp], Temp.Temp], List[Assembly.Instruction]]
+] = {
+    "not": not_instructions,
+    "char_to_num": char_to_num_instructions,
+    "string_length": string_length_instructions,
+}
+
+
 def munch_expression(expNode: IRT.Expression) -> Temp.Temp:
     # BinaryOperation(operator, exp_left, exp_right): Apply the binary operator
     # 'operator' to operands 'exp_left' and 'exp_right'. 'exp_left' is evaluated
@@ -187,6 +603,11 @@ def munch_expression(expNode: IRT.Expression) -> Temp.Temp:
             IRT.BinaryOperator.orOp,
             IRT.BinaryOperator.xor,
         ):
+            if expNode.operator in (IRT.BinaryOperator.plus, IRT.BinaryOperator.minus):
+                address = munch_address_arithmetic(expNode)
+                if address is not None:
+                    return address
+
             # add/sub/and/or/xor src, dst
             temp = Temp.TempManager.new_temp()
             Codegen.emit(
@@ -207,6 +628,10 @@ def munch_expression(expNode: IRT.Expression) -> Temp.Temp:
             return temp
 
         elif expNode.operator in (IRT.BinaryOperator.mul, IRT.BinaryOperator.div):
+            reduced = munch_strength_reduced(expNode)
+            if reduced is not None:
+                return reduced
+
             # imul S :  RDX:RAX <--- S * RAX
             # In this implementation, we switch left and right operands, since
             # multiplication is commutative.
@@ -285,6 +710,20 @@ def munch_expression(expNode: IRT.Expression) -> Temp.Temp:
     # Memory(addr): The contents of 'Frame.word_size' bytes of memory, starting at address addr.
     elif isinstance(expNode, IRT.Memory):
         temp = Temp.TempManager.new_temp()
+        # Memory(e + const): reads at a displacement from the value of 'e'.
+        displacement = displacement_address(expNode.expression)
+        if displacement is not None:
+            base, offset = displacement
+            Codegen.emit(
+                Assembly.Operation(
+                    line=f"movq {offset}(%'s0), %'d0\n",
+                    source=[munch_expression(base)],
+                    destination=[temp],
+                    jump=None,
+                )
+            )
+            return temp
+
         Codegen.emit(
             # This is an Operation and not a Move, since it should not be deleted if src and
             # dst are the same (they're not really the same, the source is a memory location).
@@ -343,21 +782,21 @@ def munch_expression(expNode: IRT.Expression) -> Temp.Temp:
         ]
 
         if isinstance(expNode.function, IRT.Name):
-            # Reserve space in the stack for extra arguments.
-            rsp = Frame.TempMap.register_to_temp["rsp"]
-            stack_arguments_size = Frame.word_size * (
-                len(expNode.arguments) - len(Frame.argument_registers)
-            )
-            if stack_arguments_size > 0:
-                Codegen.emit(
-                    Assembly.Operation(
-                        line=f"subq ${stack_arguments_size}, %'d0\n",
-                        source=[rsp],
-                        destination=[rsp],
-                        jump=None,
-                    )
-                )
-
+            # Calls to intrinsic functions are expanded inline, so they do not clobber
+            # any register.
+            if Intrinsics.lookup(expNode.function.label) is not None:
+                arguments = [
+                    munch_expression(argument) for argument in expNode.arguments
+                ]
+                result = Temp.TempManager.new_temp()
+                instructions = intrinsic_instructions[expNode.function.label]
+                for instruction in instructions(arguments, result):
+                    Codegen.emit(instruction)
+                return result
+
+            # The extra arguments are stored in the outgoing arguments area of the
+            # frame, which is reserved once in the prologue.
+            Codegen.frame.reserve_outgoing_arguments(len(expNode.arguments))
             Codegen.emit(
                 Assembly.Operation(
                     line=f"call {expNode.function.label}\n",
@@ -367,17 +806,6 @@ def munch_expression(expNode: IRT.Expression) -> Temp.Temp:
                 )
             )
 
-            # Restore the stack pointer (deallocate the space reserved earlier).
-            if stack_arguments_size > 0:
-                Codegen.emit(
-                    Assembly.Operation(
-                        line=f"addq ${stack_arguments_size}, %'d0\n",
-                        source=[rsp],
-                        destination=[rsp],
-                        jump=None,
-                    )
-                )
-
         else:
             raise Exception("Found a IRT.Call where function is not an IRT.Name.")
 
@@ -394,13 +822,18 @@ def munch_expression(expNode: IRT.Expression) -> Temp.Temp:
 
 class Codegen(ABC):
     instruction_list = []
+    # Frame of the function whose body is being munched.
+    frame: Frame.Frame = None
 
     @classmethod
     def emit(cls, instruction: Assembly.Instruction) -> None:
         cls.instruction_list.append(instruction)
 
     @classmethod
-    def codegen(cls, statement_list: List[IRT.Statement]) -> List[Assembly.Instruction]:
+    def codegen(
+        cls, frame: Frame.Frame, statement_list: List[IRT.Statement]
+    ) -> List[Assembly.Instruction]:
+        cls.frame = frame
         for statement in statement_list:
             munch_statement(statement)
         instruction_list_copy = cls.instruction_list
@@ -0,0 +1,71 @@
+from abc import ABC
+from typing import Dict, List, Set
+
+from dataclasses import dataclass
+
+from activation_records.temp import TempLabel
+from intermediate_representation.level import RealLevel
+from intermediate_representation.tree import Move
+
+
+# Body of a translated function before the view shift is added, together with the level
+# it was translated in.
+@dataclass
+class FunctionBody:
+    level: RealLevel
+    body: Move
+
+
+# Call graph of the Tiger functions of the program, built during the translation.
+# Calls to the standard library are not recorded. The bodies of the functions can be
+# replaced by optimizations, but the calls are always the ones found while translating.
+class CallGraph(ABC):
+    # Dictionary mapping each function to the functions it calls.
+    calls: Dict[TempLabel, Set[TempLabel]] = {}
+    # Dictionary mapping each function to its translated body.
+    functions: Dict[TempLabel, FunctionBody] = {}
+    # Function labels in the order in which their translation was finished.
+    function_order: List[TempLabel] = []
+
+    @classmethod
+    def initialize(cls):
+        cls.calls = {}
+        cls.functions = {}
+        cls.function_order = []
+
+    @classmethod
+    def add_call(cls, caller: TempLabel, callee: TempLabel):
+        cls.calls.setdefault(caller, set()).add(callee)
+
+    @classmethod
+    def add_function(cls, level: RealLevel, body: Move):
+        cls.functions[level.name] = FunctionBody(level, body)
+        cls.function_order.append(level.name)
+
+    # Removes every function but the given ones.
+    @classmethod
+    def keep_functions(cls, functions: Set[TempLabel]):
+        cls.functions = {
+            function: body
+            for function, body in cls.functions.items()
+            if function in functions
+        }
+        cls.function_order = [f for f in cls.function_order if f in functions]
+
+    @classmethod
+    def callees(cls, function: TempLabel) -> Set[TempLabel]:
+        return cls.calls.get(function, set())
+
+    # A function is recursive if it can reach itself through the call graph.
+    @classmethod
+    def is_recursive(cls, function: TempLabel) -> bool:
+        visited = set()
+        pending = list(cls.callees(function))
+        while pending:
+            callee = pending.pop()
+            if callee == function:
+                return True
+            if callee not in visited:
+                visited.add(callee)
+                pending.extend(cls.callees(callee))
+        return False
@@ -1,8 +1,10 @@
-from typing import Union
+from typing import Dict, List, Optional, Set, Union
 
+import dataclasses
 from dataclasses import dataclass
 
 import parser.ast_nodes as ast
+from activation_records.frame import argument_registers
 from semantic_analysis.table import SymbolTable
 
 
@@ -141,3 +143,411 @@ def traverse_variable(
 
     else:
         raise EscapeError("Unknown variable kind for escape finding", variable.position)
+
+
+# Heap object escape analysis, which finds the records and the small arrays of constant
+# size that never leave the function that creates them. That is the case for the value
+# of a variable declaration that is only used to access its fields or its elements, and
+# only by the function where it is declared: the variable is never read as a value (so
+# the object can not be stored, passed, returned or compared) nor assigned. The fields
+# of those records are kept in variables of their own, and those arrays are allocated
+# in the frame.
+
+# Maximum amount of elements of an array allocated in the frame.
+max_frame_array_size = 16
+
+
+@dataclass
+class AllocationEntry:
+    depth: int
+    # Declaration of the variable, if its value may be allocated in the function.
+    declaration: Optional[ast.VariableDec]
+
+
+def find_local_allocations(expression: ast.Expression):
+    traverse_allocation_expression(SymbolTable[AllocationEntry](), 0, expression)
+
+
+def is_local_allocation_candidate(expression: ast.Expression) -> bool:
+    if isinstance(expression, ast.RecordExp):
+        return True
+    return (
+        isinstance(expression, ast.ArrayExp)
+        and isinstance(expression.size, ast.IntExp)
+        and 0 < expression.size.int <= max_frame_array_size
+    )
+
+
+def traverse_allocation_expression(
+    allocation_env: SymbolTable[AllocationEntry],
+    depth: int,
+    expression: ast.Expression,
+):
+    if isinstance(
+        expression, (ast.NilExp, ast.IntExp, ast.StringExp, ast.BreakExp, ast.EmptyExp)
+    ):
+        return
+
+    elif isinstance(expression, ast.VarExp):
+        traverse_allocation_variable(allocation_env, depth, expression.var, False)
+
+    elif isinstance(expression, ast.CallExp):
+        for argument_expression in expression.args:
+            traverse_allocation_expression(allocation_env, depth, argument_expression)
+
+    elif isinstance(expression, ast.OpExp):
+        traverse_allocation_expression(allocation_env, depth, expression.left)
+        traverse_allocation_expression(allocation_env, depth, expression.right)
+
+    elif isinstance(expression, ast.RecordExp):
+        for record_field in expression.fields:
+            traverse_allocation_expression(allocation_env, depth, record_field.exp)
+
+    elif isinstance(expression, ast.SeqExp):
+        for sequence_expression in expression.seq:
+            traverse_allocation_expression(allocation_env, depth, sequence_expression)
+
+    elif isinstance(expression, ast.AssignExp):
+        traverse_allocation_variable(allocation_env, depth, expression.var, False)
+        traverse_allocation_expression(allocation_env, depth, expression.exp)
+
+    elif isinstance(expression, ast.IfExp):
+        traverse_allocation_expression(allocation_env, depth, expression.test)
+        traverse_allocation_expression(allocation_env, depth, expression.then_do)
+        if expression.else_do is not None:
+            traverse_allocation_expression(allocation_env, depth, expression.else_do)
+
+    elif isinstance(expression, ast.WhileExp):
+        traverse_allocation_expression(allocation_env, depth, expression.test)
+        traverse_allocation_expression(allocation_env, depth, expression.body)
+
+    elif isinstance(expression, ast.ForExp):
+        traverse_allocation_expression(allocation_env, depth, expression.lo)
+        traverse_allocation_expression(allocation_env, depth, expression.hi)
+        allocation_env.begin_scope()
+        allocation_env.add(expression.var, AllocationEntry(depth, None))
+        traverse_allocation_expression(allocation_env, depth, expression.body)
+        allocation_env.end_scope()
+
+    elif isinstance(expression, ast.LetExp):
+        allocation_env.begin_scope()
+        for declaration in expression.decs.declaration_list:
+            traverse_allocation_declaration(allocation_env, depth, declaration)
+        traverse_allocation_expression(allocation_env, depth, expression.body)
+        allocation_env.end_scope()
+
+    elif isinstance(expression, ast.ArrayExp):
+        traverse_allocation_expression(allocation_env, depth, expression.size)
+        traverse_allocation_expression(allocation_env, depth, expression.init)
+
+    else:
+        raise EscapeError(
+            "Unknown expression kind for allocation escape finding",
+            expression.position,
+        )
+
+
+def traverse_allocation_declaration(
+    allocation_env: SymbolTable[AllocationEntry],
+    depth: int,
+    declaration: ast.Declaration,
+):
+    if isinstance(declaration, ast.TypeDecBlock):
+        return
+
+    elif isinstance(declaration, ast.VariableDec):
+        traverse_allocation_expression(allocation_env, depth, declaration.exp)
+        declaration.local_allocation = is_local_allocation_candidate(declaration.exp)
+        allocation_env.add(
+            declaration.name,
+            AllocationEntry(
+                depth, declaration if declaration.local_allocation else None
+            ),
+        )
+
+    elif isinstance(declaration, ast.FunctionDecBlock):
+        # Functions hide the variables with their names.
+        for function_declaration in declaration.function_dec_list:
+            allocation_env.add(function_declaration.name, AllocationEntry(depth, None))
+        for function_declaration in declaration.function_dec_list:
+            allocation_env.begin_scope()
+            for parameter in function_declaration.params:
+                allocation_env.add(parameter.name, AllocationEntry(depth + 1, None))
+            traverse_allocation_expression(
+                allocation_env, depth + 1, function_declaration.body
+            )
+            allocation_env.end_scope()
+
+    else:
+        raise EscapeError(
+            "Unknown declaration kind for allocation escape finding",
+            declaration.position,
+        )
+
+
+# The object of a variable leaves the function unless the variable is only used to
+# access its fields or elements ('accessed') from the function where it is declared.
+def traverse_allocation_variable(
+    allocation_env: SymbolTable[AllocationEntry],
+    depth: int,
+    variable: ast.Variable,
+    accessed: bool,
+):
+    if isinstance(variable, ast.SimpleVar):
+        allocation_entry = allocation_env.find(variable.sym)
+        if allocation_entry is None or allocation_entry.declaration is None:
+            return
+        if not accessed or allocation_entry.depth != depth:
+            allocation_entry.declaration.local_allocation = False
+
+    elif isinstance(variable, ast.FieldVar):
+        traverse_allocation_variable(allocation_env, depth, variable.var, True)
+
+    elif isinstance(variable, ast.SubscriptVar):
+        traverse_allocation_variable(allocation_env, depth, variable.var, True)
+        traverse_allocation_expression(allocation_env, depth, variable.exp)
+
+    else:
+        raise EscapeError(
+            "Unknown variable kind for allocation escape finding", variable.position
+        )
+
+
+# Free variable analysis, which decides which functions need a static link. A function
+# needs one when it reaches the frame of an enclosing function, either to access one of
+# its variables, to pass a static link to a function declared outside of it, or because
+# a function nested in it does so through its static link.
+# A function that only reads a few variables of enclosing functions is lambda lifted
+# instead: the values of those variables are passed to it as extra arguments, which is
+# correct because neither the function nor anything it calls can modify them.
+
+# Maximum amount of variables passed as extra arguments to a lifted function.
+max_lifted_variables = 3
+
+
+@dataclass
+class VariableUsage:
+    depth: int
+
+
+# Uses of the enclosing functions' frames made directly by the body of a function.
+@dataclass(eq=False)
+class FunctionUsage:
+    declaration: Optional[ast.FunctionDec]
+    # Depth of the function's body, where its parameters are declared.
+    depth: int
+    # Dictionary mapping the variables of enclosing functions read by the function to
+    # the depth where they are declared.
+    outer_reads: Dict[str, int] = dataclasses.field(default_factory=dict)
+    # Depths of the variables of enclosing functions assigned by the function.
+    outer_writes: List[int] = dataclasses.field(default_factory=list)
+    calls: List["FunctionUsage"] = dataclasses.field(default_factory=list)
+    nested_functions: List["FunctionUsage"] = dataclasses.field(default_factory=list)
+
+
+def find_free_variables(expression: ast.Expression):
+    program = FunctionUsage(None, 0)
+    usage_env = SymbolTable[Union[VariableUsage, FunctionUsage]]()
+    collect_expression_usage(usage_env, program, expression)
+    resolve_static_links(nested_functions(program))
+
+
+def nested_functions(function: FunctionUsage) -> List[FunctionUsage]:
+    result = []
+    for nested_function in function.nested_functions:
+        result.append(nested_function)
+        result += nested_functions(nested_function)
+    return result
+
+
+# Decides which functions are lifted, by discarding the ones that need their static link
+# for something other than reading variables until the decision is stable.
+def resolve_static_links(functions: List[FunctionUsage]):
+    lifted = {function for function in functions if can_lift(function)}
+    while True:
+        reach = static_link_reach(functions, lifted)
+        discarded = {
+            function for function in lifted if reach[function] < function.depth
+        }
+        if not discarded:
+            break
+        lifted -= discarded
+
+    for function in functions:
+        function.declaration.static_link = reach[function] < function.depth
+        function.declaration.lifted_variables = []
+        if function in lifted:
+            function.declaration.lifted_variables = sorted(function.outer_reads)
+
+
+def can_lift(function: FunctionUsage) -> bool:
+    lifted_amount = len(function.outer_reads)
+    argument_amount = len(function.declaration.params) + lifted_amount
+    fits_in_registers = argument_amount <= len(argument_registers)
+    return lifted_amount <= max_lifted_variables and fits_in_registers
+
+
+# Computes the depth of the outermost frame that each function reaches through its
+# static link, which is the depth of its own body if it needs no static link. The
+# depths only decrease, so the loop ends once none of them changes.
+def static_link_reach(
+    functions: List[FunctionUsage], lifted: Set[FunctionUsage]
+) -> Dict[FunctionUsage, int]:
+    reach = {function: function.depth for function in functions}
+    changed = True
+    while changed:
+        changed = False
+        for function in functions:
+            depths = [reach[function]] + function.outer_writes
+            if function not in lifted:
+                depths += function.outer_reads.values()
+            for called_function in function.calls:
+                if called_function in lifted:
+                    # A recursive call passes along the values it received.
+                    if called_function is not function:
+                        depths += called_function.outer_reads.values()
+                elif reach[called_function] < called_function.depth:
+                    # The static link is the frame where the function is declared.
+                    depths.append(called_function.depth - 1)
+            depths += [reach[nested] for nested in function.nested_functions]
+            if min(depths) < reach[function]:
+                reach[function] = min(depths)
+                changed = True
+    return reach
+
+
+def collect_expression_usage(
+    usage_env: SymbolTable[Union[VariableUsage, FunctionUsage]],
+    function: FunctionUsage,
+    expression: ast.Expression,
+):
+    if isinstance(
+        expression, (ast.NilExp, ast.IntExp, ast.StringExp, ast.BreakExp, ast.EmptyExp)
+    ):
+        return
+
+    elif isinstance(expression, ast.VarExp):
+        collect_variable_usage(usage_env, function, expression.var)
+
+    elif isinstance(expression, ast.CallExp):
+        called_function = usage_env.find(expression.func)
+        if isinstance(called_function, FunctionUsage):
+            function.calls.append(called_function)
+        for argument_expression in expression.args:
+            collect_expression_usage(usage_env, function, argument_expression)
+
+    elif isinstance(expression, ast.OpExp):
+        collect_expression_usage(usage_env, function, expression.left)
+        collect_expression_usage(usage_env, function, expression.right)
+
+    elif isinstance(expression, ast.RecordExp):
+        for record_field in expression.fields:
+            collect_expression_usage(usage_env, function, record_field.exp)
+
+    elif isinstance(expression, ast.SeqExp):
+        for sequence_expression in expression.seq:
+            collect_expression_usage(usage_env, function, sequence_expression)
+
+    elif isinstance(expression, ast.AssignExp):
+        if isinstance(expression.var, ast.SimpleVar):
+            variable = usage_env.find(expression.var.sym)
+            if isinstance(variable, VariableUsage) and variable.depth < function.depth:
+                function.outer_writes.append(variable.depth)
+        else:
+            collect_variable_usage(usage_env, function, expression.var)
+        collect_expression_usage(usage_env, function, expression.exp)
+
+    elif isinstance(expression, ast.IfExp):
+        collect_expression_usage(usage_env, function, expression.test)
+        collect_expression_usage(usage_env, function, expression.then_do)
+        if expression.else_do is not None:
+            collect_expression_usage(usage_env, function, expression.else_do)
+
+    elif isinstance(expression, ast.WhileExp):
+        collect_expression_usage(usage_env, function, expression.test)
+        collect_expression_usage(usage_env, function, expression.body)
+
+    elif isinstance(expression, ast.ForExp):
+        collect_expression_usage(usage_env, function, expression.lo)
+        collect_expression_usage(usage_env, function, expression.hi)
+        usage_env.begin_scope()
+        usage_env.add(expression.var, VariableUsage(function.depth))
+        collect_expression_usage(usage_env, function, expression.body)
+        usage_env.end_scope()
+
+    elif isinstance(expression, ast.LetExp):
+        usage_env.begin_scope()
+        for declaration in expression.decs.declaration_list:
+            collect_declaration_usage(usage_env, function, declaration)
+        collect_expression_usage(usage_env, function, expression.body)
+        usage_env.end_scope()
+
+    elif isinstance(expression, ast.ArrayExp):
+        collect_expression_usage(usage_env, function, expression.size)
+        collect_expression_usage(usage_env, function, expression.init)
+
+    else:
+        raise EscapeError(
+            "Unknown expression kind for free variable finding", expression.position
+        )
+
+
+def collect_declaration_usage(
+    usage_env: SymbolTable[Union[VariableUsage, FunctionUsage]],
+    function: FunctionUsage,
+    declaration: ast.Declaration,
+):
+    if isinstance(declaration, ast.TypeDecBlock):
+        return
+
+    elif isinstance(declaration, ast.VariableDec):
+        collect_expression_usage(usage_env, function, declaration.exp)
+        usage_env.add(declaration.name, VariableUsage(function.depth))
+
+    elif isinstance(declaration, ast.FunctionDecBlock):
+        # Every function of the block is visible from the bodies of the others.
+        block_functions = []
+        for function_declaration in declaration.function_dec_list:
+            nested_function = FunctionUsage(function_declaration, function.depth + 1)
+            function.nested_functions.append(nested_function)
+            block_functions.append(nested_function)
+            usage_env.add(function_declaration.name, nested_function)
+        for nested_function in block_functions:
+            usage_env.begin_scope()
+            for parameter in nested_function.declaration.params:
+                usage_env.add(parameter.name, VariableUsage(nested_function.depth))
+            collect_expression_usage(
+                usage_env, nested_function, nested_function.declaration.body
+            )
+            usage_env.end_scope()
+
+    else:
+        raise EscapeError(
+            "Unknown declaration kind for free variable finding", declaration.position
+        )
+
+
+def collect_variable_usage(
+    usage_env: SymbolTable[Union[VariableUsage, FunctionUsage]],
+    function: FunctionUsage,
+    variable: ast.Variable,
+):
+    if isinstance(variable, ast.SimpleVar):
+        variable_usage = usage_env.find(variable.sym)
+        if (
+            isinstance(variable_usage, VariableUsage)
+            and variable_usage.depth < function.depth
+        ):
+            function.outer_reads[variable.sym] = variable_usage.depth
+
+    elif isinstance(variable, ast.FieldVar):
+        collect_variable_usage(usage_env, function, variable.var)
+
+    elif isinstance(variable, ast.SubscriptVar):
+        collect_variable_usage(usage_env, function, variable.var)
+        collect_expression_usage(usage_env, function, variable.exp)
+
+    else:
+        raise EscapeError(
+            "Unknown variable kind for free variable finding", variable.position
+        )
@@ -0,0 +1,347 @@
+from typing import Dict, List, Optional, Set, Union
+
+import activation_records.frame as frame
+from activation_records.temp import Temp, TempLabel, TempManager
+from canonical.profile import Profile
+from intermediate_representation.call_graph import CallGraph
+from intermediate_representation.translate import update_process_fragments
+from intermediate_representation.tree import (
+    Statement,
+    Expression,
+    Sequence,
+    Label,
+    Jump,
+    ConditionalJump,
+    Move,
+    StatementExpression,
+    BinaryOperator,
+    BinaryOperation,
+    Memory,
+    Temporary,
+    EvaluateSequence,
+    Name,
+    Constant,
+    Call,
+)
+
+# Inlining of small non-recursive Tiger functions at the intermediate representation level.
+# A call is replaced by the body of the called function, where every temporary and label
+# gets a fresh copy and the parameters are moved from the arguments into their new
+# temporaries. Functions whose frame is only accessed through slots of the form
+# Memory(frame pointer + constant) (i.e. its escaping variables and the static link) can
+# have each of those slots replaced by a temporary, so the inlined body needs no frame
+# of its own. A function whose frame pointer is used in any other way, for example as
+# the static link of a function nested in it, is never inlined. Once the nested functions
+# it calls are inlined into it, though, its frame pointer is only used through slots.
+
+# Maximum size, in tree nodes, of a function body for it to be inlined.
+default_size_budget = 60
+
+# With a profile, functions that were never called are not inlined, and the ones called
+# at least a tenth as many times as the most called function get a bigger size budget.
+hot_function_ratio = 10
+hot_size_budget_factor = 4
+
+Tree = Union[Statement, Expression]
+
+
+# Inlines every call to a small non-recursive function in the program's fragments, and
+# removes the fragments of the functions that are no longer called.
+def inline_functions(size_budget: int = default_size_budget):
+    inliner = Inliner(size_budget)
+    bodies = {
+        function: inliner.inlined_body(function)
+        for function in CallGraph.function_order
+    }
+    for function, body in bodies.items():
+        CallGraph.functions[function].body = body
+    CallGraph.keep_functions(reachable_functions(bodies))
+    update_process_fragments()
+
+
+class Inliner:
+    def __init__(self, size_budget: int):
+        self.size_budget = size_budget
+        function_counts = [
+            Profile.function_count(function) or 0 for function in CallGraph.functions
+        ]
+        self.hottest_count = max(function_counts, default=0)
+        # Dictionary mapping each function to its body after inlining its calls.
+        self.bodies: Dict[TempLabel, Move] = {}
+        # Temporaries holding the static link of an inlined copy, which are only
+        # assigned once, before the copy.
+        self.static_links: Set[Temp] = set()
+
+    # Returns the body of the function with its calls inlined. The body of a
+    # non-recursive function only depends on the ones of other non-recursive functions,
+    # so the recursion always ends.
+    def inlined_body(self, function: TempLabel) -> Move:
+        if function not in self.bodies:
+            body = CallGraph.functions[function].body
+            self.bodies[function] = Move(
+                body.temporary, self.inline_expression(body.expression)
+            )
+        return self.bodies[function]
+
+    def can_inline(self, function: TempLabel) -> bool:
+        if function not in CallGraph.functions or CallGraph.is_recursive(function):
+            return False
+        body = self.inlined_body(function).expression
+        return tree_size(body) <= self.function_budget(function) and (
+            only_uses_frame_slots(body)
+        )
+
+    def function_budget(self, function: TempLabel) -> int:
+        count = Profile.function_count(function)
+        if count is None:
+            return self.size_budget
+        if count == 0:
+            return 0
+        if count * hot_function_ratio >= self.hottest_count:
+            return self.size_budget * hot_size_budget_factor
+        return self.size_budget
+
+    def inline_statement(self, statement: Statement) -> Statement:
+        if isinstance(statement, Sequence):
+            return Sequence([self.inline_statement(s) for s in statement.sequence])
+        if isinstance(statement, ConditionalJump):
+            return ConditionalJump(
+                statement.operator,
+                self.inline_expression(statement.left),
+                self.inline_expression(statement.right),
+                statement.true,
+                statement.false,
+            )
+        if isinstance(statement, Move):
+            return Move(
+                self.inline_expression(statement.temporary),
+                self.inline_expression(statement.expression),
+            )
+        if isinstance(statement, StatementExpression):
+            return StatementExpression(self.inline_expression(statement.expression))
+        return statement
+
+    def inline_expression(self, expression: Expression) -> Expression:
+        if isinstance(expression, BinaryOperation):
+            return BinaryOperation(
+                expression.operator,
+                self.inline_expression(expression.left),
+                self.inline_expression(expression.right),
+            )
+        if isinstance(expression, Memory):
+            return Memory(
+                self.inline_expression(expression.expression), expression.pointer
+            )
+        if isinstance(expression, EvaluateSequence):
+            return EvaluateSequence(
+                self.inline_statement(expression.statement),
+                self.inline_expression(expression.expression),
+            )
+        if isinstance(expression, Call):
+            arguments = [self.inline_expression(a) for a in expression.arguments]
+            function = expression.function
+            if isinstance(function, Name) and self.can_inline(function.label):
+                return self.inline_call(function.label, arguments)
+            return Call(function, arguments, expression.pointer)
+        return expression
+
+    # Builds a copy of the function's body that first moves the arguments (including
+    # the static link) into the copies of the parameters. When the static link is the
+    # caller's own frame pointer, the copy uses the frame pointer directly instead, so
+    # the variables of the caller it accesses stay slots of the caller's frame and are
+    # not aliased by a temporary holding the same address.
+    def inline_call(
+        self, function: TempLabel, arguments: List[Expression]
+    ) -> Expression:
+        level = CallGraph.functions[function].level
+        formal_parameters = level.frame.formal_parameters
+        renamer = Renamer(self.static_links)
+        if level.has_static_link:
+            if arguments[0] == Temporary(frame.frame_pointer()):
+                renamer.alias_frame_pointer(formal_parameters[0])
+                formal_parameters, arguments = formal_parameters[1:], arguments[1:]
+            else:
+                static_link = renamer.access_expression(formal_parameters[0])
+                self.static_links.add(static_link.temporary)
+        parameter_moves = [
+            Move(renamer.access_expression(access), argument)
+            for access, argument in zip(formal_parameters, arguments)
+        ]
+        body = renamer.rename_expression(self.inlined_body(function).expression)
+        return EvaluateSequence(Sequence(parameter_moves), body)
+
+
+# Copies a function body with fresh temporaries and labels, replacing its frame slots
+# with temporaries. The copies of the temporaries and slots that hold pointers hold
+# pointers too. A static link of an inlined copy that turns out to be the frame pointer
+# is replaced by the frame pointer itself, so that the accesses through it are seen as
+# frame slots.
+class Renamer:
+    def __init__(self, static_links: Set[Temp]):
+        self.static_links = static_links
+        self.temps: Dict[Temp, Temp] = {}
+        self.slots: Dict[int, Temp] = {}
+        self.labels: Dict[TempLabel, TempLabel] = {}
+
+    def temp(self, temp: Temp) -> Temp:
+        if temp in frame.TempMap.register_to_temp.values():
+            return temp
+        if temp not in self.temps:
+            self.temps[temp] = TempManager.new_temp(TempManager.is_pointer(temp))
+            if temp in self.static_links:
+                self.static_links.add(self.temps[temp])
+        return self.temps[temp]
+
+    def slot(self, offset: int, pointer: bool) -> Temp:
+        if offset not in self.slots:
+            self.slots[offset] = TempManager.new_temp(pointer)
+        return self.slots[offset]
+
+    def label(self, label: TempLabel) -> TempLabel:
+        if label not in self.labels:
+            self.labels[label] = TempManager.new_label()
+            Profile.record_copy(self.labels[label], label)
+        return self.labels[label]
+
+    # Makes every use of the parameter refer to the frame pointer itself.
+    def alias_frame_pointer(self, access: frame.Access):
+        if isinstance(access, frame.InFrame):
+            self.slots[access.offset] = frame.frame_pointer()
+        else:
+            self.temps[access.register] = frame.frame_pointer()
+
+    def access_expression(self, access: frame.Access) -> Expression:
+        if isinstance(access, frame.InFrame):
+            return Temporary(self.slot(access.offset, access.pointer))
+        return Temporary(self.temp(access.register))
+
+    def rename_statement(self, statement: Statement) -> Statement:
+        if isinstance(statement, Sequence):
+            return Sequence([self.rename_statement(s) for s in statement.sequence])
+        if isinstance(statement, Label):
+            return Label(self.label(statement.label))
+        if isinstance(statement, Jump):
+            labels = [self.label(label) for label in statement.labels]
+            return Jump(Name(labels[0]), labels)
+        if isinstance(statement, ConditionalJump):
+            return ConditionalJump(
+                statement.operator,
+                self.rename_expression(statement.left),
+                self.rename_expression(statement.right),
+                self.label(statement.true),
+                self.label(statement.false),
+            )
+        if isinstance(statement, Move):
+            expression = self.rename_expression(statement.expression)
+            if (
+                isinstance(statement.temporary, Temporary)
+                and statement.temporary.temporary in self.static_links
+                and statement.temporary.temporary not in self.temps
+                and expression == Temporary(frame.frame_pointer())
+            ):
+                self.temps[statement.temporary.temporary] = frame.frame_pointer()
+                return Sequence([])
+            return Move(self.rename_expression(statement.temporary), expression)
+        if isinstance(statement, StatementExpression):
+            return StatementExpression(self.rename_expression(statement.expression))
+        return statement
+
+    def rename_expression(self, expression: Expression) -> Expression:
+        offset = frame_slot_offset(expression)
+        if offset is not None:
+            return Temporary(self.slot(offset, expression.pointer))
+        if isinstance(expression, Temporary):
+            return Temporary(self.temp(expression.temporary))
+        if isinstance(expression, BinaryOperation):
+            return BinaryOperation(
+                expression.operator,
+                self.rename_expression(expression.left),
+                self.rename_expression(expression.right),
+            )
+        if isinstance(expression, Memory):
+            return Memory(
+                self.rename_expression(expression.expression), expression.pointer
+            )
+        if isinstance(expression, EvaluateSequence):
+            return EvaluateSequence(
+                self.rename_statement(expression.statement),
+                self.rename_expression(expression.expression),
+            )
+        if isinstance(expression, Call):
+            return Call(
+                expression.function,
+                [self.rename_expression(a) for a in expression.arguments],
+                expression.pointer,
+            )
+        return expression
+
+
+# Returns the offset of an access to a slot of the current frame, or None if the
+# expression is not of the form Memory(frame pointer + constant).
+def frame_slot_offset(expression: Expression) -> Optional[int]:
+    if isinstance(expression, Memory):
+        address = expression.expression
+        if (
+            isinstance(address, BinaryOperation)
+            and address.operator == BinaryOperator.plus
+            and isinstance(address.left, Temporary)
+            and address.left.temporary == frame.frame_pointer()
+            and isinstance(address.right, Constant)
+        ):
+            return address.right.value
+    return None
+
+
+def subtrees(tree: Tree) -> List[Tree]:
+    if isinstance(tree, Sequence):
+        return tree.sequence
+    if isinstance(tree, ConditionalJump):
+        return [tree.left, tree.right]
+    if isinstance(tree, Move):
+        return [tree.temporary, tree.expression]
+    if isinstance(tree, (StatementExpression, Memory)):
+        return [tree.expression]
+    if isinstance(tree, BinaryOperation):
+        return [tree.left, tree.right]
+    if isinstance(tree, EvaluateSequence):
+        return [tree.statement, tree.expression]
+    if isinstance(tree, Call):
+        return [tree.function] + tree.arguments
+    return []
+
+
+def tree_size(tree: Tree) -> int:
+    return 1 + sum(tree_size(subtree) for subtree in subtrees(tree))
+
+
+def only_uses_frame_slots(tree: Tree) -> bool:
+    if frame_slot_offset(tree) is not None:
+        return True
+    if isinstance(tree, Temporary):
+        return tree.temporary != frame.frame_pointer()
+    return all(only_uses_frame_slots(subtree) for subtree in subtrees(tree))
+
+
+def called_functions(tree: Tree) -> Set[TempLabel]:
+    result = set()
+    if isinstance(tree, Call) and isinstance(tree.function, Name):
+        result.add(tree.function.label)
+    for subtree in subtrees(tree):
+        result |= called_functions(subtree)
+    return result
+
+
+# Functions that can still be called starting from the main program.
+def reachable_functions(bodies: Dict[TempLabel, Move]) -> Set[TempLabel]:
+    reachable = set()
+    pending = [CallGraph.function_order[-1]]
+    while pending:
+        function = pending.pop()
+        if function not in reachable:
+            reachable.add(function)
+            pending.extend(
+                callee
+                for callee in called_functions(bodies[function])
+                if callee in bodies
+            )
+    return reachable
@@ -0,0 +1,51 @@
+from abc import ABC
+from typing import Callable, Dict, List, Optional
+
+from dataclasses import dataclass
+
+from activation_records.temp import TempLabel
+from intermediate_representation.tree import (
+    Expression,
+    Constant,
+    ConditionalJump,
+    RelationalOperator,
+)
+
+# Functions of the standard library that are simple enough to be computed by a few
+# instructions instead of a call to the runtime, which would clobber every caller-saved
+# register. Calls to them are still translated as calls to the external function, so
+# the rest of the compiler handles them like any other call, but the code generator
+# expands them inline (see intrinsic_instructions in instruction_selection.codegen).
+
+
+@dataclass
+class Intrinsic:
+    # Result of a call whose arguments are all constants, if it can be known.
+    fold: Optional[Callable[[List[int]], int]] = None
+    # Conditional jump taken when the result of a call is not zero, for calls used as
+    # the condition of an if or a loop.
+    condition: Optional[Callable[[List[Expression]], ConditionalJump]] = None
+
+
+class Intrinsics(ABC):
+    enabled = True
+    table: Dict[TempLabel, Intrinsic] = {
+        "not": Intrinsic(
+            fold=lambda arguments: int(arguments[0] == 0),
+            condition=lambda arguments: ConditionalJump(
+                RelationalOperator.eq, arguments[0], Constant(0)
+            ),
+        ),
+        "char_to_num": Intrinsic(),
+        "string_length": Intrinsic(),
+    }
+
+    @classmethod
+    def initialize(cls, enabled: bool = True):
+        cls.enabled = enabled
+
+    @classmethod
+    def lookup(cls, function: TempLabel) -> Optional[Intrinsic]:
+        if not cls.enabled:
+            return None
+        return cls.table.get(function)
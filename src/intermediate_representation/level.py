@@ -1,5 +1,5 @@
 from abc import ABC
-from typing import List
+from typing import List, Optional
 
 from dataclasses import dataclass
 
@@ -18,20 +18,57 @@ class Access:
 
 
 class RealLevel(Level):
-    def __init__(self, parent: Level, name: TempLabel, formals: List[bool]):
+    def __init__(
+        self,
+        parent: Level,
+        name: TempLabel,
+        formals: List[bool],
+        has_static_link: bool = True,
+        formal_pointers: Optional[List[bool]] = None,
+    ):
         self.parent = parent
         self.name = name
-        self.frame = frame.Frame(name, [True] + formals)
+        self.has_static_link = has_static_link
+        if formal_pointers is None:
+            formal_pointers = [False for _ in formals]
+        # The static link is the address of a frame, which is never moved.
+        self.frame = frame.Frame(
+            name,
+            [True] + formals if has_static_link else formals,
+            [False] + formal_pointers if has_static_link else formal_pointers,
+        )
+        # Accesses of the variables of enclosing functions that are passed as the last
+        # arguments of the function when it is lambda lifted.
+        self.lifted_variables: List[Access] = []
 
     def formals(self) -> List[Access]:
-        """Returns the access of all formals, including the static link."""
+        """Returns the access of all formals, including the static link if any."""
 
         return [
             Access(self, frame_access) for frame_access in self.frame.formal_parameters
         ]
 
-    def alloc_local(self, escape: bool) -> Access:
-        return Access(self, self.frame.alloc_local(escape))
+    def static_link(self) -> Access:
+        return self.formals()[0]
+
+    def parameters(self) -> List[Access]:
+        """Returns the access of all formals but the static link."""
+
+        if self.has_static_link:
+            return self.formals()[1:]
+        return self.formals()
+
+    def lifted_parameters(self) -> List[Access]:
+        """Returns the access of the formals that receive the lifted variables."""
+
+        parameters = self.parameters()
+        return parameters[len(parameters) - len(self.lifted_variables) :]
+
+    def alloc_local(self, escape: bool, pointer: bool = False) -> Access:
+        return Access(self, self.frame.alloc_local(escape, pointer))
+
+    def alloc_array(self, size: int, pointer: bool = False) -> int:
+        return self.frame.alloc_array(size, pointer)
 
 
 class OutermostLevel(Level):
@@ -42,4 +79,4 @@ outermost_level = OutermostLevel()
 
 
 def base_program_level() -> RealLevel:
-    return RealLevel(outermost_level, "tigermain", [])
+    return RealLevel(outermost_level, "tigermain", [], has_static_link=False)
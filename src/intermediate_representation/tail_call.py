@@ -0,0 +1,151 @@
+from typing import List, Optional
+
+import activation_records.frame as frame
+from activation_records.temp import TempLabel, TempManager
+from intermediate_representation.call_graph import CallGraph
+from intermediate_representation.level import RealLevel
+from intermediate_representation.translate import update_process_fragments
+from intermediate_representation.tree import (
+    Statement,
+    Expression,
+    Sequence,
+    Label,
+    Jump,
+    Move,
+    Temporary,
+    EvaluateSequence,
+    Name,
+    Constant,
+    Call,
+    TailCall,
+    holds_pointer,
+)
+
+# Optimization of the calls in tail position of the program's functions, that is, the
+# calls whose result is directly the result of the calling function.
+# A call of a function to itself becomes a jump back to the start of its body after
+# assigning the arguments to the parameters, which turns the recursion into a loop.
+# Any other call to a Tiger function becomes a TailCall, which frees the caller's frame
+# before jumping to the called function, as long as every argument fits in the argument
+# registers and the called function is not nested in the caller (since its static link
+# would then point to the freed frame).
+# A call in tail position is replaced by an expression that leaves the function and
+# whose value is never used.
+
+
+def optimize_tail_calls():
+    for function_body in CallGraph.functions.values():
+        function_body.body = TailCallOptimizer(function_body.level).optimize(
+            function_body.body
+        )
+    update_process_fragments()
+
+
+class TailCallOptimizer:
+    def __init__(self, level: RealLevel):
+        self.level = level
+        # Label of the start of the function's body, created with the first self call.
+        self.entry_label: Optional[TempLabel] = None
+
+    def optimize(self, body: Move) -> Move:
+        expression = self.tail_expression(body.expression)
+        if self.entry_label is not None:
+            expression = EvaluateSequence(Label(self.entry_label), expression)
+        return Move(body.temporary, expression)
+
+    # Replaces the calls in tail position of an expression whose value is the result of
+    # the function.
+    def tail_expression(self, expression: Expression) -> Expression:
+        if isinstance(expression, Call) and isinstance(expression.function, Name):
+            function = expression.function.label
+            if function == self.level.name:
+                return self.self_call(expression.arguments)
+            if function in CallGraph.functions and is_frame_independent(
+                function, expression.arguments
+            ):
+                return self.tail_call(expression)
+
+        elif isinstance(expression, EvaluateSequence):
+            return EvaluateSequence(
+                self.tail_statement(expression.statement, expression.expression),
+                self.tail_expression(expression.expression),
+            )
+
+        return expression
+
+    # When the value of an EvaluateSequence is a temporary and its statement ends in a
+    # label (as in the translation of an if expression), a move to that temporary that
+    # is followed by a jump to the final label (or by the final label itself) also
+    # computes the result of the function.
+    def tail_statement(self, statement: Statement, value: Expression) -> Statement:
+        if not (
+            isinstance(value, Temporary)
+            and isinstance(statement, Sequence)
+            and statement.sequence
+            and isinstance(statement.sequence[-1], Label)
+        ):
+            return statement
+
+        statements = statement.sequence
+        final_label = statements[-1].label
+        result = []
+        for index, substatement in enumerate(statements):
+            next_statement = None
+            if index + 1 < len(statements):
+                next_statement = statements[index + 1]
+            if (
+                isinstance(substatement, Move)
+                and substatement.temporary == value
+                and (
+                    next_statement == statements[-1]
+                    or next_statement == Jump(Name(final_label), [final_label])
+                )
+            ):
+                substatement = Move(
+                    substatement.temporary,
+                    self.tail_expression(substatement.expression),
+                )
+            result.append(substatement)
+        return Sequence(result)
+
+    # The arguments are evaluated into new temporaries before assigning any parameter,
+    # since they may use the previous value of the parameters. The static link is the
+    # same one the function already has, so it is not reassigned.
+    def self_call(self, arguments: List[Expression]) -> Expression:
+        if self.entry_label is None:
+            self.entry_label = TempManager.new_label()
+
+        parameters = self.level.parameters()
+        if self.level.has_static_link:
+            arguments = arguments[1:]
+        destinations = [
+            frame.access_to_exp(parameter.access, Temporary(frame.frame_pointer()))
+            for parameter in parameters
+        ]
+        temps = [
+            TempManager.new_temp(holds_pointer(destination))
+            for destination in destinations
+        ]
+        statements = [
+            Move(Temporary(temp), argument) for temp, argument in zip(temps, arguments)
+        ]
+        statements += [
+            Move(destination, Temporary(temp))
+            for destination, temp in zip(destinations, temps)
+        ]
+        statements.append(Jump(Name(self.entry_label), [self.entry_label]))
+        return EvaluateSequence(Sequence(statements), Constant(0))
+
+    def tail_call(self, call: Call) -> Expression:
+        return EvaluateSequence(TailCall(call.function, call.arguments), Constant(0))
+
+
+# Whether the arguments of a call can be passed without keeping the caller's frame:
+# they must all fit in the argument registers, and the static link (if the called
+# function has one) can not be the caller's frame pointer.
+def is_frame_independent(function: TempLabel, arguments: List[Expression]) -> bool:
+    if len(arguments) > len(frame.argument_registers):
+        return False
+    level = CallGraph.functions[function].level
+    static_link = arguments[0] if level.has_static_link else None
+    return static_link != Temporary(frame.frame_pointer())
@@ -3,6 +3,8 @@ from typing import Optional, List
 import parser.ast_nodes as ast
 import activation_records.frame as frame
 from activation_records.temp import TempManager, TempLabel
+from intermediate_representation.call_graph import CallGraph
+from intermediate_representation.intrinsics import Intrinsics
 from intermediate_representation.fragment import (
     StringFragment,
     FragmentManager,
@@ -37,6 +39,7 @@ from intermediate_representation.tree import (
     Memory,
     StatementExpression,
     Call,
+    Statement,
 )
 from semantic_analysis.environment import BaseEnvironmentManager
 
@@ -45,14 +48,15 @@ def simple_variable(access: Access, level: Level) -> TranslatedExpression:
     result = Temporary(frame.frame_pointer())
     current_level = level
     while current_level is not access.level:
-        static_link_access = current_level.formals()[0]
+        static_link_access = current_level.static_link()
         result = frame.access_to_exp(static_link_access.access, result)
         current_level = current_level.parent
     return Expression(frame.access_to_exp(access.access, result))
 
 
+# The field_slot is the position of the field in the record, as given by record_slots.
 def field_variable(
-    variable: TranslatedExpression, field_index: int
+    variable: TranslatedExpression, field_slot: int, pointer: bool = False
 ) -> TranslatedExpression:
     return Expression(
         Memory(
@@ -61,16 +65,19 @@ def field_variable(
                 convert_to_expression(variable),
                 BinaryOperation(
                     BinaryOperator.mul,
-                    Constant(field_index),
+                    Constant(field_slot),
                     Constant(frame.word_size),
                 ),
-            )
+            ),
+            pointer,
         )
     )
 
 
 def subscript_variable(
-    variable: TranslatedExpression, subscript: TranslatedExpression
+    variable: TranslatedExpression,
+    subscript: TranslatedExpression,
+    pointer: bool = False,
 ) -> TranslatedExpression:
     return Expression(
         Memory(
@@ -82,11 +89,25 @@ def subscript_variable(
                     convert_to_expression(subscript),
                     Constant(frame.word_size),
                 ),
-            )
+            ),
+            pointer,
         )
     )
 
 
+# Records keep the fields that are pointers before the rest, so that the garbage
+# collector only needs to know how many of them there are. Given which fields are
+# pointers, returns the position of each field in the record.
+def record_slots(field_pointers: List[bool]) -> List[int]:
+    order = sorted(
+        range(len(field_pointers)), key=lambda index: not field_pointers[index]
+    )
+    slots = [0 for _ in field_pointers]
+    for slot, index in enumerate(order):
+        slots[index] = slot
+    return slots
+
+
 def nil_expression() -> TranslatedExpression:
     return Expression(Constant(0))
 
@@ -106,25 +127,52 @@ def call_expression(
     function_level: RealLevel,
     caller_level: RealLevel,
     argument_list: List[TranslatedExpression],
+    pointer: bool = False,
 ) -> TranslatedExpression:
     argument_expressions = [
         convert_to_expression(argument) for argument in argument_list
     ]
 
     if function_label in BaseEnvironmentManager.standard_library_functions:
-        return Expression(frame.external_call(function_label, argument_expressions))
-
-    static_link_expression = Temporary(frame.frame_pointer())
-    current_level = caller_level
-    while current_level is not function_level.parent:
-        current_static_link = current_level.formals()[0]
-        static_link_expression = frame.access_to_exp(
-            current_static_link.access, static_link_expression
+        intrinsic = Intrinsics.lookup(function_label)
+        if (
+            intrinsic is not None
+            and intrinsic.fold is not None
+            and all(isinstance(argument, Constant) for argument in argument_expressions)
+        ):
+            return Expression(
+                Constant(
+                    intrinsic.fold(
+                        [argument.value for argument in argument_expressions]
+                    )
+                )
+            )
+        return Expression(
+            frame.external_call(function_label, argument_expressions, pointer)
         )
-        current_level = current_level.parent
-    return Expression(
-        Call(Name(function_label), [static_link_expression] + argument_expressions)
-    )
+
+    CallGraph.add_call(caller_level.name, function_label)
+    if function_level.has_static_link:
+        static_link_expression = Temporary(frame.frame_pointer())
+        current_level = caller_level
+        while current_level is not function_level.parent:
+            current_static_link = current_level.static_link()
+            static_link_expression = frame.access_to_exp(
+                current_static_link.access, static_link_expression
+            )
+            current_level = current_level.parent
+        argument_expressions = [static_link_expression] + argument_expressions
+
+    # The values of the lifted variables are read from the caller, except in recursive
+    # calls, which pass along the ones they received.
+    lifted_variables = function_level.lifted_variables
+    if caller_level is function_level:
+        lifted_variables = function_level.lifted_parameters()
+    for variable_access in lifted_variables:
+        argument_expressions.append(
+            convert_to_expression(simple_variable(variable_access, caller_level))
+        )
+    return Expression(Call(Name(function_label), argument_expressions, pointer))
 
 
 def arithmetic_operation_expression(
@@ -164,24 +212,32 @@ def string_conditional_operation_expression(
     return Conditional(Condition(jump_expression, [jump_expression], [jump_expression]))
 
 
-def record_expression(field_list: List[TranslatedExpression]) -> TranslatedExpression:
-    result = TempManager.new_temp()
+# The fields are evaluated in order, and each one is stored in its slot of the record.
+def record_expression(
+    field_list: List[TranslatedExpression], field_pointers: List[bool]
+) -> TranslatedExpression:
+    result = TempManager.new_temp(pointer=True)
     creation_sequence = [
         Move(
             Temporary(result),
             frame.external_call(
-                "init_record", [Constant(len(field_list) * frame.word_size)]
+                "init_record",
+                [
+                    Constant(len(field_list) * frame.word_size),
+                    Constant(sum(field_pointers)),
+                ],
+                pointer=True,
             ),
         )
     ]
 
-    for index, field_expression in enumerate(field_list):
+    for slot, field_expression in zip(record_slots(field_pointers), field_list):
         field_allocation = Move(
             Memory(
                 BinaryOperation(
                     BinaryOperator.plus,
                     Temporary(result),
-                    Constant(index * frame.word_size),
+                    Constant(slot * frame.word_size),
                 )
             ),
             convert_to_expression(field_expression),
@@ -191,6 +247,24 @@ def record_expression(field_list: List[TranslatedExpression]) -> TranslatedExpre
     return Expression(EvaluateSequence(Sequence(creation_sequence), Temporary(result)))
 
 
+# Creates a record that never leaves the function by assigning the value of each field
+# to the variable that replaces it.
+def local_record_expression(
+    field_variables: List[TranslatedExpression],
+    field_list: List[TranslatedExpression],
+) -> TranslatedExpression:
+    if not field_list:
+        return empty_expression()
+    return NoResult(
+        Sequence(
+            [
+                Move(convert_to_expression(variable), convert_to_expression(field))
+                for variable, field in zip(field_variables, field_list)
+            ]
+        )
+    )
+
+
 def sequence_expression(sequence: List[TranslatedExpression]) -> TranslatedExpression:
     result = convert_to_expression(sequence[0])
     for line in sequence[1:]:
@@ -212,6 +286,7 @@ def if_expression(
     test: TranslatedExpression,
     then: TranslatedExpression,
     else_do: Optional[TranslatedExpression],
+    pointer: bool = False,
 ) -> TranslatedExpression:
     test_condition = convert_to_condition(test)
     then_expression = convert_to_expression(then)
@@ -223,7 +298,7 @@ def if_expression(
     false_label = TempManager.new_label()
     join_label = TempManager.new_label()
 
-    result = TempManager.new_temp()
+    result = TempManager.new_temp(pointer)
 
     patch_true_labels(test_condition.trues, true_label)
     patch_false_labels(test_condition.trues, false_label)
@@ -324,13 +399,56 @@ def let_expression(
     )
 
 
+# Arrays whose elements are pointers are created by a function of their own, so that
+# the garbage collector knows it has to follow them.
 def array_expression(
-    size: TranslatedExpression, initial_value: TranslatedExpression
+    size: TranslatedExpression,
+    initial_value: TranslatedExpression,
+    pointer: bool = False,
 ) -> TranslatedExpression:
     return Expression(
         frame.external_call(
-            "init_array",
+            "init_pointer_array" if pointer else "init_array",
             [convert_to_expression(size), convert_to_expression(initial_value)],
+            pointer=True,
+        )
+    )
+
+
+# Creates an array of constant size that never leaves the function in consecutive slots
+# of the frame, and returns its address. The initial value is computed once and stored
+# in every element.
+def frame_array_expression(
+    level: RealLevel,
+    size: int,
+    initial_value: TranslatedExpression,
+    pointer: bool = False,
+) -> TranslatedExpression:
+    first_offset = level.alloc_array(size, pointer)
+    value = TempManager.new_temp(pointer)
+    creation_sequence = [Move(Temporary(value), convert_to_expression(initial_value))]
+    for index in range(size):
+        creation_sequence.append(
+            Move(
+                Memory(
+                    BinaryOperation(
+                        BinaryOperator.plus,
+                        Temporary(frame.frame_pointer()),
+                        Constant(first_offset + index * frame.word_size),
+                    )
+                ),
+                Temporary(value),
+            )
+        )
+
+    return Expression(
+        EvaluateSequence(
+            Sequence(creation_sequence),
+            BinaryOperation(
+                BinaryOperator.plus,
+                Temporary(frame.frame_pointer()),
+                Constant(first_offset),
+            ),
         )
     )
 
@@ -341,10 +459,28 @@ def empty_expression() -> TranslatedExpression:
 
 def proc_entry_exit(function_level: RealLevel, body: TranslatedExpression):
     body_statement = Move(Temporary(frame.return_value()), convert_to_expression(body))
-    proc_statement = frame.preserve_callee_registers(
-        function_level.frame, frame.shift_view(function_level.frame, body_statement)
-    )
-    FragmentManager.add_fragment(ProcessFragment(proc_statement, function_level.frame))
+    CallGraph.add_function(function_level, body_statement)
+    FragmentManager.add_fragment(process_fragment(function_level, body_statement))
+
+
+def process_fragment(function_level: RealLevel, body: Statement) -> ProcessFragment:
+    proc_statement = frame.shift_view(function_level.frame, body)
+    return ProcessFragment(proc_statement, function_level.frame)
+
+
+# Rebuilds the fragments of the program's functions from their bodies in the call graph,
+# after those bodies were optimized. Functions removed from the call graph are dropped.
+def update_process_fragments():
+    fragments = []
+    for fragment in FragmentManager.get_fragments():
+        if isinstance(fragment, ProcessFragment):
+            function = fragment.frame.name
+            if function not in CallGraph.functions:
+                continue
+            function_body = CallGraph.functions[function]
+            fragment = process_fragment(function_body.level, function_body.body)
+        fragments.append(fragment)
+    FragmentManager.fragment_list = fragments
 
 
 def convert_arithmetic_operator(operator: ast.Oper) -> BinaryOperator:
@@ -1,12 +1,15 @@
 from abc import ABC
-from typing import List
+from typing import List, Optional
 
 from dataclasses import dataclass
 
 from activation_records.temp import TempLabel, TempManager
 
 from intermediate_representation import tree
+from intermediate_representation.intrinsics import Intrinsics
 from intermediate_representation.tree import (
+    Call,
+    Name,
     EvaluateSequence,
     Constant,
     Move,
@@ -93,7 +96,9 @@ def convert_to_statement(exp: TranslatedExpression) -> tree.Statement:
 
 def convert_to_condition(exp: TranslatedExpression) -> tree.Condition:
     if isinstance(exp, Expression):
-        jump = ConditionalJump(RelationalOperator.ne, exp.expression, Constant(0))
+        jump = intrinsic_condition(exp.expression) or ConditionalJump(
+            RelationalOperator.ne, exp.expression, Constant(0)
+        )
         return tree.Condition(jump, [jump], [jump])
 
     if isinstance(exp, NoResult):
@@ -103,5 +108,16 @@ def convert_to_condition(exp: TranslatedExpression) -> tree.Condition:
         return exp.condition
 
 
+# The conditional jump that tests the result of a call to an intrinsic function
+# directly, if it has one.
+def intrinsic_condition(expression: tree.Expression) -> Optional[ConditionalJump]:
+    if not (isinstance(expression, Call) and isinstance(expression.function, Name)):
+        return None
+    intrinsic = Intrinsics.lookup(expression.function.label)
+    if intrinsic is None or intrinsic.condition is None:
+        return None
+    return intrinsic.condition(expression.arguments)
+
+
 def no_op_expression() -> TranslatedExpression:
     return Expression(Constant(0))
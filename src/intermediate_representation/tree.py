@@ -4,7 +4,7 @@ from typing import Optional, List
 
 from dataclasses import dataclass
 
-from activation_records.temp import TempLabel, Temp
+from activation_records.temp import TempLabel, Temp, TempManager
 
 
 class BinaryOperator(Enum):
@@ -77,6 +77,29 @@ class StatementExpression(Statement):
     expression: Expression
 
 
+# TailCall(function, args): Calls 'function' reusing the frame of the current function,
+# which must already have restored the callee-saved registers. The called function
+# returns directly to the caller of the current one, so control never reaches the next
+# statement.
+@dataclass
+class TailCall(Statement):
+    function: Expression
+    arguments: List[Expression]
+
+
+# ConditionalMove(operator, left, right, temporary, expression): Evaluates 'left',
+# 'right' and 'expression', and moves the value of 'expression' to 'temporary' only if
+# comparing 'left' and 'right' with 'operator' is true. It is only built by the if
+# conversion of the canonical statements, so it never goes through canonization.
+@dataclass
+class ConditionalMove(Statement):
+    operator: RelationalOperator
+    left: Expression
+    right: Expression
+    temporary: Expression
+    expression: Expression
+
+
 @dataclass
 class BinaryOperation(Expression):
     operator: BinaryOperator
@@ -84,9 +107,12 @@ class BinaryOperation(Expression):
     right: Expression
 
 
+# Memory(e): The word at address e. It is a pointer if it holds the address of a record,
+# an array or a string (or nil).
 @dataclass
 class Memory(Expression):
     expression: Expression
+    pointer: bool = False
 
 
 @dataclass
@@ -110,10 +136,13 @@ class Constant(Expression):
     value: int
 
 
+# Call(function, args): It is a pointer if the function returns the address of a
+# record, an array or a string (or nil).
 @dataclass
 class Call(Expression):
     function: Expression
     arguments: List[Expression]
+    pointer: bool = False
 
 
 @dataclass
@@ -127,14 +156,56 @@ def negate_relational_operator(operator: RelationalOperator) -> RelationalOperat
     negations = {
         RelationalOperator.eq: RelationalOperator.ne,
         RelationalOperator.ne: RelationalOperator.eq,
+        RelationalOperator.lt: RelationalOperator.ge,
+        RelationalOperator.gt: RelationalOperator.le,
+        RelationalOperator.le: RelationalOperator.gt,
+        RelationalOperator.ge: RelationalOperator.lt,
+        RelationalOperator.ult: RelationalOperator.uge,
+        RelationalOperator.ule: RelationalOperator.ugt,
+        RelationalOperator.ugt: RelationalOperator.ule,
+        RelationalOperator.uge: RelationalOperator.ult,
+    }
+
+    return negations[operator]
+
+
+# Operator that gives the same result when its operands are swapped.
+def mirror_relational_operator(operator: RelationalOperator) -> RelationalOperator:
+    mirrors = {
+        RelationalOperator.eq: RelationalOperator.eq,
+        RelationalOperator.ne: RelationalOperator.ne,
         RelationalOperator.lt: RelationalOperator.gt,
         RelationalOperator.gt: RelationalOperator.lt,
-        RelationalOperator.le: RelationalOperator.le,
-        RelationalOperator.ge: RelationalOperator.ge,
-        RelationalOperator.ult: RelationalOperator.ule,
-        RelationalOperator.ule: RelationalOperator.ult,
-        RelationalOperator.ugt: RelationalOperator.ugt,
-        RelationalOperator.uge: RelationalOperator.uge,
+        RelationalOperator.le: RelationalOperator.ge,
+        RelationalOperator.ge: RelationalOperator.le,
+        RelationalOperator.ult: RelationalOperator.ugt,
+        RelationalOperator.ule: RelationalOperator.uge,
+        RelationalOperator.ugt: RelationalOperator.ult,
+        RelationalOperator.uge: RelationalOperator.ule,
     }
 
-    return negations[operator]
+    return mirrors[operator]
+
+
+# Whether the value of the expression is the address of a record, an array or a string,
+# which the garbage collector may move. Addresses of labels (like the ones of string
+# literals) are not, since they never move.
+def holds_pointer(expression: Expression) -> bool:
+    if isinstance(expression, Temporary):
+        return TempManager.is_pointer(expression.temporary)
+    if isinstance(expression, (Memory, Call)):
+        return expression.pointer
+    if isinstance(expression, EvaluateSequence):
+        return holds_pointer(expression.expression)
+    return False
+
+
+# Whether the expression computes an address inside an object from a pointer to it, an
+# address that becomes invalid if the garbage collector moves the object.
+def derives_pointer(expression: Expression) -> bool:
+    if not isinstance(expression, BinaryOperation):
+        return False
+    return any(
+        holds_pointer(operand) or derives_pointer(operand)
+        for operand in (expression.left, expression.right)
+    )
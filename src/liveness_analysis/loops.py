@@ -0,0 +1,61 @@
+from typing import Dict, List, Set, Tuple, TypeVar
+
+from liveness_analysis.graph import Graph
+
+T = TypeVar("T")
+
+
+# Returns, for each node of the graph (indexed by its id), how many loops contain it.
+def loop_depths(graph: Graph[T]) -> List[int]:
+    depths = [0] * len(graph.get_nodes())
+    for body in loop_bodies(graph).values():
+        for node_id in body:
+            depths[node_id] += 1
+    return depths
+
+
+# Returns the body of each loop of the graph, as a set of node ids, indexed by the id
+# of its header.
+# A loop is found for each back edge of a depth-first traversal from the first node,
+# going from a node to one of its ancestors (the header of the loop). Its body is the
+# header plus every node that reaches the origin of the back edge without going through
+# the header. Back edges to the same header form a single loop.
+def loop_bodies(graph: Graph[T]) -> Dict[int, Set[int]]:
+    bodies: Dict[int, Set[int]] = {}
+    if not graph.get_nodes():
+        return bodies
+
+    for origin, header in back_edges(graph):
+        body = bodies.setdefault(header, {header})
+        worklist = [origin]
+        while worklist:
+            node_id = worklist.pop()
+            if node_id in body:
+                continue
+            body.add(node_id)
+            worklist.extend(graph.in_edges[node_id])
+    return bodies
+
+
+# Edges from a node to one of its ancestors in a depth-first traversal of the graph,
+# as (origin, destination) pairs of node ids.
+def back_edges(graph: Graph[T]) -> List[Tuple[int, int]]:
+    result = []
+    visited = {0}
+    on_path = {0}
+    # Each entry holds a node id and the successors still to be visited from it.
+    stack = [(0, sorted(graph.out_edges[0]))]
+    while stack:
+        node_id, successors = stack[-1]
+        if not successors:
+            stack.pop()
+            on_path.remove(node_id)
+            continue
+        successor = successors.pop(0)
+        if successor in on_path:
+            result.append((node_id, successor))
+        elif successor not in visited:
+            visited.add(successor)
+            on_path.add(successor)
+            stack.append((successor, sorted(graph.out_edges[successor])))
+    return result
@@ -0,0 +1,55 @@
+import unittest
+
+from liveness_analysis.graph import Graph
+from liveness_analysis.loops import back_edges, loop_bodies, loop_depths
+
+
+class TestLoops(unittest.TestCase):
+    def setUp(self):
+        self.graph = Graph[int]()
+
+    def _add_nodes(self, amount: int):
+        for value in range(amount):
+            self.graph.add_node(value)
+
+    def _add_edges(self, *edges):
+        nodes = self.graph.get_nodes()
+        for origin, destination in edges:
+            self.graph.add_edge(nodes[origin], nodes[destination])
+
+    def test_straight_line_has_no_loops(self):
+        self._add_nodes(3)
+        self._add_edges((0, 1), (1, 2))
+
+        self.assertEqual(back_edges(self.graph), [])
+        self.assertEqual(loop_depths(self.graph), [0, 0, 0])
+
+    def test_single_loop(self):
+        # 0 -> 1 -> 2 -> 1, 1 -> 3
+        self._add_nodes(4)
+        self._add_edges((0, 1), (1, 2), (2, 1), (1, 3))
+
+        self.assertEqual(back_edges(self.graph), [(2, 1)])
+        self.assertEqual(loop_depths(self.graph), [0, 1, 1, 0])
+
+    def test_nested_loops(self):
+        # The outer loop is 1 -> 2 -> 3 -> 4 -> 1, the inner one is 2 -> 3 -> 2.
+        self._add_nodes(6)
+        self._add_edges((0, 1), (1, 2), (2, 3), (3, 2), (3, 4), (4, 1), (1, 5))
+
+        self.assertEqual(loop_depths(self.graph), [0, 1, 2, 2, 1, 0])
+        self.assertEqual(loop_bodies(self.graph), {1: {1, 2, 3, 4}, 2: {2, 3}})
+
+    def test_back_edges_to_the_same_header_form_one_loop(self):
+        # Both 2 and 3 jump back to 1.
+        self._add_nodes(5)
+        self._add_edges((0, 1), (1, 2), (2, 1), (2, 3), (3, 1), (1, 4))
+
+        self.assertEqual(len(back_edges(self.graph)), 2)
+        self.assertEqual(loop_depths(self.graph), [0, 1, 1, 1, 0])
+
+    def test_self_loop(self):
+        self._add_nodes(2)
+        self._add_edges((0, 0), (0, 1))
+
+        self.assertEqual(loop_depths(self.graph), [1, 0])
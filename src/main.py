@@ -4,28 +4,98 @@ from activation_records.frame import (
     assembly_procedure,
 )
 from activation_records.instruction_removal import is_redundant_move
+from activation_records.peephole import (
+    peephole_optimize,
+    peephole_rules,
+    PeepholeStatistics,
+)
 from canonical.canonize import canonize
+from canonical.cleanup import ControlFlowStatistics
+from canonical.profile import Profile
+from intermediate_representation.inline import inline_functions
+from intermediate_representation.intrinsics import Intrinsics
+from intermediate_representation.tail_call import optimize_tail_calls
 from intermediate_representation.fragment import (
     FragmentManager,
     ProcessFragment,
     StringFragment,
 )
-from register_allocation.allocation import RegisterAllocator
+from register_allocation.allocation import RegisterAllocator, mark_spill_instructions
 from semantic_analysis.analyzers import SemanticError, translate_program
 from instruction_selection.codegen import Codegen
 from putting_it_all_together.file_handler import FileHandler
 from lexer import lex as le
 from parser import parser as p
+import argparse
 import sys
 from ply import lex
 
 
+def parse_arguments() -> argparse.Namespace:
+    argument_parser = argparse.ArgumentParser(description="Tiger compiler.")
+    argument_parser.add_argument("source_file", nargs="?")
+    argument_parser.add_argument(
+        "--no-peephole",
+        action="store_true",
+        help="skip the peephole optimization of the allocated instructions",
+    )
+    argument_parser.add_argument(
+        "--peephole-statistics",
+        action="store_true",
+        help="print how many times each peephole rule was applied",
+    )
+    argument_parser.add_argument(
+        "--mark-spills",
+        action="store_true",
+        help="label the loads and stores of spilled temporaries in the output",
+    )
+    argument_parser.add_argument(
+        "--control-flow-statistics",
+        action="store_true",
+        help="print how many blocks and jumps the control flow cleanup removed",
+    )
+    argument_parser.add_argument(
+        "--no-intrinsics",
+        action="store_true",
+        help="call the runtime for every standard library function",
+    )
+    argument_parser.add_argument(
+        "--no-local-allocation",
+        action="store_true",
+        help="allocate every record and array in the heap, even if it never leaves "
+        + "the function that creates it",
+    )
+    argument_parser.add_argument(
+        "--no-loop-rotation",
+        action="store_true",
+        help="keep the tests of loops before their bodies",
+    )
+    argument_parser.add_argument(
+        "--no-if-conversion",
+        action="store_true",
+        help="keep the branches of ifs that only choose between two values",
+    )
+    argument_parser.add_argument(
+        "--profile-generate",
+        action="store_true",
+        help="count how many times each block runs, writing the counts to a profile "
+        + "file (tiger.profile, or $TIGER_PROFILE) when the program exits",
+    )
+    argument_parser.add_argument(
+        "--profile-use",
+        metavar="PROFILE",
+        help="optimize using the block counts of a profile",
+    )
+    return argument_parser.parse_args()
+
+
 def main():
-    if len(sys.argv) == 1:
+    arguments = parse_arguments()
+    if arguments.source_file is None:
         print("Fatal error. No input file detected.")
         sys.exit(1)
 
-    f = open(sys.argv[1], "r")
+    f = open(arguments.source_file, "r")
     data = f.read()
     f.close()
 
@@ -39,14 +109,32 @@ def main():
 
     # Semantic Analysis and Intermediate Representation Translation
     TempMap.initialize()
+    Profile.initialize(instrument=arguments.profile_generate)
+    Intrinsics.initialize(enabled=not arguments.no_intrinsics)
+    if arguments.profile_use is not None:
+        try:
+            Profile.load(arguments.profile_use)
+        except (OSError, ValueError) as err:
+            print(f"Could not read the profile {arguments.profile_use}: {err}")
+            sys.exit(1)
     try:
         translate_program(
             parsed_program,
+            local_allocation=not arguments.no_local_allocation,
         )
     except SemanticError as err:
         print(err)
         sys.exit(1)
 
+    # Inlining
+    # Instrumented programs are not inlined, so that every function counts its own
+    # calls and blocks.
+    if not arguments.profile_generate:
+        inline_functions()
+
+    # Tail Call Optimization
+    optimize_tail_calls()
+
     # Canonization
     process_fragments = []
     string_fragments = []
@@ -58,10 +146,19 @@ def main():
         elif isinstance(fragment, StringFragment):
             string_fragments.append(fragment)
 
-    canonized_bodies = [canonize(fragment.body) for fragment in process_fragments]
+    canonized_bodies = [
+        canonize(
+            fragment.body,
+            fragment.frame.name,
+            rotate_loops=not arguments.no_loop_rotation,
+            if_conversion=not arguments.no_if_conversion,
+        )
+        for fragment in process_fragments
+    ]
     # Instruction Selection
     assembly_bodies = [
-        Codegen.codegen(process_body) for process_body in canonized_bodies
+        Codegen.codegen(fragment.frame, process_body)
+        for fragment, process_body in zip(process_fragments, canonized_bodies)
     ]
 
     file_handler = FileHandler("output.s")
@@ -71,6 +168,7 @@ def main():
 
     file_handler.print_code_header()
     # Register Allocation
+    stack_maps = []
     bodies_with_sink = [sink(assembly_body) for assembly_body in assembly_bodies]
     for body, fragment in zip(bodies_with_sink, process_fragments):
         allocation_result = RegisterAllocator(fragment.frame).main(body)
@@ -80,8 +178,29 @@ def main():
             for instruction in allocation_result.instructions
             if not is_redundant_move(instruction)
         ]
-        procedure = assembly_procedure(fragment.frame, instruction_list)
+        # Peephole Optimization
+        if not arguments.no_peephole:
+            instruction_list = peephole_optimize(instruction_list)
+        if arguments.mark_spills:
+            mark_spill_instructions(instruction_list, allocation_result.slot_accesses)
+        procedure = assembly_procedure(
+            fragment.frame, instruction_list, allocation_result.spilled_pointers
+        )
         file_handler.print_assembly_procedure(procedure)
+        stack_maps.extend(procedure.stack_maps)
+
+    file_handler.print_stack_maps(stack_maps)
+
+    if arguments.profile_generate:
+        file_handler.print_profile_data(Profile.counter_keys)
+
+    if arguments.control_flow_statistics:
+        print(f"removed blocks: {ControlFlowStatistics.removed_blocks}")
+        print(f"removed jumps: {ControlFlowStatistics.removed_jumps}")
+
+    if arguments.peephole_statistics:
+        for rule in peephole_rules:
+            print(f"{rule.name}: {PeepholeStatistics.hits.get(rule.name, 0)}")
 
 
 if __name__ == "__main__":
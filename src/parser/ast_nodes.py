@@ -1,6 +1,6 @@
 from abc import ABC
 from enum import Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Optional, List
 
 
@@ -84,6 +84,9 @@ class VariableDec(Declaration):
     type: Optional[str]
     exp: Expression
     escape: bool = False
+    # Whether the record or array created by the expression never leaves the function,
+    # so it is not allocated in the heap.
+    local_allocation: bool = False
 
 
 @dataclass
@@ -93,6 +96,10 @@ class FunctionDec(ASTNode):
     param_escapes: List[bool]
     return_type: Optional[str]
     body: Expression
+    # Whether the function receives a static link, and the names of the variables of
+    # enclosing functions that are passed to it as extra arguments instead.
+    static_link: bool = True
+    lifted_variables: List[str] = field(default_factory=list)
 
 
 @dataclass
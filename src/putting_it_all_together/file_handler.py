@@ -1,6 +1,9 @@
+from typing import List
+
+from canonical.profile import counters_label, keys_label, size_label
 from intermediate_representation.fragment import StringFragment
 from activation_records.frame import string_literal, temp_to_str
-from instruction_selection.assembly import Procedure
+from instruction_selection.assembly import Procedure, StackMap
 
 
 class FileHandler:
@@ -23,3 +26,32 @@ class FileHandler:
 
     def print_assembly_procedure(self, assembly_procedure: Procedure):
         self.file.write(assembly_procedure.format(temp_to_str))
+
+    # Writes the table the garbage collector uses to find the pointers of each frame in
+    # the stack: for each call that may collect, the address it returns to, the amount
+    # of slots holding pointers and their offsets. It ends with a zero address.
+    def print_stack_maps(self, stack_maps: List[StackMap]):
+        self.file.write("\n.data\n")
+        self.file.write(".global tiger_stack_maps\n")
+        self.file.write("tiger_stack_maps:\n")
+        for stack_map in stack_maps:
+            offsets = "".join(f", {offset}" for offset in stack_map.offsets)
+            self.file.write(
+                f"\t.quad {stack_map.label}, {len(stack_map.offsets)}{offsets}\n"
+            )
+        self.file.write("\t.quad 0\n")
+
+    # Writes the counters of an instrumented program, along with the key of the block
+    # counted by each of them and how many there are, for the runtime to dump them.
+    def print_profile_data(self, keys: List[str]):
+        self.file.write("\n.data\n")
+        for label in (counters_label, keys_label, size_label):
+            self.file.write(f".global {label}\n")
+        self.file.write(f"{counters_label}:\n\t.zero {8 * max(len(keys), 1)}\n")
+        self.file.write(f"{keys_label}:\n")
+        for index in range(len(keys)):
+            self.file.write(f"\t.quad {keys_label}_{index}\n")
+        self.file.write(f"{size_label}:\n\t.quad {len(keys)}\n")
+        self.file.write("\n.section .rodata\n")
+        for index, key in enumerate(keys):
+            self.file.write(f'{keys_label}_{index}:\n\t.asciz "{key}"\n')
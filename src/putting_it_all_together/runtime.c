@@ -1,17 +1,272 @@
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <sys/mman.h>
+#include <time.h>
 
-long long *init_record(long long size){
-  long long i;
-  long long *p, *a;
-  p = a = (long long *)malloc(size);
-  for(i=0;i<size;i+=sizeof(long long)) *p++ = 0;
-  return a;
+// Records, arrays and strings live in a heap managed by a copying garbage collector.
+// Each object is preceded by a header word with its size in words (in the upper half)
+// and the amount of words at its start that hold pointers (shifted by one). The fields
+// of a record holding pointers come before the rest, the elements of an array of
+// records, arrays or strings are all pointers, and strings have none.
+// Objects are allocated by moving a pointer forward in one half of the heap. When it is
+// full, the objects reachable from the stack are copied to the other half, which then
+// becomes the one allocated from. The header of a copied object is replaced by its new
+// address, with the lowest bit set.
+// Compiling the runtime with -DTIGER_MALLOC allocates each object with malloc instead
+// and never collects, so that tools like valgrind or the address sanitizer can check
+// every object. With -DTIGER_GC_STRESS, the garbage is collected before every
+// allocation, to check that the compiler tells the collector about every pointer.
+
+#define HEADER(words, pointers) (((unsigned long long)(words) << 32) | ((unsigned long long)(pointers) << 1))
+#define HEADER_WORDS(header) ((header) >> 32)
+#define HEADER_POINTERS(header) (((header) & 0xffffffff) >> 1)
+#define IS_FORWARDED(header) ((header) & 1)
+
+// Strings start with their length and a hash of their characters, which is zero until
+// it is needed, followed by the characters and a zero byte. The compiler writes the
+// string literals in the same way, with their hashes.
+struct string {
+  long long length;
+  unsigned long long hash;
+  char characters[];
+};
+
+#define STRING_WORDS(length) (2 + ((length) + sizeof(long long)) / sizeof(long long))
+
+#ifdef TIGER_MALLOC
+
+static long long *allocate(long long words, long long pointers, long long *frame){
+  unsigned long long *object = malloc((words + 1) * sizeof(long long));
+  if (object == NULL) {
+    printf("Out of memory! Allocating: %lld words\n", words);
+    exit(1);
+  }
+  object[0] = HEADER(words, pointers);
+  memset(object + 1, 0, words * sizeof(long long));
+  return (long long *)(object + 1);
+}
+
+#define PUSH_ROOT(root)
+#define POP_ROOTS(amount)
+
+#else
+
+#define INITIAL_HEAP_WORDS (512 * 1024)
+// Spaces are mapped and unmapped in whole pages of 4096 bytes.
+#define PAGE_ROUND(words) (((words) + 511) & ~511LL)
+
+static unsigned long long *heap_start = NULL;
+static unsigned long long *heap_next = NULL;
+static unsigned long long *heap_end = NULL;
+
+// The compiler writes a stack map for each call that may collect garbage: the address
+// it returns to, the amount of slots of the frame of the caller that hold pointers
+// during the call, and their offsets from its frame pointer. The table ends with a zero.
+extern long long tiger_stack_maps[];
+
+static long long **stack_maps = NULL;
+static long long stack_map_count = 0;
+
+static int compare_stack_maps(const void *first, const void *second){
+  long long first_address = (*(long long **)first)[0];
+  long long second_address = (*(long long **)second)[0];
+  return (first_address > second_address) - (first_address < second_address);
+}
+
+static void index_stack_maps(){
+  long long *entry;
+  for (entry = tiger_stack_maps; entry[0] != 0; entry += 2 + entry[1])
+    stack_map_count++;
+  stack_maps = malloc((stack_map_count + 1) * sizeof(long long *));
+  long long i = 0;
+  for (entry = tiger_stack_maps; entry[0] != 0; entry += 2 + entry[1])
+    stack_maps[i++] = entry;
+  qsort(stack_maps, stack_map_count, sizeof(long long *), compare_stack_maps);
+}
+
+static long long *find_stack_map(long long return_address){
+  long long low = 0, high = stack_map_count;
+  while (low < high) {
+    long long middle = (low + high) / 2;
+    if (stack_maps[middle][0] < return_address)
+      low = middle + 1;
+    else
+      high = middle;
+  }
+  if (low < stack_map_count && stack_maps[low][0] == return_address)
+    return stack_maps[low];
+  return NULL;
+}
+
+// Pointers held by the runtime functions while they allocate, such as the strings being
+// concatenated.
+#define MAX_ROOTS 4
+static long long **roots[MAX_ROOTS];
+static int root_count = 0;
+
+#define PUSH_ROOT(root) (roots[root_count++] = (long long **)&(root))
+#define POP_ROOTS(amount) (root_count -= (amount))
+
+static unsigned long long *copy_next;
+
+static unsigned long long *map_space(long long words){
+  unsigned long long *space = mmap(NULL, words * sizeof(long long), PROT_READ | PROT_WRITE, MAP_PRIVATE | MAP_ANONYMOUS, -1, 0);
+  if (space == MAP_FAILED) {
+    printf("Out of memory! Allocating: %lld words\n", words);
+    exit(1);
+  }
+  return space;
+}
+
+// Returns the new address of the object, copying it if it was not copied yet. Values
+// that are not objects of the heap (like nil, the strings of the program, or records in
+// the frame of a function) are kept.
+static long long *forward(long long *value){
+  unsigned long long *object = (unsigned long long *)value;
+  if (object <= heap_start || object > heap_next)
+    return value;
+  unsigned long long header = object[-1];
+  if (IS_FORWARDED(header))
+    return (long long *)(header & ~1ULL);
+  long long words = HEADER_WORDS(header);
+  memcpy(copy_next, object - 1, (words + 1) * sizeof(long long));
+  long long *copy = (long long *)(copy_next + 1);
+  copy_next += words + 1;
+  object[-1] = (unsigned long long)copy | 1;
+  return copy;
+}
+
+// Walks the frames of the Tiger functions, starting from the caller of the runtime
+// function with the given frame, until reaching one that is not in the stack maps
+// (the frame of main).
+static void forward_frames(long long *frame){
+  long long return_address = frame[1];
+  frame = (long long *)frame[0];
+  long long *stack_map;
+  while ((stack_map = find_stack_map(return_address)) != NULL) {
+    for (long long i = 0; i < stack_map[1]; i++) {
+      long long **slot = (long long **)((char *)frame + stack_map[2 + i]);
+      *slot = forward(*slot);
+    }
+    return_address = frame[1];
+    frame = (long long *)frame[0];
+  }
+}
+
+static long long collections = 0;
+static double total_pause = 0;
+static double max_pause = 0;
+
+static double now(){
+  struct timespec time;
+  clock_gettime(CLOCK_MONOTONIC, &time);
+  return time.tv_sec + time.tv_nsec / 1e9;
+}
+
+static void print_gc_statistics(){
+  fprintf(stderr, "collections: %lld\n", collections);
+  fprintf(stderr, "total pause: %.3f ms\n", total_pause * 1000);
+  fprintf(stderr, "max pause: %.3f ms\n", max_pause * 1000);
+  fprintf(stderr, "heap size: %lld bytes\n", (long long)((heap_end - heap_start) * sizeof(long long)));
+}
+
+// Copies the reachable objects to a new space, which then replaces the current one. The
+// space is mapped with the largest size it may need, and the pages past the size it
+// ends up with are unmapped.
+static void copy_heap(long long *frame, long long needed){
+  long long words = heap_end - heap_start;
+  long long capacity = PAGE_ROUND(4 * (words + needed));
+  unsigned long long *space = map_space(capacity);
+  copy_next = space;
+  forward_frames(frame);
+  for (int i = 0; i < root_count; i++)
+    *roots[i] = forward(*roots[i]);
+  // The copied objects are scanned in order, copying the ones they point to after them.
+  for (unsigned long long *scan = space; scan < copy_next; ) {
+    unsigned long long header = *scan;
+    for (long long i = 1; i <= HEADER_POINTERS(header); i++)
+      scan[i] = (unsigned long long)forward((long long *)scan[i]);
+    scan += HEADER_WORDS(header) + 1;
+  }
+  munmap(heap_start, words * sizeof(long long));
+  // The heap grows when more than half of it is still reachable, to four times the
+  // reachable size, so that the time spent copying stays proportional to the amount
+  // allocated.
+  long long live = copy_next - space;
+  if (2 * (live + needed) > words)
+    words = PAGE_ROUND(4 * (live + needed));
+  munmap(space + words, (capacity - words) * sizeof(long long));
+  heap_start = space;
+  heap_next = copy_next;
+  heap_end = space + words;
+}
+
+// Makes room for an object of the given size (with its header).
+static void collect(long long *frame, long long needed){
+  double start = now();
+  if (stack_maps == NULL)
+    index_stack_maps();
+  copy_heap(frame, needed);
+  double pause = now() - start;
+  collections++;
+  total_pause += pause;
+  if (pause > max_pause)
+    max_pause = pause;
+}
+
+// Allocates an object, given the frame of the runtime function called by the Tiger
+// program, which is where the search for pointers in the stack starts.
+static long long *allocate(long long words, long long pointers, long long *frame){
+  if (heap_start == NULL) {
+    heap_start = heap_next = map_space(INITIAL_HEAP_WORDS);
+    heap_end = heap_start + INITIAL_HEAP_WORDS;
+    if (getenv("TIGER_GC_STATS") != NULL)
+      atexit(print_gc_statistics);
+  }
+#ifdef TIGER_GC_STRESS
+  collect(frame, words + 1);
+#else
+  if (words + 1 > heap_end - heap_next)
+    collect(frame, words + 1);
+#endif
+  // Each space is mapped when collecting and never reused, so it is already zeroed.
+  unsigned long long *object = heap_next;
+  heap_next += words + 1;
+  object[0] = HEADER(words, pointers);
+  return (long long *)(object + 1);
+}
+
+#endif
+
+// The functions that allocate give their own frame to the collector, so they must
+// have one, and they must be called directly from the Tiger program.
+#define CALLER_FRAME ((long long *)__builtin_frame_address(0))
+
+long long *init_record(long long size, long long pointers){
+  return allocate(size / sizeof(long long), pointers, CALLER_FRAME);
+}
+
+// The characters of the new string are all zero.
+static struct string *allocate_string(long long length, long long *frame){
+  struct string *result = (struct string *)allocate(STRING_WORDS(length), 0, frame);
+  result->length = length;
+  return result;
+}
+
+// FNV-1a hash of the characters, like the one the compiler computes for the literals.
+static unsigned long long string_hash(struct string *str){
+  if (str->hash == 0) {
+    unsigned long long hash = 14695981039346656037ULL;
+    for (long long i = 0; i < str->length; i++)
+      hash = (hash ^ (unsigned char)str->characters[i]) * 1099511628211ULL;
+    str->hash = hash != 0 ? hash : 1;
+  }
+  return str->hash;
 }
 
-long long char_to_num(char* str){
-    if ( strlen(str) ) return (long long)str[0];
+long long char_to_num(struct string *str){
+    if ( str->length ) return (long long)str->characters[0];
     return -1;
 }
 
@@ -25,24 +280,32 @@ void flush(){
 
 long long *init_array(long long size, long long init){
   long long i;
-  long long *a = (long long *)malloc(size*sizeof(long long));
+  long long *a = allocate(size, 0, CALLER_FRAME);
   for(i=0;i<size;i++) a[i]=init;
   return a;
 }
 
+long long *init_pointer_array(long long size, long long *init){
+  long long i;
+  PUSH_ROOT(init);
+  long long **a = (long long **)allocate(size, size, CALLER_FRAME);
+  POP_ROOTS(1);
+  for(i=0;i<size;i++) a[i]=init;
+  return (long long *)a;
+}
+
 long long not(long long n){
   return n==0;
 }
 
-char* num_to_char(long long n){
+struct string *num_to_char(long long n){
   if ( n < 0 || n >= 256 ) {
     printf("Out of range char! Arguments: %lld\n", n);
     exit(1);
   }
 
-  char *result = (char*) malloc(sizeof(char) * 2);
-  result[0] = (char)n;
-  result[1] = '\0';
+  struct string *result = allocate_string(1, CALLER_FRAME);
+  result->characters[0] = (char)n;
   return result;
 }
 
@@ -51,18 +314,16 @@ void print_num(long long n){
   printf("%lld\n", n);
 }
 
-void print_string(char *str){
-  printf("%s", str);
+void print_string(struct string *str){
+  fwrite(str->characters, 1, str->length, stdout);
 }
 
-char* read_char(){
-  char *c = (char*) malloc(sizeof(char) * 2);
+struct string *read_char(){
   long long result = getchar();
-  // Check EOF.
-  if(result < 0)
-    result = 0;
-  c[0] = result;
-  c[1] = '\0';
+  // The end of the input is read as the empty string.
+  struct string *c = allocate_string(result < 0 ? 0 : 1, CALLER_FRAME);
+  if(result >= 0)
+    c->characters[0] = result;
   return c;
 }
 
@@ -72,43 +333,76 @@ long long read_num(){
   return n;
 }
 
-long long string_compare(char *str1, char *str2){
-  return strcmp(str1, str2);
+long long string_compare(struct string *str1, struct string *str2){
+  long long length = str1->length < str2->length ? str1->length : str2->length;
+  int result = memcmp(str1->characters, str2->characters, length);
+  if (result != 0)
+    return result;
+  return (str1->length > str2->length) - (str1->length < str2->length);
 }
 
-char* string_concat(char *first, char *second){
-  // Reserve space for both strings + '\0'.
-  long long combined_length = strlen(first) + strlen(second) + 1;
-  char *result = (char*) malloc(combined_length * sizeof(char));
-  result[0] = '\0';
-  strcat(result, first);
-  strcat(result, second);
+struct string *string_concat(struct string *first, struct string *second){
+  if (first->length == 0)
+    return second;
+  if (second->length == 0)
+    return first;
+  PUSH_ROOT(first);
+  PUSH_ROOT(second);
+  struct string *result = allocate_string(first->length + second->length, CALLER_FRAME);
+  POP_ROOTS(2);
+  memcpy(result->characters, first->characters, first->length);
+  memcpy(result->characters + first->length, second->characters, second->length);
   return result;
 }
 
-long long string_equal(char *str1, char *str2){
-  return strcmp(str1, str2) == 0;
+// Strings of different lengths or hashes are different without comparing them.
+long long string_equal(struct string *str1, struct string *str2){
+  if (str1 == str2)
+    return 1;
+  if (str1->length != str2->length || string_hash(str1) != string_hash(str2))
+    return 0;
+  return memcmp(str1->characters, str2->characters, str1->length) == 0;
 }
 
-long long string_length(char *str){
-  return strlen(str);
+long long string_length(struct string *str){
+  return str->length;
 }
 
-char* string_substring(char *source, long long start, long long length){
-  if(start < 0  || start + length > strlen(source)){
-    printf("Out of range substring! Arguments: \"%s\" %lld %lld \n", source, start, length);
+struct string *string_substring(struct string *source, long long start, long long length){
+  if(start < 0  || start + length > source->length){
+    printf("Out of range substring! Arguments: \"%s\" %lld %lld \n", source->characters, start, length);
     exit(1);
   }
 
-  // Reserve space for the substring + '\0'.
-  char* result = (char*) malloc(sizeof(char) * (length + 1));
-  strncpy(result, source + start, length);
-  result[length] = '\0';
+  if(start == 0 && length == source->length)
+    return source;
+  PUSH_ROOT(source);
+  struct string *result = allocate_string(length, CALLER_FRAME);
+  POP_ROOTS(1);
+  memcpy(result->characters, source->characters + start, length);
   return result;
 }
 
+// Block counters of a program compiled with --profile-generate. They are only defined
+// in instrumented programs.
+extern long long tiger_profile_size __attribute__((weak));
+extern long long tiger_profile_counters[] __attribute__((weak));
+extern char *tiger_profile_keys[] __attribute__((weak));
+
+void dump_profile(){
+  char *file_name = getenv("TIGER_PROFILE");
+  FILE *profile = fopen(file_name != NULL ? file_name : "tiger.profile", "w");
+  if (profile == NULL)
+    return;
+  for (long long i = 0; i < tiger_profile_size; i++)
+    fprintf(profile, "%s %lld\n", tiger_profile_keys[i], tiger_profile_counters[i]);
+  fclose(profile);
+}
+
 long long tigermain(long long);
 long long main(){
+  if (&tiger_profile_size != NULL)
+    atexit(dump_profile);
   printf("\n");
   return tigermain(0 /*static link*/);
 }
\ No newline at end of file
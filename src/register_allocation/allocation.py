@@ -1,28 +1,72 @@
-from typing import List, Set, Dict, Tuple, TypeVar
+import copy
+import re
+from typing import List, Optional, Set, Dict, Tuple, TypeVar
 
 from dataclasses import dataclass
 
-from activation_records.frame import Frame, TempMap, frame_pointer
+from activation_records.frame import (
+    Frame,
+    TempMap,
+    callee_saved_registers,
+    frame_pointer,
+    may_collect,
+)
 from activation_records.temp import Temp, TempManager
+from canonical.profile import Profile
 from instruction_selection.assembly import Instruction, Move, Operation
 
-from liveness_analysis.flow_graph import assembler_flow_graph
+from liveness_analysis.flow_graph import AssemblerInformation, assembler_flow_graph
 from liveness_analysis.graph import Graph
 from liveness_analysis.liveness import liveness
-
+from liveness_analysis.loops import loop_depths
+from register_allocation.splitting import is_call, split_around_calls
+from register_allocation.spill_slots import (
+    SlotAccess,
+    assign_spill_slots,
+    slot_placeholder,
+    spilled_pointers,
+)
 
 T = TypeVar("T")
 
+# Each use or definition of a temporary adds to the cost of spilling it this value
+# raised to the amount of loops around the instruction, as an estimate of how many
+# times it runs.
+loop_weight = 10
+
+# Definitions that can be repeated anywhere in the procedure with the same result, since
+# they only depend on a constant or on the address of a label (but not on an offset from
+# a temporary).
+rematerializable_definition = re.compile(
+    r"(movq \$-?\d+|leaq [A-Za-z_]\w*\(%'s0\)), %'d0\n"
+)
+
+# Operations of the form "op %'s1, %'d0" that can read their source from memory, or
+# read and write their destination there.
+memory_operand_operations = ("addq", "subq", "andq", "orq", "xorq")
+
 
 @dataclass
 class AllocationResult:
     instructions: List[Instruction]
     temp_to_register: Dict[Temp, Temp]
+    # Instructions reading or writing the slots of the spilled temporaries.
+    slot_accesses: List[SlotAccess]
+    # Offsets of the slots holding pointers during each call that may collect garbage,
+    # indexed by the id of the call.
+    spilled_pointers: Dict[int, List[int]]
 
 
 class RegisterAllocator:
     def __init__(self, frame: Frame):
         self.frame = frame
+        self.slot_accesses: List[SlotAccess] = []
+        # Temporaries whose live ranges were split, or that were created by a split.
+        self.split_temporaries: Set[Temp] = set()
+        # Temporaries created to load, store or recompute the value of a spilled node
+        # right next to an instruction using it. Their live ranges cannot get any
+        # shorter, so spilling them again would only make new ones like them.
+        self.unspillable_temporaries: Set[Temp] = set()
 
     def main(self, instructions: List[Instruction]) -> AllocationResult:
         self._initialize_data_structures(instructions)
@@ -47,7 +91,13 @@ class RegisterAllocator:
             new_instructions = self._rewrite_program(instructions)
             return self.main(new_instructions)
 
-        return AllocationResult(instructions, self.color)
+        slots = assign_spill_slots(self.frame, instructions, self.slot_accesses)
+        return AllocationResult(
+            instructions,
+            self.color,
+            self.slot_accesses,
+            spilled_pointers(instructions, self.slot_accesses, slots),
+        )
 
     def _initialize_data_structures(self, instructions: List[Instruction]):
         flow_graph_results = assembler_flow_graph(instructions)
@@ -55,6 +105,17 @@ class RegisterAllocator:
         self.temp_definitions: Dict[
             Temp, List[Instruction]
         ] = flow_graph_results.temp_definitions
+        self.instruction_weight: Dict[int, float] = self._instruction_weights(
+            flow_graph_results.flow_graph
+        )
+        # Position of each instruction in the procedure, indexed by its id.
+        self.instruction_position: Dict[int, int] = {
+            id(instruction): position
+            for position, instruction in enumerate(instructions)
+        }
+        self.calls_across: Dict[Temp, List[Instruction]] = self._calls_across(
+            flow_graph_results.flow_graph
+        )
 
         liveness_results = liveness(flow_graph_results.flow_graph)
         all_temporaries = [
@@ -63,6 +124,16 @@ class RegisterAllocator:
 
         self.precolored: List[Temp] = list(TempMap.register_to_temp.values())
         self.color_amount: int = len(self.precolored)
+        # Callee-saved registers are tried last when assigning colors, since using one
+        # of them means saving it in the prologue and restoring it in the epilogue.
+        callee_saved_temps = [
+            TempMap.register_to_temp[register] for register in callee_saved_registers
+        ]
+        self.color_preference: List[Temp] = [
+            temporary
+            for temporary in self.precolored
+            if temporary not in callee_saved_temps
+        ] + callee_saved_temps
         self.initial: List[Temp] = [
             temporary
             for temporary in all_temporaries
@@ -93,6 +164,52 @@ class RegisterAllocator:
 
         self._make_worklist()
 
+    # Execution frequency of each instruction, indexed by its id, since instructions
+    # with the same text compare as equal. It is the count of the block of the
+    # instruction if the profile has the counts of the procedure, or an estimate based
+    # on the loops around the instruction otherwise.
+    def _instruction_weights(
+        self, flow_graph: Graph[AssemblerInformation]
+    ) -> Dict[int, float]:
+        nodes = flow_graph.get_nodes()
+        labels = [
+            node.information.instruction.label
+            for node in nodes
+            if node.information.is_label()
+        ]
+        if any(label in Profile.block_counts for label in labels):
+            weights = {}
+            count = 0
+            for node in nodes:
+                if node.information.is_label():
+                    # Blocks without a count (like the ones made when fixing the
+                    # conditional jumps) are assumed to run as often as the previous one.
+                    count = Profile.block_counts.get(
+                        node.information.instruction.label, count
+                    )
+                weights[id(node.information.instruction)] = count
+            return weights
+
+        depths = loop_depths(flow_graph)
+        return {
+            id(node.information.instruction): loop_weight ** depths[node.id]
+            for node in nodes
+        }
+
+    # Calls that each temporary is live across.
+    def _calls_across(
+        self, flow_graph: Graph[AssemblerInformation]
+    ) -> Dict[Temp, List[Instruction]]:
+        calls_across = {}
+        for node in flow_graph.get_nodes():
+            information = node.information
+            if is_call(information.instruction):
+                for temporary in information.live_out - information.definitions:
+                    calls_across.setdefault(temporary, []).append(
+                        information.instruction
+                    )
+        return calls_across
+
     def _initialize_adjacency_structures(self, interference_graph: Graph[Temp]):
         self.adjacencies: Set[Tuple[Temp, Temp]] = set()
         self.adjacent_nodes: Dict[Temp, List[Temp]] = {
@@ -107,6 +224,17 @@ class RegisterAllocator:
             for neighbor in interference_graph.node_successors(node):
                 self._add_edge(node.information, neighbor.information)
 
+        # The garbage collector only finds the pointers kept in the frame, so the ones
+        # live across calls that may collect garbage can not be kept in registers. They
+        # interfere with every register, which makes them spill (or split around the
+        # calls, where the new temporaries spill).
+        for temporary in self.initial:
+            if TempManager.is_pointer(temporary) and any(
+                may_collect(call) for call in self.calls_across.get(temporary, [])
+            ):
+                for register in self.precolored:
+                    self._add_edge(temporary, register)
+
     def _add_edge(self, node1: Temp, node2: Temp):
         if (node1, node2) not in self.adjacencies and node1 != node2:
             self.adjacencies.add((node1, node2))
@@ -130,7 +258,7 @@ class RegisterAllocator:
     def _node_moves(self, node: Temp) -> List[Move]:
         return [
             move
-            for move in self.move_list[node]
+            for move in self.move_list.get(node, [])
             if move in self.active_moves or move in self.worklist_moves
         ]
 
@@ -273,15 +401,60 @@ class RegisterAllocator:
         self.simplify_worklist.append(spilled_node)
         self._freeze_moves(spilled_node)
 
+    # Spilling the nodes with the lowest cost first, that is, the ones whose uses and
+    # definitions run the least often relative to how many nodes they interfere with.
+    # Rematerializable nodes need no store and recompute their value instead of loading
+    # it, so only half of the cost of their uses is counted. Nodes whose live ranges
+    # spilling cannot shorten have an infinite cost, so they are only chosen when every
+    # other node in the worklist is one of them too.
     def _spill_heuristic(self, node: Temp) -> float:
-        return (
-            len(self.temp_uses[node]) + len(self.temp_definitions[node])
-        ) / self.node_degree[node]
+        if not self._can_shorten(node):
+            return float("inf")
+        uses = self._frequency(self.temp_uses.get(node, []))
+        if self._rematerialization(node) is not None:
+            return uses / 2 / self.node_degree[node]
+        definitions = self._frequency(self.temp_definitions.get(node, []))
+        return (uses + definitions) / self.node_degree[node]
+
+    def _frequency(self, instructions: List[Instruction]) -> float:
+        return sum(
+            self.instruction_weight[id(instruction)] for instruction in instructions
+        )
+
+    # Whether spilling the node makes its live range shorter. It does not for the
+    # temporaries made by spilling, nor for a single definition followed directly by
+    # the single use of the node.
+    def _can_shorten(self, node: Temp) -> bool:
+        if node in self.unspillable_temporaries:
+            return False
+        definitions = self.temp_definitions.get(node, [])
+        uses = self.temp_uses.get(node, [])
+        return not (
+            len(definitions) == 1
+            and len(uses) == 1
+            and self.instruction_position[id(uses[0])]
+            == self.instruction_position[id(definitions[0])] + 1
+        )
+
+    # Returns the only definition of the node if it can be repeated before each use
+    # instead of keeping the value in memory, or None otherwise.
+    def _rematerialization(self, node: Temp) -> Optional[Instruction]:
+        definitions = self.temp_definitions.get(node, [])
+        if (
+            len(definitions) != 1
+            or definitions[0].destination != [node]
+            or not self._can_shorten(node)
+        ):
+            return None
+        definition = definitions[0]
+        if not rematerializable_definition.fullmatch(definition.line):
+            return None
+        return definition
 
     def _assign_colors(self):
         while self.select_stack:
             node = self.select_stack.pop()
-            possible_colors = self.precolored.copy()
+            possible_colors = self.color_preference.copy()
             for adjacent_node in self.adjacent_nodes[node]:
                 if (
                     self._get_alias(adjacent_node) in self.colored_nodes
@@ -297,43 +470,237 @@ class RegisterAllocator:
         for node in self.coalesced_nodes:
             self.color[node] = self.color[self._get_alias(node)]
 
+    # Splits, rematerializes or spills the spilled nodes. The rounds of the allocation
+    # always end: the nodes that can still be spilled are the ones of the original
+    # program and the copies made when splitting, which happens at most once per node,
+    # and every new temporary made here is never spilled again.
     def _rewrite_program(self, instructions: List[Instruction]) -> List[Instruction]:
+        spilled_nodes = []
         for node in self.spilled_nodes:
-            memory_access = self.frame.alloc_local(True)
-            for use_instruction in self.temp_uses[node]:
+            definition = self._rematerialization(node)
+            if self._should_split(node):
+                new_temporaries = split_around_calls(
+                    instructions, node, self.calls_across[node]
+                )
+                self.split_temporaries.update([node] + new_temporaries)
+            elif definition is not None:
+                instructions = self._rematerialize(instructions, node, definition)
+            else:
+                spilled_nodes.append(node)
+
+        # The slots are chosen once all the temporaries are spilled. Each instruction
+        # accessing a spilled node reads or writes its slot directly if it can take a
+        # memory operand there. Otherwise, it uses a new temporary that is loaded from
+        # the slot before the instruction and stored back after it.
+        result = []
+        for instruction in instructions:
+            if not isinstance(instruction, (Operation, Move)) or not any(
+                temp in spilled_nodes
+                for temp in instruction.source + instruction.destination
+            ):
+                result.append(instruction)
+                continue
+
+            instruction = self._fold_memory_operand(instruction, spilled_nodes)
+            loads, stores = [], []
+            for node in spilled_nodes:
+                uses = node in instruction.source
+                defines = node in instruction.destination
+                if not uses and not defines:
+                    continue
                 new_temporary = TempManager.new_temp()
-                use_instruction.source = [
-                    source_temp if source_temp != node else new_temporary
-                    for source_temp in use_instruction.source
-                ]
-                fetch_instruction = Operation(
-                    f"movq {memory_access.offset}(%'s0), %'d0\n",
+                self.unspillable_temporaries.add(new_temporary)
+                if uses:
+                    instruction.source = [
+                        new_temporary if temp == node else temp
+                        for temp in instruction.source
+                    ]
+                    loads.append(
+                        self._slot_access(
+                            f"movq {slot_placeholder}(%'s0), %'d0\n",
+                            [frame_pointer()],
+                            [new_temporary],
+                            node,
+                        )
+                    )
+                if defines:
+                    instruction.destination = [
+                        new_temporary if temp == node else temp
+                        for temp in instruction.destination
+                    ]
+                    stores.append(
+                        self._slot_access(
+                            f"movq %'s0, {slot_placeholder}(%'s1)\n",
+                            [new_temporary, frame_pointer()],
+                            [],
+                            node,
+                        )
+                    )
+            result.extend(loads + [instruction] + stores)
+
+        return result
+
+    # A node live across calls is split around them instead of spilled, if copying it
+    # at each call runs less often than the loads and stores that spilling it adds.
+    # Each node is split at most once, and the new temporaries are never split.
+    def _should_split(self, node: Temp) -> bool:
+        if node in self.split_temporaries or node not in self.calls_across:
+            return False
+        instructions = self.temp_uses.get(node, []) + self.temp_definitions.get(
+            node, []
+        )
+        return 2 * self._frequency(self.calls_across[node]) < self._frequency(
+            instructions
+        )
+
+    # Builds a load from the slot of the node if it has a destination, or a store to
+    # it otherwise.
+    def _slot_access(
+        self, line: str, source: List[Temp], destination: List[Temp], node: Temp
+    ) -> Instruction:
+        instruction = Operation(line, source, destination, None)
+        is_load = bool(destination)
+        return self._record_slot_access(instruction, node, is_load, not is_load)
+
+    # Replaces one operand of the instruction that is a spilled node with its slot, if
+    # the instruction accepts a memory operand there. Returns the resulting instruction,
+    # which may be a new one (when a move between registers becomes a load or a store).
+    def _fold_memory_operand(
+        self, instruction: Instruction, spilled_nodes: List[Temp]
+    ) -> Instruction:
+        # Instructions can have a single memory operand.
+        if "(" in instruction.line:
+            return instruction
+        slot = f"{slot_placeholder}(%'s{{}})"
+        source, destination = instruction.source, instruction.destination
+
+        if isinstance(instruction, Move):
+            constant = re.fullmatch(r"movq \$(-?\d+), %'d0\n", instruction.line)
+            # Stores take an immediate of at most 32 bits.
+            if (
+                constant
+                and -(2 ** 31) <= int(constant.group(1)) < 2 ** 31
+                and destination[0] in spilled_nodes
+            ):
+                folded = Operation(
+                    f"movq ${constant.group(1)}, {slot.format(0)}\n",
                     [frame_pointer()],
-                    [new_temporary],
+                    [],
                     None,
                 )
-                instructions.insert(
-                    instructions.index(use_instruction), fetch_instruction
+                return self._record_slot_access(
+                    folded, destination[0], reads=False, writes=True
                 )
-
-            for definition_instruction in self.temp_definitions[node]:
-                new_temporary = TempManager.new_temp()
-                definition_instruction.destination = [
-                    destination_temp if destination_temp != node else new_temporary
-                    for destination_temp in definition_instruction.destination
-                ]
-                store_instruction = Operation(
-                    f"movq %'s0, {memory_access.offset}(%'s1)\n",
-                    [new_temporary, frame_pointer()],
+            if instruction.line != "movq %'s0, %'d0\n":
+                return instruction
+            if source[0] in spilled_nodes:
+                folded = Operation(
+                    f"movq {slot.format(0)}, %'d0\n",
+                    [frame_pointer()],
+                    destination,
+                    None,
+                )
+                return self._record_slot_access(
+                    folded, source[0], reads=True, writes=False
+                )
+            if destination[0] in spilled_nodes:
+                folded = Operation(
+                    f"movq %'s0, {slot.format(1)}\n",
+                    [source[0], frame_pointer()],
                     [],
                     None,
                 )
-                instructions.insert(
-                    instructions.index(definition_instruction) + 1, store_instruction
+                return self._record_slot_access(
+                    folded, destination[0], reads=False, writes=True
                 )
+            return instruction
 
-        return instructions
+        operation = instruction.line.split(" ")[0]
+        if re.fullmatch(r"\w+ %'s1, %'d0\n", instruction.line) and (
+            operation in memory_operand_operations
+        ):
+            # The first source is the destination, which is read and written.
+            if destination[0] in spilled_nodes and source[0] == destination[0]:
+                instruction.line = f"{operation} %'s1, {slot.format(0)}\n"
+                node = destination[0]
+                instruction.source = [frame_pointer(), source[1]]
+                instruction.destination = []
+                return self._record_slot_access(
+                    instruction, node, reads=True, writes=True
+                )
+            index = 1
+        elif instruction.line == "cmpq %'s0, %'s1\n":
+            index = 0 if source[0] in spilled_nodes else 1
+        elif re.fullmatch(r"cmpq \$-?\d+, %'s0\n", instruction.line):
+            index = 0
+        elif instruction.line == "testq %'s0, %'s0\n":
+            # A value in memory is compared against zero instead.
+            if source[0] in spilled_nodes:
+                instruction.line = "cmpq $0, %'s0\n"
+            index = 0
+        elif instruction.line in ("imulq %'s2\n", "idivq %'s2\n"):
+            index = 2
+        elif re.fullmatch(r"imulq \$-?\d+, %'s0, %'d0\n", instruction.line):
+            index = 0
+        else:
+            return instruction
+
+        node = source[index]
+        if node not in spilled_nodes or source.count(node) > 1:
+            return instruction
+        instruction.line = instruction.line.replace(f"%'s{index}", slot.format(index))
+        instruction.source = [
+            frame_pointer() if position == index else temp
+            for position, temp in enumerate(source)
+        ]
+        return self._record_slot_access(instruction, node, reads=True, writes=False)
+
+    def _record_slot_access(
+        self, instruction: Instruction, node: Temp, reads: bool, writes: bool
+    ) -> Instruction:
+        self.slot_accesses.append(SlotAccess(instruction, node, reads, writes))
+        return instruction
+
+    # Repeats the definition of the node before each of its uses, which read a new
+    # temporary instead, and removes the original definition.
+    def _rematerialize(
+        self, instructions: List[Instruction], node: Temp, definition: Instruction
+    ) -> List[Instruction]:
+        for use_instruction in self.temp_uses[node]:
+            new_temporary = TempManager.new_temp()
+            self.unspillable_temporaries.add(new_temporary)
+            use_instruction.source = [
+                source_temp if source_temp != node else new_temporary
+                for source_temp in use_instruction.source
+            ]
+            recomputation = copy.copy(definition)
+            recomputation.destination = [new_temporary]
+            instructions.insert(instructions.index(use_instruction), recomputation)
+        return [
+            instruction for instruction in instructions if instruction is not definition
+        ]
 
     def _maybe_remove_from_list(self, list: List[T], element: T):
         if element in list:
             list.remove(element)
+
+
+# Puts a label before each instruction that still accesses the slot of a spilled
+# temporary, so that benchmarks can find them in the binary. The labels start with
+# spill_store_ for the instructions that only write the slot, and with spill_load_ for
+# the rest.
+def mark_spill_instructions(
+    instructions: List[Instruction], slot_accesses: List[SlotAccess]
+):
+    access_kinds = {
+        id(access.instruction): (
+            "store" if access.writes and not access.reads else "load"
+        )
+        for access in slot_accesses
+    }
+    for instruction in instructions:
+        if id(instruction) in access_kinds:
+            kind = access_kinds[id(instruction)]
+            instruction.line = f"spill_{kind}_{TempManager.new_label()}:\n" + (
+                instruction.line
+            )
@@ -0,0 +1,118 @@
+import copy
+from typing import Dict, List, Set
+
+from dataclasses import dataclass
+
+from activation_records.frame import Frame, may_collect
+from activation_records.temp import Temp, TempManager
+from instruction_selection.assembly import Instruction, Move, Operation
+from liveness_analysis.flow_graph import assembler_flow_graph
+
+# Spilled temporaries are kept in frame slots, but two of them can share a slot when
+# they are never live at the same time. The instructions that access a slot are written
+# with a placeholder instead of its offset, which is filled once every temporary has
+# been spilled. Then the liveness of the spilled temporaries is computed over the slot
+# accesses, and the slots are colored like registers, with as many colors as needed.
+
+slot_placeholder = "'slot"
+
+
+# An instruction reading or writing the slot of a spilled temporary.
+@dataclass
+class SlotAccess:
+    instruction: Instruction
+    temporary: Temp
+    reads: bool
+    writes: bool
+
+
+# Allocates the frame slots for the spilled temporaries and replaces the placeholders
+# of the instructions with their offsets. Returns the offset of each temporary.
+def assign_spill_slots(
+    frame: Frame, instructions: List[Instruction], accesses: List[SlotAccess]
+) -> Dict[Temp, int]:
+    if not accesses:
+        return {}
+
+    interference = slot_interference(instructions, accesses)
+    slot_offsets: List[int] = []
+    temporary_slot: Dict[Temp, int] = {}
+    for access in accesses:
+        temporary = access.temporary
+        if temporary in temporary_slot:
+            continue
+        taken_slots = {
+            temporary_slot[neighbor]
+            for neighbor in interference[temporary]
+            if neighbor in temporary_slot
+        }
+        slot = next(
+            slot for slot in range(len(slot_offsets) + 1) if slot not in taken_slots
+        )
+        if slot == len(slot_offsets):
+            slot_offsets.append(frame.alloc_local(True).offset)
+        temporary_slot[temporary] = slot
+
+    for access in accesses:
+        offset = slot_offsets[temporary_slot[access.temporary]]
+        access.instruction.line = access.instruction.line.replace(
+            slot_placeholder, str(offset)
+        )
+    return {temporary: slot_offsets[slot] for temporary, slot in temporary_slot.items()}
+
+
+# Liveness of the spilled temporaries, computed by treating each slot access as a use or
+# definition of its temporary.
+def slot_flow_graph(instructions: List[Instruction], accesses: List[SlotAccess]):
+    instruction_accesses = {id(access.instruction): access for access in accesses}
+    slot_instructions = []
+    for instruction in instructions:
+        if isinstance(instruction, (Operation, Move)):
+            access = instruction_accesses.get(id(instruction))
+            instruction = copy.copy(instruction)
+            instruction.source = []
+            instruction.destination = []
+            if access is not None:
+                if access.reads:
+                    instruction.source = [access.temporary]
+                if access.writes:
+                    instruction.destination = [access.temporary]
+        slot_instructions.append(instruction)
+    return assembler_flow_graph(slot_instructions).flow_graph
+
+
+# Spilled temporaries that are live at the same time.
+def slot_interference(
+    instructions: List[Instruction], accesses: List[SlotAccess]
+) -> Dict[Temp, Set[Temp]]:
+    interference = {access.temporary: set() for access in accesses}
+    flow_graph = slot_flow_graph(instructions, accesses)
+    for node in flow_graph.get_nodes():
+        for definition in node.information.definitions:
+            for live_temporary in node.information.live_out - {definition}:
+                interference[definition].add(live_temporary)
+                interference[live_temporary].add(definition)
+    return interference
+
+
+# Offsets of the slots of the spilled pointers that are live across each call that may
+# collect garbage, indexed by the id of the call.
+def spilled_pointers(
+    instructions: List[Instruction],
+    accesses: List[SlotAccess],
+    temporary_offsets: Dict[Temp, int],
+) -> Dict[int, List[int]]:
+    if not any(TempManager.is_pointer(access.temporary) for access in accesses):
+        return {}
+
+    # The flow graph has a node for each instruction, in the same order.
+    result = {}
+    nodes = slot_flow_graph(instructions, accesses).get_nodes()
+    for instruction, node in zip(instructions, nodes):
+        if may_collect(instruction):
+            result[id(instruction)] = sorted(
+                temporary_offsets[temporary]
+                for temporary in node.information.live_out
+                if TempManager.is_pointer(temporary)
+            )
+    return result
@@ -0,0 +1,41 @@
+from typing import List
+
+from activation_records.temp import Temp, TempManager
+from instruction_selection.assembly import Instruction, Move, Operation
+
+# Live range splitting around calls. A temporary that is live across a call interferes
+# with every register the call may overwrite, which makes it a likely spill even if it
+# is only used far away from the call. Instead of spilling it, it can be copied into a
+# new temporary before each call and copied back after it. The new temporaries only
+# span the calls, so they can be kept in callee-saved registers or spilled around the
+# calls, while the original one can live in any register between calls.
+
+
+def is_call(instruction: Instruction) -> bool:
+    return isinstance(instruction, Operation) and instruction.line.startswith("call ")
+
+
+def copy_instruction(source: Temp, destination: Temp) -> Instruction:
+    return Move(line="movq %'s0, %'d0\n", source=[source], destination=[destination])
+
+
+# Splits the live range of the temporary around each of the calls, which it must be
+# live across. The copies are inserted in the instructions, and the temporaries they
+# copy the value into are returned.
+def split_around_calls(
+    instructions: List[Instruction], temporary: Temp, calls: List[Instruction]
+) -> List[Temp]:
+    call_ids = {id(call) for call in calls}
+    result = []
+    new_temporaries = []
+    for instruction in instructions:
+        if id(instruction) not in call_ids:
+            result.append(instruction)
+            continue
+        call_temporary = TempManager.new_temp(TempManager.is_pointer(temporary))
+        new_temporaries.append(call_temporary)
+        result.append(copy_instruction(temporary, call_temporary))
+        result.append(instruction)
+        result.append(copy_instruction(call_temporary, temporary))
+    instructions[:] = result
+    return new_temporaries
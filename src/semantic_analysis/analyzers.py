@@ -1,10 +1,16 @@
-from typing import Set, Optional, Union, List
+from typing import Set, Optional, Union, List, Tuple
 
 from dataclasses import dataclass
 
 import parser.ast_nodes as ast
 from activation_records.temp import TempLabel, TempManager
-from intermediate_representation.escape import find_escape, EscapeError
+from intermediate_representation.call_graph import CallGraph
+from intermediate_representation.escape import (
+    find_escape,
+    find_free_variables,
+    find_local_allocations,
+    EscapeError,
+)
 from intermediate_representation.level import RealLevel, base_program_level
 import intermediate_representation.translate as IRT
 from intermediate_representation.translated_expression import (
@@ -28,6 +34,7 @@ from semantic_analysis.types import (
     NilType,
     StringType,
     are_types_equal,
+    is_pointer_type,
     VoidType,
 )
 
@@ -104,12 +111,18 @@ def check_name_uniqueness(
     return True
 
 
-def translate_program(program: ast.Expression) -> TypedExpression:
+def translate_program(
+    program: ast.Expression, local_allocation: bool = True
+) -> TypedExpression:
     try:
         find_escape(program)
+        find_free_variables(program)
+        if local_allocation:
+            find_local_allocations(program)
     except EscapeError as err:
         raise SemanticError(err.message, err.position)
 
+    CallGraph.initialize()
     program_level = base_program_level()
     translated_program = translate_expression(
         BaseEnvironmentManager.base_value_environment(),
@@ -139,6 +152,19 @@ def translate_variable(
 
     if isinstance(variable, ast.FieldVar):
         # Record field: Look up the variable, check it's a record and that it has the given field.
+        # The fields of a record that never leaves the function are variables.
+        if isinstance(variable.var, ast.SimpleVar):
+            var_value = value_env.find(variable.var.sym)
+            if (
+                isinstance(var_value, VariableEntry)
+                and var_value.field_accesses is not None
+            ):
+                for index, field in enumerate(var_value.type.fields):
+                    if field.name == variable.sym:
+                        return TypedExpression(
+                            IRT.simple_variable(var_value.field_accesses[index], level),
+                            field.type,
+                        )
         trans_var = translate_variable(value_env, type_env, level, variable.var)
         if not isinstance(trans_var.type, RecordType):
             raise SemanticError(
@@ -148,7 +174,12 @@ def translate_variable(
         for index, field in enumerate(trans_var.type.fields):
             if field.name == variable.sym:
                 return TypedExpression(
-                    IRT.field_variable(trans_var.expression, index), field.type
+                    IRT.field_variable(
+                        trans_var.expression,
+                        IRT.record_slots(field_pointers(trans_var.type))[index],
+                        is_pointer_type(field.type),
+                    ),
+                    field.type,
                 )
         raise SemanticError(
             f"Unknown record field name {variable.sym} for variable",
@@ -170,7 +201,11 @@ def translate_variable(
                 "Array subscript must be an Integer", variable.exp.position
             )
         return TypedExpression(
-            IRT.subscript_variable(trans_var.expression, trans_exp.expression),
+            IRT.subscript_variable(
+                trans_var.expression,
+                trans_exp.expression,
+                is_pointer_type(trans_var.type.type),
+            ),
             trans_var.type.type,
         )
 
@@ -233,7 +268,11 @@ def translate_expression(
                 )
         return TypedExpression(
             IRT.call_expression(
-                func_value.label, func_value.level, level, translated_arguments
+                func_value.label,
+                func_value.level,
+                level,
+                translated_arguments,
+                is_pointer_type(func_value.result),
             ),
             func_value.result,
         )
@@ -308,56 +347,12 @@ def translate_expression(
     if isinstance(expression, ast.RecordExp):
         # Record creation: Check the type is a record type, that only and all its defined fields
         # are declared and that all their associated expressions have the declared type.
-        trans_typ = type_env.find(expression.type)
-        if trans_typ is None:
-            raise SemanticError(
-                f"Undefined record type {expression.type}",
-                expression.position,
-            )
-        if not isinstance(trans_typ, RecordType):
-            raise SemanticError(
-                f"Trying to create a record of type {expression.type}, which is not a record type",
-                expression.position,
-            )
-        checked_fields = {}
-        for exp_field in expression.fields:
-            if exp_field.name in checked_fields:
-                raise SemanticError(
-                    f"Repeated field assignment for field {exp_field.name} in record creation",
-                    exp_field.position,
-                )
-            found_field = False
-            expected_field_type = None
-            for type_field in trans_typ.fields:
-                if type_field.name == exp_field.name:
-                    found_field = True
-                    expected_field_type = type_field.type
-                    break
-            if not found_field:
-                raise SemanticError(
-                    f"Unknown field {exp_field.name} in record creation",
-                    exp_field.position,
-                )
-            trans_exp = translate_expression(
-                value_env, type_env, level, exp_field.exp, break_label
-            )
-            checked_fields[exp_field.name] = trans_exp.expression
-            if not are_types_equal(expected_field_type, trans_exp.type):
-                raise SemanticError(
-                    f"Assigning value of a wrong type to field {exp_field.name} in record creation",
-                    exp_field.exp.position,
-                )
-        if len(checked_fields) < len(trans_typ.fields):
-            raise SemanticError(
-                "Missing field assignment in record creation",
-                expression.position,
-            )
-
-        ordered_field_expressions = [
-            checked_fields[field.name] for field in trans_typ.fields
-        ]
+        record_type, field_expressions = translate_record_fields(
+            value_env, type_env, level, expression, break_label
+        )
         return TypedExpression(
-            IRT.record_expression(ordered_field_expressions), trans_typ
+            IRT.record_expression(field_expressions, field_pointers(record_type)),
+            record_type,
         )
 
     if isinstance(expression, ast.SeqExp):
@@ -455,7 +450,10 @@ def translate_expression(
             returned_type = trans_then.type
         return TypedExpression(
             IRT.if_expression(
-                trans_test.expression, trans_then.expression, trans_else.expression
+                trans_test.expression,
+                trans_then.expression,
+                trans_else.expression,
+                is_pointer_type(returned_type),
             ),
             returned_type,
         )
@@ -570,36 +568,16 @@ def translate_expression(
     if isinstance(expression, ast.ArrayExp):
         # Array creation: Check that the declared type is an array type, that the size is an Integer
         # and that the initial value is of the type of the elements of the array.
-        trans_typ = type_env.find(expression.type)
-        if trans_typ is None:
-            raise SemanticError(
-                f"Undefined array type {expression.type}",
-                expression.position,
-            )
-        if not isinstance(trans_typ, ArrayType):
-            raise SemanticError(
-                f"Trying to create an array of type {expression.type}, which is not an array type",
-                expression.position,
-            )
-        trans_size = translate_expression(
-            value_env, type_env, level, expression.size, break_label
+        array_type, trans_size, trans_init = translate_array_creation(
+            value_env, type_env, level, expression, break_label
         )
-        if not isinstance(trans_size.type, IntType):
-            raise SemanticError(
-                "Array size must be an Integer", expression.size.position
-            )
-        trans_init = translate_expression(
-            value_env, type_env, level, expression.init, break_label
-        )
-        if not are_types_equal(trans_typ.type, trans_init.type):
-            raise SemanticError(
-                "Array initial value must be of its declared type",
-                expression.init.position,
-            )
-
         return TypedExpression(
-            IRT.array_expression(trans_size.expression, trans_init.expression),
-            trans_typ,
+            IRT.array_expression(
+                trans_size.expression,
+                trans_init.expression,
+                is_pointer_type(array_type.type),
+            ),
+            array_type,
         )
 
     if isinstance(expression, ast.EmptyExp):
@@ -648,9 +626,22 @@ def translate_declaration(
                         function_dec.position,
                     )
             function_label = TempManager.new_label()
+            # Lifted variables are received in parameters that never escape, since no
+            # function nested in a lifted one accesses its enclosing functions.
+            lifted_types = [
+                value_env.find(name).type for name in function_dec.lifted_variables
+            ]
             function_level = RealLevel(
-                level, function_label, function_dec.param_escapes
-            )
+                level,
+                function_label,
+                function_dec.param_escapes
+                + [False for _ in function_dec.lifted_variables],
+                function_dec.static_link,
+                [is_pointer_type(t) for t in formals + lifted_types],
+            )
+            function_level.lifted_variables = [
+                value_env.find(name).access for name in function_dec.lifted_variables
+            ]
             function_entry = FunctionEntry(
                 function_level, function_label, formals, return_type
             )
@@ -660,8 +651,20 @@ def translate_declaration(
             declaration.function_dec_list, function_entries
         ):
             value_env.begin_scope()
+            # The names of the lifted variables refer to the parameters that receive
+            # them inside the function.
+            for name, lifted_access in zip(
+                function_dec.lifted_variables, function_entry.level.lifted_parameters()
+            ):
+                variable_entry = value_env.find(name)
+                value_env.add(
+                    name,
+                    VariableEntry(
+                        lifted_access, variable_entry.type, variable_entry.is_editable
+                    ),
+                )
             # We ignore the static link since we need the accesses of the REAL function formals.
-            formal_accesses = function_entry.level.formals()[1:]
+            formal_accesses = function_entry.level.parameters()
             for param, formal_type, formal_access in zip(
                 function_dec.params, function_entry.formals, formal_accesses
             ):
@@ -686,39 +689,17 @@ def translate_declaration(
     elif isinstance(declaration, ast.VariableDec):
         # Variable declaration: Translate the expression, make sure its type matches the declared
         # type and that a variable initialized to nil has a type declaration of a record type.
+        if declaration.local_allocation:
+            return translate_local_allocation(
+                value_env, type_env, level, declaration, break_label
+            )
         trans_exp = translate_expression(
             value_env, type_env, level, declaration.exp, break_label
         )
-        if isinstance(trans_exp.type, NilType) and declaration.type is None:
-            raise SemanticError(
-                f"Must declare the type of variable {declaration.name} when initializing it to nil",
-                declaration.position,
-            )
-        variable_type = trans_exp.type
-        if declaration.type is not None:
-            declared_type = type_env.find(declaration.type)
-            if declared_type is None:
-                raise SemanticError(
-                    f"Undefined type {declaration.type} in variable declaration"
-                    + f" for {declaration.name}",
-                    declaration.position,
-                )
-            if isinstance(trans_exp.type, NilType) and not isinstance(
-                declared_type, RecordType
-            ):
-                raise SemanticError(
-                    f"Variable {declaration.name} must be of a record type when initialized to nil",
-                    declaration.position,
-                )
-            if not are_types_equal(declared_type, trans_exp.type):
-                raise SemanticError(
-                    f"Initial value for variable {declaration.name} is not of its"
-                    + f" declared type {declaration.type}",
-                    declaration.position,
-                )
-            variable_type = declared_type
-
-        variable_access = level.alloc_local(declaration.escape)
+        variable_type = variable_declaration_type(type_env, declaration, trans_exp.type)
+        variable_access = level.alloc_local(
+            declaration.escape, is_pointer_type(variable_type)
+        )
         value_env.add(declaration.name, VariableEntry(variable_access, variable_type))
         return IRT.assignment_expression(
             IRT.simple_variable(variable_access, level), trans_exp.expression
@@ -765,6 +746,187 @@ def translate_declaration(
         raise SemanticError("Unknown declaration kind", declaration.position)
 
 
+# Declaration of a variable whose record or array never leaves the function, as found by
+# find_local_allocations. The fields of the record are kept in variables of their own,
+# and the elements of the array in slots of the frame.
+def translate_local_allocation(
+    value_env: SymbolTable[EnvironmentEntry],
+    type_env: SymbolTable[Type],
+    level: RealLevel,
+    declaration: ast.VariableDec,
+    break_label: Optional[TempLabel],
+) -> TranslatedExpression:
+    if isinstance(declaration.exp, ast.RecordExp):
+        record_type, field_expressions = translate_record_fields(
+            value_env, type_env, level, declaration.exp, break_label
+        )
+        variable_type = variable_declaration_type(type_env, declaration, record_type)
+        field_accesses = [
+            level.alloc_local(False, is_pointer_type(field.type))
+            for field in record_type.fields
+        ]
+        value_env.add(
+            declaration.name,
+            VariableEntry(
+                level.alloc_local(False), variable_type, field_accesses=field_accesses
+            ),
+        )
+        return IRT.local_record_expression(
+            [IRT.simple_variable(access, level) for access in field_accesses],
+            field_expressions,
+        )
+
+    array_type, _, trans_init = translate_array_creation(
+        value_env, type_env, level, declaration.exp, break_label
+    )
+    variable_type = variable_declaration_type(type_env, declaration, array_type)
+    variable_access = level.alloc_local(False)
+    value_env.add(declaration.name, VariableEntry(variable_access, variable_type))
+    return IRT.assignment_expression(
+        IRT.simple_variable(variable_access, level),
+        IRT.frame_array_expression(
+            level,
+            declaration.exp.size.int,
+            trans_init.expression,
+            is_pointer_type(array_type.type),
+        ),
+    )
+
+
+def translate_record_fields(
+    value_env: SymbolTable[EnvironmentEntry],
+    type_env: SymbolTable[Type],
+    level: RealLevel,
+    expression: ast.RecordExp,
+    break_label: Optional[TempLabel],
+) -> Tuple[RecordType, List[TranslatedExpression]]:
+    trans_typ = type_env.find(expression.type)
+    if trans_typ is None:
+        raise SemanticError(
+            f"Undefined record type {expression.type}",
+            expression.position,
+        )
+    if not isinstance(trans_typ, RecordType):
+        raise SemanticError(
+            f"Trying to create a record of type {expression.type}, which is not a record type",
+            expression.position,
+        )
+    checked_fields = {}
+    for exp_field in expression.fields:
+        if exp_field.name in checked_fields:
+            raise SemanticError(
+                f"Repeated field assignment for field {exp_field.name} in record creation",
+                exp_field.position,
+            )
+        found_field = False
+        expected_field_type = None
+        for type_field in trans_typ.fields:
+            if type_field.name == exp_field.name:
+                found_field = True
+                expected_field_type = type_field.type
+                break
+        if not found_field:
+            raise SemanticError(
+                f"Unknown field {exp_field.name} in record creation",
+                exp_field.position,
+            )
+        trans_exp = translate_expression(
+            value_env, type_env, level, exp_field.exp, break_label
+        )
+        checked_fields[exp_field.name] = trans_exp.expression
+        if not are_types_equal(expected_field_type, trans_exp.type):
+            raise SemanticError(
+                f"Assigning value of a wrong type to field {exp_field.name} in record creation",
+                exp_field.exp.position,
+            )
+    if len(checked_fields) < len(trans_typ.fields):
+        raise SemanticError(
+            "Missing field assignment in record creation",
+            expression.position,
+        )
+
+    ordered_field_expressions = [
+        checked_fields[field.name] for field in trans_typ.fields
+    ]
+    return trans_typ, ordered_field_expressions
+
+
+def translate_array_creation(
+    value_env: SymbolTable[EnvironmentEntry],
+    type_env: SymbolTable[Type],
+    level: RealLevel,
+    expression: ast.ArrayExp,
+    break_label: Optional[TempLabel],
+) -> Tuple[ArrayType, TypedExpression, TypedExpression]:
+    trans_typ = type_env.find(expression.type)
+    if trans_typ is None:
+        raise SemanticError(
+            f"Undefined array type {expression.type}",
+            expression.position,
+        )
+    if not isinstance(trans_typ, ArrayType):
+        raise SemanticError(
+            f"Trying to create an array of type {expression.type}, which is not an array type",
+            expression.position,
+        )
+    trans_size = translate_expression(
+        value_env, type_env, level, expression.size, break_label
+    )
+    if not isinstance(trans_size.type, IntType):
+        raise SemanticError("Array size must be an Integer", expression.size.position)
+    trans_init = translate_expression(
+        value_env, type_env, level, expression.init, break_label
+    )
+    if not are_types_equal(trans_typ.type, trans_init.type):
+        raise SemanticError(
+            "Array initial value must be of its declared type",
+            expression.init.position,
+        )
+    return trans_typ, trans_size, trans_init
+
+
+# Type of the declared variable, checking that the type of its initial value matches the
+# declared one and that a variable initialized to nil has a type declaration of a record
+# type.
+def variable_declaration_type(
+    type_env: SymbolTable[Type], declaration: ast.VariableDec, expression_type: Type
+) -> Type:
+    if isinstance(expression_type, NilType) and declaration.type is None:
+        raise SemanticError(
+            f"Must declare the type of variable {declaration.name} when initializing it to nil",
+            declaration.position,
+        )
+    variable_type = expression_type
+    if declaration.type is not None:
+        declared_type = type_env.find(declaration.type)
+        if declared_type is None:
+            raise SemanticError(
+                f"Undefined type {declaration.type} in variable declaration"
+                + f" for {declaration.name}",
+                declaration.position,
+            )
+        if isinstance(expression_type, NilType) and not isinstance(
+            declared_type, RecordType
+        ):
+            raise SemanticError(
+                f"Variable {declaration.name} must be of a record type when initialized to nil",
+                declaration.position,
+            )
+        if not are_types_equal(declared_type, expression_type):
+            raise SemanticError(
+                f"Initial value for variable {declaration.name} is not of its"
+                + f" declared type {declaration.type}",
+                declaration.position,
+            )
+        variable_type = declared_type
+    return variable_type
+
+
+# Which fields of the record type are pointers.
+def field_pointers(record_type: RecordType) -> List[bool]:
+    return [is_pointer_type(field.type) for field in record_type.fields]
+
+
 def translate_type(type_env: SymbolTable[Type], ty: ast.Type) -> Type:
     if isinstance(ty, ast.NameTy):
         # Named type: Look it up in the type environment.
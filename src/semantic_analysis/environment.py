@@ -1,5 +1,5 @@
 from abc import ABC
-from typing import List
+from typing import List, Optional
 
 from dataclasses import dataclass
 
@@ -18,6 +18,9 @@ class VariableEntry(EnvironmentEntry):
     access: Access
     type: Type
     is_editable: bool = True
+    # Accesses of the fields of a record that never leaves the function, which are kept
+    # in variables of their own instead of allocating the record.
+    field_accesses: Optional[List[Access]] = None
 
 
 @dataclass
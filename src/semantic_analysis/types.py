@@ -61,3 +61,9 @@ def are_types_equal(t1: Type, t2: Type) -> bool:
         and isinstance(t2, VoidType)
         or t1 is t2
     )
+
+
+def is_pointer_type(t: Type) -> bool:
+    """Sees if the values of a type are addresses of objects that the garbage collector manages."""
+
+    return isinstance(t, (RecordType, ArrayType, StringType))
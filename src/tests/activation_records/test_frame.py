@@ -0,0 +1,160 @@
+import unittest
+
+import instruction_selection.assembly as Assembly
+from activation_records.frame import (
+    Frame,
+    TempMap,
+    assembly_procedure,
+    free_frame_placeholder,
+    string_literal,
+    temp_to_str,
+)
+from activation_records.temp import TempManager
+
+
+class TestAssemblyProcedure(unittest.TestCase):
+    def setUp(self):
+        TempMap.initialize()
+
+    def test_only_used_callee_saved_registers_are_saved(self):
+        procedure = assembly_procedure(
+            Frame(TempManager.new_label(), []),
+            [self._definition("rbx"), self._definition("r10"), self._call()],
+        )
+        self.assertIn("subq $16, %rsp\nmovq %rbx, -8(%rbp)\n", procedure.prologue)
+        self.assertNotIn("r12", procedure.prologue)
+        self.assertIn(
+            "movq -8(%rbp), %rbx\nmovq %rbp, %rsp\npopq %rbp\n", procedure.epilogue
+        )
+
+    def test_saved_registers_keep_stack_aligned(self):
+        frame = Frame(TempManager.new_label(), [True])
+        procedure = assembly_procedure(
+            frame, [self._definition("rbx"), self._definition("r12"), self._call()]
+        )
+        # The parameter and the two registers take 24 bytes, rounded up to 32.
+        self.assertIn(
+            "subq $32, %rsp\nmovq %rbx, -16(%rbp)\nmovq %r12, -24(%rbp)\n",
+            procedure.prologue,
+        )
+        self.assertIn(
+            "movq -16(%rbp), %rbx\nmovq -24(%rbp), %r12\n", procedure.epilogue
+        )
+
+    def test_outgoing_arguments_are_reserved_with_the_frame(self):
+        frame = Frame(TempManager.new_label(), [True])
+        frame.reserve_outgoing_arguments(9)
+        frame.reserve_outgoing_arguments(7)
+        procedure = assembly_procedure(frame, [self._definition("rbx"), self._call()])
+        # A parameter, rbx and the 3 arguments of the largest call take 40 bytes.
+        self.assertIn("subq $48, %rsp\nmovq %rbx, -16(%rbp)\n", procedure.prologue)
+        self.assertEqual(frame.outgoing_arguments_size, 24)
+
+    def test_tail_call_restores_saved_registers(self):
+        tail_call = Assembly.Operation(
+            line=f"{free_frame_placeholder}jmp lab_1\n",
+            source=[],
+            destination=[],
+            jump=[],
+        )
+        procedure = assembly_procedure(
+            Frame(TempManager.new_label(), []),
+            [self._call(), self._definition("r13"), tail_call],
+        )
+        self.assertEqual(
+            procedure.body[-1].format(temp_to_str),
+            "movq -8(%rbp), %r13\nmovq %rbp, %rsp\npopq %rbp\njmp lab_1\n",
+        )
+
+    def test_calls_that_may_collect_have_stack_maps(self):
+        frame = Frame(TempManager.new_label(), [])
+        frame.alloc_local(True, pointer=True)
+        allocation = self._call("init_record")
+        procedure = assembly_procedure(
+            frame,
+            [allocation, self._call("print_num")],
+            {id(allocation): [-16]},
+        )
+        self.assertEqual(len(procedure.stack_maps), 1)
+        stack_map = procedure.stack_maps[0]
+        self.assertEqual(stack_map.offsets, [-16, -8])
+        self.assertEqual(
+            procedure.body[1], Assembly.Label(f"{stack_map.label}:\n", stack_map.label)
+        )
+        # The pointer in the frame is cleared before it is assigned.
+        self.assertIn("movq $0, -8(%rbp)\n", procedure.prologue)
+
+    def test_leaf_function_has_no_frame(self):
+        procedure = assembly_procedure(
+            Frame(TempManager.new_label(), []), [self._definition("rax")]
+        )
+        self.assertNotIn("rbp", procedure.prologue + procedure.epilogue)
+        self.assertNotIn("rsp", procedure.prologue + procedure.epilogue)
+
+    def test_leaf_function_addresses_slots_from_stack_pointer(self):
+        frame = Frame(TempManager.new_label(), [True] * 7)
+        frame.alloc_local(True)
+        load = Assembly.Operation(
+            line="movq -16(%'s0), %'d0\n",
+            source=[TempMap.register_to_temp["rbp"]],
+            destination=[TempMap.register_to_temp["rbx"]],
+            jump=None,
+        )
+        argument = Assembly.Operation(
+            line="addq 16(%'s1), %'d0\n",
+            source=[TempMap.register_to_temp["rax"], TempMap.register_to_temp["rbp"]],
+            destination=[TempMap.register_to_temp["rax"]],
+            jump=None,
+        )
+        procedure = assembly_procedure(frame, [load, argument])
+
+        # 6 register parameters and a local: 56 bytes of slots plus rbx.
+        self.assertIn("subq $56, %rsp\npushq %rbx\n", procedure.prologue)
+        self.assertIn("popq %rbx\naddq $56, %rsp\nret\n", procedure.epilogue)
+        self.assertEqual(load.format(temp_to_str), "movq 48(%rsp), %rbx\n")
+        self.assertEqual(argument.format(temp_to_str), "addq 72(%rsp), %rax\n")
+
+    def test_frame_pointer_used_as_value_keeps_frame(self):
+        static_link = Assembly.Move(
+            line="movq %'s0, %'d0\n",
+            source=[TempMap.register_to_temp["rbp"]],
+            destination=[TempMap.register_to_temp["rax"]],
+        )
+        procedure = assembly_procedure(
+            Frame(TempManager.new_label(), [True]), [static_link]
+        )
+        self.assertIn("movq %rsp, %rbp\n", procedure.prologue)
+
+    def _call(self, function: str = "print_int") -> Assembly.Instruction:
+        return Assembly.Operation(
+            line=f"call {function}\n",
+            source=[],
+            destination=[TempMap.register_to_temp["rax"]],
+            jump=None,
+        )
+
+    def _definition(self, register: str) -> Assembly.Instruction:
+        return Assembly.Operation(
+            line="movq $1, %'d0\n",
+            source=[],
+            destination=[TempMap.register_to_temp[register]],
+            jump=None,
+        )
+
+
+class TestStringLiteral(unittest.TestCase):
+    def test_literal_starts_with_its_length_and_hash(self):
+        literal = string_literal("lab_1", r'"a\"b\n\065\^c\\"')
+
+        self.assertEqual(
+            literal,
+            "\t.balign 8\nlab_1:\n"
+            + "\t.quad 7, 4858806065761963226\n"
+            + '\t.asciz "a\\042b\\012A\\003\\134"\n',
+        )
+
+    def test_formatting_sequence_is_ignored(self):
+        literal = string_literal("lab_1", '"long\\\n    \\string"')
+
+        self.assertIn(".quad 10, ", literal)
+        self.assertIn('.asciz "longstring"', literal)
@@ -0,0 +1,141 @@
+import unittest
+from typing import List
+
+import instruction_selection.assembly as Assembly
+from activation_records.frame import TempMap
+from activation_records.peephole import (
+    PeepholeStatistics,
+    instruction_text,
+    move,
+    operation,
+    peephole_optimize,
+)
+
+
+class TestPeephole(unittest.TestCase):
+    def setUp(self):
+        TempMap.initialize()
+        PeepholeStatistics.reset()
+
+    def test_store_then_reload_becomes_move(self):
+        instructions = [
+            operation("movq %'s0, -8(%'s1)", ["rbx", "rbp"], []),
+            operation("movq -8(%'s0), %'d0", ["rbp"], ["rcx"]),
+            self._exit(["rcx"]),
+        ]
+        self.assertEqual(
+            self._optimized_texts(instructions),
+            ["movq %rbx, -8(%rbp)", "movq %rbx, %rcx", "ret"],
+        )
+        self.assertEqual(PeepholeStatistics.hits, {"store_reload": 1})
+
+    def test_reload_into_stored_register_is_removed(self):
+        instructions = [
+            operation("movq %'s0, -8(%'s1)", ["rbx", "rbp"], []),
+            operation("movq -8(%'s0), %'d0", ["rbp"], ["rbx"]),
+            self._exit(["rbx"]),
+        ]
+        self.assertEqual(
+            self._optimized_texts(instructions), ["movq %rbx, -8(%rbp)", "ret"]
+        )
+
+    def test_compare_against_zero_becomes_test(self):
+        instructions = [
+            operation("movq $0, %'d0", [], ["rcx"]),
+            operation("cmpq %'s0, %'s1", ["rcx", "rbx"], []),
+            self._conditional_jump(),
+            self._label(),
+            self._exit(["rax"]),
+        ]
+        self.assertEqual(
+            self._optimized_texts(instructions)[0:2], ["testq %rbx, %rbx", "je lab_1"]
+        )
+        self.assertEqual(PeepholeStatistics.hits, {"compare_zero": 1})
+
+    def test_compare_against_live_zero_is_kept(self):
+        instructions = [
+            operation("movq $0, %'d0", [], ["rcx"]),
+            operation("cmpq %'s0, %'s1", ["rcx", "rbx"], []),
+            self._conditional_jump(),
+            self._label(),
+            self._exit(["rcx"]),
+        ]
+        self.assertEqual(
+            self._optimized_texts(instructions)[0:2],
+            ["xorl %ecx, %ecx", "cmpq %rcx, %rbx"],
+        )
+
+    def test_zero_register_becomes_xor(self):
+        instructions = [operation("movq $0, %'d0", [], ["r8"]), self._exit(["r8"])]
+        self.assertEqual(
+            self._optimized_texts(instructions), ["xorl %r8d, %r8d", "ret"]
+        )
+        self.assertEqual(PeepholeStatistics.hits, {"zero_register": 1})
+
+    def test_zero_register_keeps_read_flags(self):
+        instructions = [
+            operation("cmpq %'s0, %'s1", ["rax", "rbx"], []),
+            operation("movq $0, %'d0", [], ["rcx"]),
+            self._conditional_jump(),
+            self._label(),
+            self._exit(["rcx"]),
+        ]
+        self.assertIn("movq $0, %rcx", self._optimized_texts(instructions))
+
+    def test_jump_to_next_label_is_removed(self):
+        instructions = [
+            Assembly.Operation(
+                line="jmp 'j0\n", source=[], destination=[], jump=["lab_1"]
+            ),
+            self._label(),
+            self._exit(["rax"]),
+        ]
+        self.assertEqual(self._optimized_texts(instructions), ["lab_1:", "ret"])
+
+    def test_stack_pointer_adjustments_are_merged(self):
+        instructions = [
+            operation("addq $16, %'d0", ["rsp"], ["rsp"]),
+            operation("subq $24, %'d0", ["rsp"], ["rsp"]),
+            self._exit(["rax"]),
+        ]
+        self.assertEqual(self._optimized_texts(instructions), ["subq $8, %rsp", "ret"])
+
+    def test_opposite_stack_pointer_adjustments_cancel(self):
+        instructions = [
+            operation("subq $8, %'d0", ["rsp"], ["rsp"]),
+            operation("addq $8, %'d0", ["rsp"], ["rsp"]),
+            self._exit(["rax"]),
+        ]
+        self.assertEqual(self._optimized_texts(instructions), ["ret"])
+
+    def test_unrelated_instructions_are_kept(self):
+        instructions = [
+            move("rbx", "rcx"),
+            operation("addq %'s0, %'d0", ["rbx", "rcx"], ["rcx"]),
+            self._exit(["rcx"]),
+        ]
+        self.assertEqual(
+            self._optimized_texts(instructions),
+            ["movq %rbx, %rcx", "addq %rbx, %rcx", "ret"],
+        )
+        self.assertEqual(PeepholeStatistics.hits, {})
+
+    def _conditional_jump(self) -> Assembly.Instruction:
+        return Assembly.Operation(
+            line="je 'j0\n", source=[], destination=[], jump=["lab_1"]
+        )
+
+    def _label(self) -> Assembly.Instruction:
+        return Assembly.Label(line="lab_1:\n", label="lab_1")
+
+    # Leaves the procedure keeping the given registers live until its end.
+    def _exit(self, live_registers: List[str]) -> Assembly.Instruction:
+        instruction = operation("ret", live_registers, [])
+        instruction.jump = []
+        return instruction
+
+    def _optimized_texts(self, instructions: List[Assembly.Instruction]) -> List[str]:
+        return [
+            instruction_text(instruction)
+            for instruction in peephole_optimize(instructions)
+        ]
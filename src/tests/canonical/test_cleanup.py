@@ -0,0 +1,164 @@
+import copy
+import unittest
+from typing import List
+
+import intermediate_representation.tree as irt
+from canonical.basic_block import basic_block
+from canonical.cleanup import ControlFlowStatistics, clean_up_control_flow
+from canonical.linearize import linearize
+from canonical.trace import trace_schedule
+from intermediate_representation.fragment import FragmentManager, ProcessFragment
+from tests.utils.compilation_steps import semantic_analysis
+
+
+class TestCleanup(unittest.TestCase):
+    def setUp(self):
+        FragmentManager.fragment_list = []
+        ControlFlowStatistics.reset()
+
+    def test_jump_to_a_jump_is_threaded(self):
+        statements = clean_up_control_flow(
+            [
+                irt.Label("start"),
+                self._conditional_jump("middle", "next"),
+                irt.Label("next"),
+                self._jump("end"),
+                irt.Label("middle"),
+                self._jump("end"),
+                irt.Label("end"),
+            ]
+        )
+
+        # Both branches end up going to the same place.
+        self.assertEqual(
+            statements,
+            [
+                irt.Label("start"),
+                self._conditional_jump("end", "end"),
+                irt.Label("end"),
+            ],
+        )
+        self.assertEqual(ControlFlowStatistics.removed_blocks, 2)
+        self.assertEqual(ControlFlowStatistics.removed_jumps, 2)
+
+    def test_empty_and_unreachable_blocks_are_removed(self):
+        statements = clean_up_control_flow(
+            [
+                irt.Label("start"),
+                self._conditional_jump("later", "empty"),
+                irt.Label("empty"),
+                irt.Label("body"),
+                self._move(1),
+                self._jump("end"),
+                irt.Label("unreachable"),
+                self._move(2),
+                self._jump("body"),
+                irt.Label("later"),
+                self._move(3),
+                irt.Label("end"),
+            ]
+        )
+
+        # The false label of the conditional jump is still the next one.
+        self.assertEqual(
+            statements,
+            [
+                irt.Label("start"),
+                self._conditional_jump("later", "body"),
+                irt.Label("body"),
+                self._move(1),
+                self._jump("end"),
+                irt.Label("later"),
+                self._move(3),
+                irt.Label("end"),
+            ],
+        )
+        self.assertEqual(ControlFlowStatistics.removed_blocks, 2)
+        self.assertEqual(ControlFlowStatistics.removed_jumps, 1)
+
+    def test_block_only_reached_by_a_jump_is_merged(self):
+        statements = clean_up_control_flow(
+            [
+                irt.Label("start"),
+                self._move(1),
+                self._jump("target"),
+                irt.Label("other"),
+                self._move(2),
+                self._jump("end"),
+                irt.Label("target"),
+                self._move(3),
+                self._jump("other"),
+                irt.Label("end"),
+            ]
+        )
+
+        self.assertEqual(
+            statements,
+            [
+                irt.Label("start"),
+                self._move(1),
+                self._move(3),
+                self._move(2),
+                irt.Label("end"),
+            ],
+        )
+
+    def test_example_66(self):
+        self._clean_up("test66.tig")
+
+    def test_example_merge(self):
+        self._clean_up("merge.tig")
+
+    def test_example_queens(self):
+        self._clean_up("queens.tig")
+
+    def test_example_tail_calls(self):
+        self._clean_up("tail_calls.tig")
+
+    def _clean_up(self, file_name: str):
+        semantic_analysis(file_name)
+        for fragment in FragmentManager.get_fragments():
+            if isinstance(fragment, ProcessFragment):
+                block = basic_block(linearize(fragment.body))
+                traced_statements = trace_schedule(block)
+                original_statements = copy.deepcopy(traced_statements)
+                statements = clean_up_control_flow(list(traced_statements))
+                # The statements given to the clean-up are not modified.
+                self.assertEqual(traced_statements, original_statements)
+                self.assertEqual(statements[0], traced_statements[0])
+                self.assertEqual(statements[-1], irt.Label(block.label))
+                self._assert_jumps_have_targets(statements, traced_statements)
+
+    # Every conditional jump is followed by its false label, and every label that the
+    # statements jump to is still there.
+    def _assert_jumps_have_targets(
+        self, statements: List[irt.Statement], traced_statements: List[irt.Statement]
+    ):
+        labels = {
+            statement.label
+            for statement in statements
+            if isinstance(statement, irt.Label)
+        }
+        traced_labels = {
+            statement.label
+            for statement in traced_statements
+            if isinstance(statement, irt.Label)
+        }
+        for index, statement in enumerate(statements):
+            if isinstance(statement, irt.ConditionalJump):
+                self.assertEqual(statements[index + 1], irt.Label(statement.false))
+                self.assertIn(statement.true, labels)
+            elif isinstance(statement, irt.Jump):
+                for label in statement.labels:
+                    self.assertTrue(label in labels or label not in traced_labels)
+
+    def _move(self, value: int) -> irt.Statement:
+        return irt.Move(irt.Temporary(1), irt.Constant(value))
+
+    def _jump(self, label: str) -> irt.Statement:
+        return irt.Jump(irt.Name(label), [label])
+
+    def _conditional_jump(self, true: str, false: str) -> irt.Statement:
+        return irt.ConditionalJump(
+            irt.RelationalOperator.eq, irt.Temporary(1), irt.Constant(0), true, false
+        )
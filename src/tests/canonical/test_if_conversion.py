@@ -0,0 +1,89 @@
+import unittest
+
+import intermediate_representation.tree as irt
+from canonical.if_conversion import convert_ifs
+
+
+class TestIfConversion(unittest.TestCase):
+    def test_value_if_becomes_a_conditional_move(self):
+        statements = convert_ifs(
+            [
+                irt.Label("start"),
+                self._conditional_jump("true", "false"),
+                irt.Label("false"),
+                self._move(irt.Temporary(2)),
+                self._jump("end"),
+                irt.Label("true"),
+                self._move(irt.Constant(1)),
+                irt.Label("end"),
+                self._move(irt.Temporary(1)),
+            ]
+        )
+
+        self.assertEqual(
+            statements,
+            [
+                irt.Label("start"),
+                self._move(irt.Temporary(2)),
+                irt.ConditionalMove(
+                    irt.RelationalOperator.lt,
+                    irt.Temporary(2),
+                    irt.Temporary(3),
+                    irt.Temporary(1),
+                    irt.Constant(1),
+                ),
+                self._jump("end"),
+                irt.Label("end"),
+                self._move(irt.Temporary(1)),
+            ],
+        )
+
+    def test_values_that_may_fail_keep_their_branches(self):
+        # Dividing by zero or calling a function can not be done in advance.
+        for value in (
+            irt.BinaryOperation(
+                irt.BinaryOperator.div, irt.Temporary(2), irt.Temporary(3)
+            ),
+            irt.Call(irt.Name("f"), []),
+            irt.Memory(irt.Temporary(2)),
+        ):
+            statements = self._diamond(value)
+            self.assertEqual(convert_ifs(list(statements)), statements)
+
+    def test_result_read_by_the_comparison_keeps_its_branches(self):
+        statements = [
+            irt.Label("start"),
+            irt.ConditionalJump(
+                irt.RelationalOperator.lt,
+                irt.Temporary(1),
+                irt.Temporary(3),
+                "true",
+                "false",
+            ),
+        ] + self._diamond(irt.Constant(1))[2:]
+
+        self.assertEqual(convert_ifs(list(statements)), statements)
+
+    def _diamond(self, true_value: irt.Expression):
+        return [
+            irt.Label("start"),
+            self._conditional_jump("true", "false"),
+            irt.Label("false"),
+            self._move(irt.Constant(0)),
+            self._jump("end"),
+            irt.Label("true"),
+            self._move(true_value),
+            self._jump("end"),
+            irt.Label("end"),
+        ]
+
+    def _move(self, value: irt.Expression) -> irt.Statement:
+        return irt.Move(irt.Temporary(1), value)
+
+    def _jump(self, label: str) -> irt.Statement:
+        return irt.Jump(irt.Name(label), [label])
+
+    def _conditional_jump(self, true: str, false: str) -> irt.Statement:
+        return irt.ConditionalJump(
+            irt.RelationalOperator.lt, irt.Temporary(2), irt.Temporary(3), true, false
+        )
@@ -0,0 +1,36 @@
+import unittest
+
+import intermediate_representation.tree as irt
+from canonical.basic_block import BasicBlock
+from canonical.profile import Profile, block_keys, record_block_counts
+
+
+class TestProfile(unittest.TestCase):
+    def setUp(self):
+        Profile.initialize()
+
+    def test_blocks_are_identified_by_labels_kept_between_builds(self):
+        # lab_3 and lab_4 existed before canonization, while lab_8 and lab_9 did not.
+        block = self._block(["lab_7", "lab_3", "lab_8", "lab_9", "lab_4"])
+
+        keys = block_keys("lab_1", block, first_new_label=5)
+
+        self.assertEqual(keys, ["lab_1", "lab_3", "lab_3+", "lab_3++", "lab_4"])
+
+    def test_inlined_copies_get_the_counts_of_the_original_blocks(self):
+        Profile.counts = {"lab_1": 2, "lab_3": 10, "lab_3+": 4}
+        Profile.record_copy("lab_6", "lab_3")
+        block = self._block(["lab_9", "lab_6", "lab_10"])
+
+        record_block_counts(block, block_keys("lab_1", block, first_new_label=8))
+
+        self.assertEqual(Profile.block_counts, {"lab_9": 2, "lab_6": 10, "lab_10": 4})
+
+    def _block(self, labels) -> BasicBlock:
+        return BasicBlock(
+            "done",
+            [
+                [irt.Label(label), irt.Jump(irt.Name("done"), ["done"])]
+                for label in labels
+            ],
+        )
@@ -215,6 +215,91 @@ class TestTrace(unittest.TestCase):
     def test_example_queens(self):
         self._schedule_traces("queens.tig")
 
+    def test_conditional_jump_falls_through_to_the_false_branch(self):
+        traced_statements = trace_schedule(self._branch_block())
+
+        jump = traced_statements[1]
+        self.assertEqual(jump.operator, irt.RelationalOperator.lt)
+        self.assertEqual(traced_statements[2], irt.Label(jump.false))
+        self.assertEqual(jump.false, "cold")
+
+    def test_conditional_jump_falls_through_to_the_branch_hot_in_the_profile(self):
+        block_counts = {"start": 10, "hot": 9, "cold": 1}
+        traced_statements = trace_schedule(self._branch_block(), block_counts)
+
+        # The condition is negated so that the true branch follows the jump.
+        jump = traced_statements[1]
+        self.assertEqual(jump.operator, irt.RelationalOperator.ge)
+        self.assertEqual(traced_statements[2], irt.Label("hot"))
+        self.assertEqual((jump.true, jump.false), ("cold", "hot"))
+        self._assert_conditional_jump_label_placement(traced_statements)
+
+    def test_loop_is_rotated_to_test_its_condition_at_the_bottom(self):
+        traced_statements = trace_schedule(self._loop_block())
+
+        labels = [
+            statement.label
+            for statement in traced_statements
+            if isinstance(statement, irt.Label)
+        ]
+        self.assertEqual(labels, ["start", "body", "test", "exit", "done"])
+        # The body falls through to the test, which jumps back to it.
+        self.assertNotIn(irt.Jump(irt.Name("test"), ["test"]), traced_statements[3:])
+        jump = traced_statements[traced_statements.index(irt.Label("test")) + 1]
+        self.assertEqual((jump.true, jump.false), ("body", "exit"))
+
+    def test_loop_is_not_rotated_if_disabled(self):
+        traced_statements = trace_schedule(self._loop_block(), rotate_loops=False)
+
+        labels = [
+            statement.label
+            for statement in traced_statements
+            if isinstance(statement, irt.Label)
+        ]
+        self.assertEqual(labels, ["start", "test", "exit", "body", "done"])
+
+    # A block that jumps to "hot" if the temporary is less than zero, and to "cold"
+    # otherwise.
+    def _branch_block(self) -> BasicBlock:
+        return BasicBlock(
+            "done",
+            [
+                [
+                    irt.Label("start"),
+                    irt.ConditionalJump(
+                        irt.RelationalOperator.lt,
+                        irt.Temporary(1),
+                        irt.Constant(0),
+                        "hot",
+                        "cold",
+                    ),
+                ],
+                [irt.Label("cold"), irt.Jump(irt.Name("done"), ["done"])],
+                [irt.Label("hot"), irt.Jump(irt.Name("done"), ["done"])],
+            ],
+        )
+
+    # A while loop, running the body while the temporary is not zero.
+    def _loop_block(self) -> BasicBlock:
+        return BasicBlock(
+            "done",
+            [
+                [irt.Label("start"), irt.Jump(irt.Name("test"), ["test"])],
+                [
+                    irt.Label("test"),
+                    irt.ConditionalJump(
+                        irt.RelationalOperator.ne,
+                        irt.Temporary(1),
+                        irt.Constant(0),
+                        "body",
+                        "exit",
+                    ),
+                ],
+                [irt.Label("body"), irt.Jump(irt.Name("test"), ["test"])],
+                [irt.Label("exit"), irt.Jump(irt.Name("done"), ["done"])],
+            ],
+        )
+
     def _schedule_traces(self, file_name: str):
         semantic_analysis(file_name)
         for fragment in FragmentManager.get_fragments():
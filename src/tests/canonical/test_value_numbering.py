@@ -0,0 +1,203 @@
+import unittest
+from typing import List
+
+import intermediate_representation.tree as irt
+from activation_records.frame import TempMap, frame_pointer
+from activation_records.temp import TempManager
+from canonical.basic_block import basic_block
+from canonical.linearize import linearize
+from canonical.value_numbering import ValueTable, value_number_block
+from intermediate_representation.fragment import FragmentManager, ProcessFragment
+from tests.utils.compilation_steps import semantic_analysis
+
+
+class TestValueNumbering(unittest.TestCase):
+    """Checks that repeated computations inside a block are evaluated only once, and
+    that stores, calls and temporary redefinitions prevent reusing stale values."""
+
+    def setUp(self):
+        FragmentManager.fragment_list = []
+        TempMap.initialize()
+        self.array = irt.Temporary(TempManager.new_temp())
+        self.index = irt.Temporary(TempManager.new_temp())
+        self.result = irt.Temporary(TempManager.new_temp())
+
+    def test_repeated_address_is_computed_once(self):
+        # a[i] := a[i] + 1
+        statements = [
+            irt.Label("block"),
+            irt.Move(
+                irt.Memory(self._element_address()),
+                irt.BinaryOperation(
+                    irt.BinaryOperator.plus,
+                    irt.Memory(self._element_address()),
+                    irt.Constant(1),
+                ),
+            ),
+            irt.Jump(irt.Name("done"), ["done"]),
+        ]
+        numbered = value_number_block(statements, ValueTable())
+        self.assertEqual(self._count_multiplications(numbered), 1)
+
+    def test_commutative_operands_are_reused(self):
+        statements = [
+            irt.Move(
+                self.result,
+                irt.BinaryOperation(irt.BinaryOperator.plus, self.array, self.index),
+            ),
+            irt.Move(
+                irt.Memory(
+                    irt.BinaryOperation(irt.BinaryOperator.plus, self.index, self.array)
+                ),
+                irt.Constant(0),
+            ),
+        ]
+        numbered = value_number_block(statements, ValueTable())
+        self.assertEqual(
+            numbered[1], irt.Move(irt.Memory(self.result), irt.Constant(0))
+        )
+
+    def test_store_to_unknown_address_prevents_reuse(self):
+        statements = [
+            irt.Move(self.result, irt.Memory(self.array)),
+            irt.Move(irt.Memory(self.index), irt.Constant(0)),
+            irt.Move(self.result, irt.Memory(self.array)),
+        ]
+        numbered = value_number_block(statements, ValueTable())
+        self.assertEqual(numbered, statements)
+
+    def test_store_to_frame_slot_keeps_other_slots(self):
+        first_slot = self._frame_slot(-8)
+        statements = [
+            irt.Move(self.result, first_slot),
+            irt.Move(self._frame_slot(-16), irt.Constant(0)),
+            irt.Move(self.index, self._frame_slot(-8)),
+        ]
+        numbered = value_number_block(statements, ValueTable())
+        self.assertEqual(numbered[2], irt.Move(self.index, self.result))
+
+    def test_store_through_other_address_invalidates_frame_slots(self):
+        # The array temporary may hold the address of the slot.
+        statements = [
+            irt.Move(self.result, self._frame_slot(-8)),
+            irt.Move(irt.Memory(self.array), irt.Constant(0)),
+            irt.Move(self.index, self._frame_slot(-8)),
+        ]
+        numbered = value_number_block(statements, ValueTable())
+        self.assertEqual(numbered[-1].temporary, self.index)
+        self.assertIsInstance(numbered[-1].expression, irt.Memory)
+
+    def test_store_to_frame_slot_invalidates_other_addresses(self):
+        statements = [
+            irt.Move(self.result, irt.Memory(self.array)),
+            irt.Move(self._frame_slot(-8), irt.Constant(0)),
+            irt.Move(self.index, irt.Memory(self.array)),
+        ]
+        numbered = value_number_block(statements, ValueTable())
+        self.assertEqual(numbered, statements)
+
+    def test_stored_value_is_forwarded(self):
+        statements = [
+            irt.Move(irt.Memory(self.array), self.index),
+            irt.Move(self.result, irt.Memory(self.array)),
+        ]
+        numbered = value_number_block(statements, ValueTable())
+        self.assertEqual(numbered[1], irt.Move(self.result, self.index))
+
+    def test_call_prevents_reuse(self):
+        statements = [
+            irt.Move(self.result, irt.Memory(self.array)),
+            irt.StatementExpression(irt.Call(irt.Name("f"), [])),
+            irt.Move(self.index, irt.Memory(self.array)),
+        ]
+        numbered = value_number_block(statements, ValueTable())
+        self.assertEqual(numbered, statements)
+
+    def test_address_inside_object_is_not_reused_across_call(self):
+        # The garbage collector may move the record during the call.
+        record = irt.Temporary(TempManager.new_temp(pointer=True))
+        field = irt.BinaryOperation(irt.BinaryOperator.plus, record, irt.Constant(8))
+        statements = [
+            irt.Move(self.result, irt.Memory(field)),
+            irt.StatementExpression(irt.Call(irt.Name("f"), [])),
+            irt.Move(irt.Memory(field), self.index),
+        ]
+        numbered = value_number_block(statements, ValueTable())
+        self.assertEqual(numbered, statements)
+
+    def test_redefined_temporary_prevents_reuse(self):
+        addition = irt.BinaryOperation(
+            irt.BinaryOperator.plus, self.array, irt.Constant(8)
+        )
+        statements = [
+            irt.Move(self.result, addition),
+            irt.Move(self.array, irt.Constant(0)),
+            irt.Move(self.index, addition),
+        ]
+        numbered = value_number_block(statements, ValueTable())
+        self.assertEqual(numbered, statements)
+
+    def test_overwritten_holder_is_not_reused(self):
+        addition = irt.BinaryOperation(
+            irt.BinaryOperator.plus, self.array, irt.Constant(8)
+        )
+        statements = [
+            irt.Move(self.result, addition),
+            irt.Move(self.result, irt.Constant(0)),
+            irt.Move(self.index, addition),
+        ]
+        numbered = value_number_block(statements, ValueTable())
+        self.assertEqual(numbered, statements)
+
+    def test_example_4(self):
+        self._value_number_fragments("test4.tig")
+
+    def test_example_6(self):
+        self._value_number_fragments("test6.tig")
+
+    def test_example_30(self):
+        self._value_number_fragments("test30.tig")
+
+    def test_example_47(self):
+        self._value_number_fragments("test47.tig")
+
+    def test_example_60(self):
+        self._value_number_fragments("test60.tig")
+
+    def test_example_70(self):
+        self._value_number_fragments("test70.tig")
+
+    def _value_number_fragments(self, file_name: str):
+        semantic_analysis(file_name)
+        for fragment in FragmentManager.get_fragments():
+            if isinstance(fragment, ProcessFragment):
+                block = basic_block(linearize(fragment.body))
+                for statements in block.statement_lists:
+                    numbered = value_number_block(statements, ValueTable())
+                    self.assertEqual(numbered[0], statements[0])
+                    self.assertEqual(numbered[-1], statements[-1])
+                    self.assertLessEqual(
+                        self._count_calls(numbered), self._count_calls(statements)
+                    )
+
+    def _element_address(self) -> irt.Expression:
+        return irt.BinaryOperation(
+            irt.BinaryOperator.plus,
+            self.array,
+            irt.BinaryOperation(irt.BinaryOperator.mul, self.index, irt.Constant(8)),
+        )
+
+    def _frame_slot(self, offset: int) -> irt.Expression:
+        return irt.Memory(
+            irt.BinaryOperation(
+                irt.BinaryOperator.plus,
+                irt.Temporary(frame_pointer()),
+                irt.Constant(offset),
+            )
+        )
+
+    def _count_multiplications(self, statements: List[irt.Statement]) -> int:
+        return str(statements).count("BinaryOperator.mul")
+
+    def _count_calls(self, statements: List[irt.Statement]) -> int:
+        return str(statements).count("Call(")
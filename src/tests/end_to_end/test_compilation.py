@@ -23,7 +23,9 @@ class TestCompilation(unittest.TestCase):
         self._test_successful_execution("test5.tig", return_code=0)
 
     def test_example_6(self):
-        self._test_segmentation_fault("test6.tig")
+        # The mutually recursive calls are tail calls, so the program runs forever
+        # without exhausting the stack.
+        self._test_infinite_execution("test6.tig")
 
     def test_example_7(self):
         self._test_segmentation_fault("test7.tig")
@@ -338,6 +340,21 @@ class TestCompilation(unittest.TestCase):
             console_output="0 1 2 3 4 5 6 7 8 9 10",
         )
 
+    def test_example_static_links(self):
+        self._test_successful_execution(
+            "static_links.tig", return_code=0, console_output="15\n11\n10\n6\n121"
+        )
+
+    def test_example_inlining(self):
+        self._test_successful_execution(
+            "inlining.tig", return_code=0, console_output="101\n113\n214\n214"
+        )
+
+    def test_example_tail_calls(self):
+        self._test_successful_execution(
+            "tail_calls.tig", return_code=0, console_output="500000500000\n0"
+        )
+
     def test_example_queens(self):
         self._compile_program("queens.tig")
         result = self._run_compiled_program()
@@ -355,6 +372,104 @@ class TestCompilation(unittest.TestCase):
             result.stdout,
         )
 
+    def test_example_intrinsics(self):
+        self._test_successful_execution(
+            "intrinsics.tig",
+            return_code=0,
+            console_output="1\n0\n1\n0\nzero\n104\n-1\n-56",
+        )
+
+    def test_example_strings(self):
+        self._test_successful_execution(
+            "strings.tig",
+            return_code=0,
+            console_output="5\n5\n3\n9\n1\n0\n0\n1\n0\n1\n1\n0\n3\nti",
+        )
+
+    def test_example_min_max(self):
+        self._test_successful_execution(
+            "min_max.tig",
+            return_code=0,
+            console_output="3\n3\n-2\n4\n4\n0\n0\n3\n5\n5\n10",
+        )
+
+    def test_example_constant_arithmetic(self):
+        self._test_successful_execution(
+            "constant_arithmetic.tig",
+            return_code=0,
+            console_output="296\n-148\n333\n259\n18\n-2\n12\n5\n-3\n"
+            + "-296\n148\n-333\n-259\n-18\n2\n-12\n-5\n3\n"
+            + "-79012345687896\n39506172843948\n-88888888898883\n-69135802476909\n"
+            + "-4938271605493\n617283950686\n-3292181070329\n-1410934744426\n"
+            + "987654321098\n42\n-8",
+        )
+
+    def test_example_local_allocation(self):
+        self._test_successful_execution(
+            "local_allocation.tig", return_code=0, console_output="230\n10"
+        )
+
+    def test_if_conversion_can_be_disabled(self):
+        self._compile_program("min_max.tig", ["--no-if-conversion"])
+        result = self._run_compiled_program()
+
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout.strip(), "3\n3\n-2\n4\n4\n0\n0\n3\n5\n5\n10")
+
+    def test_runtime_allocating_with_malloc(self):
+        self._run_command(
+            [
+                "env",
+                "RUNTIME_CFLAGS=-DTIGER_MALLOC",
+                "./compile.sh",
+                "examples/merge.tig",
+            ]
+        )
+        result = self._run_compiled_program("1 3 5 6 7 10; 0 2 4 8 9;")
+
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout.strip(), "0 1 2 3 4 5 6 7 8 9 10")
+
+    def test_example_garbage(self):
+        self._test_successful_execution(
+            "garbage.tig",
+            return_code=0,
+            console_input="1000",
+            console_output="1000\n478333\n470",
+        )
+
+    def test_garbage_collection_finds_every_pointer(self):
+        # The stress mode of the runtime collects before every allocation, moving every
+        # object that is still reachable.
+        self._run_command(
+            [
+                "env",
+                "RUNTIME_CFLAGS=-DTIGER_GC_STRESS",
+                "./compile.sh",
+                "examples/garbage.tig",
+            ]
+        )
+        result = self._run_compiled_program("3")
+
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout.strip(), "3\n1424\n478")
+
+    def test_profile_guided_compilation(self):
+        console_input = "1 3 5 6 7 10; 0 2 4 8 9;"
+        self._compile_program("merge.tig", ["--profile-generate"])
+        self._run_compiled_program(console_input)
+        try:
+            compilation = self._compile_program(
+                "merge.tig", ["--profile-use", "tiger.profile"]
+            )
+        finally:
+            self._run_command(["rm", "tiger.profile"])
+        result = self._run_compiled_program(console_input)
+
+        self.assertEqual(compilation.stdout, "")
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout.strip(), "0 1 2 3 4 5 6 7 8 9 10")
+
     def _test_compilation_error(self, source_file_name: str):
         compilation_result = self._compile_program(source_file_name)
         self.assertIn("error", compilation_result.stdout)
@@ -381,17 +496,28 @@ class TestCompilation(unittest.TestCase):
 
         self.assertEqual(result.returncode, -11)
 
-    def _compile_program(self, source_file_name: str) -> subprocess.CompletedProcess:
-        return self._run_command(["./compile.sh", "examples/" + source_file_name])
+    def _test_infinite_execution(self, source_file_name: str):
+        self._compile_program(source_file_name)
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self._run_compiled_program(timeout=1)
+
+    def _compile_program(
+        self, source_file_name: str, arguments: List[str] = ()
+    ) -> subprocess.CompletedProcess:
+        return self._run_command(
+            ["./compile.sh", "examples/" + source_file_name] + list(arguments)
+        )
 
-    def _run_compiled_program(self, console_input="") -> subprocess.CompletedProcess:
-        return self._run_command(["./a.out"], console_input)
+    def _run_compiled_program(
+        self, console_input="", timeout=None
+    ) -> subprocess.CompletedProcess:
+        return self._run_command(["./a.out"], console_input, timeout)
 
     def _remove_program(self):
         self._run_command(["rm", "a.out"])
 
     def _run_command(
-        self, arguments: List[str], console_input=""
+        self, arguments: List[str], console_input="", timeout=None
     ) -> subprocess.CompletedProcess:
         return subprocess.run(
             arguments,
@@ -399,4 +525,5 @@ class TestCompilation(unittest.TestCase):
             stderr=subprocess.PIPE,
             universal_newlines=True,
             input=console_input,
+            timeout=timeout,
         )
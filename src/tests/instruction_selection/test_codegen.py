@@ -0,0 +1,134 @@
+import unittest
+from typing import List
+
+import intermediate_representation.tree as irt
+from activation_records.frame import Frame, TempMap, frame_pointer
+from activation_records.temp import TempManager
+from instruction_selection.codegen import Codegen
+
+
+class TestCodegen(unittest.TestCase):
+    def setUp(self):
+        TempMap.initialize()
+        self.frame = Frame(TempManager.new_label(), [])
+        self.value = TempManager.new_temp()
+
+    def test_comparison_against_zero_is_a_test(self):
+        lines = self._comparison_lines(
+            irt.RelationalOperator.ne, irt.Temporary(self.value), irt.Constant(0)
+        )
+
+        self.assertEqual(lines, ["testq %'s0, %'s0\n", "jne 'j0\n"])
+
+    def test_constant_operand_is_an_immediate(self):
+        # The constant is swapped to the right, so the condition is mirrored.
+        lines = self._comparison_lines(
+            irt.RelationalOperator.lt, irt.Constant(5), irt.Temporary(self.value)
+        )
+
+        self.assertEqual(lines, ["cmpq $5, %'s0\n", "jg 'j0\n"])
+
+    def test_large_constant_is_moved_to_a_register(self):
+        lines = self._comparison_lines(
+            irt.RelationalOperator.eq, irt.Temporary(self.value), irt.Constant(2 ** 40)
+        )
+
+        self.assertEqual(
+            lines, [f"movq ${2 ** 40}, %'d0\n", "cmpq %'s0, %'s1\n", "je 'j0\n"]
+        )
+
+    def test_frame_slot_is_compared_in_memory(self):
+        slot = irt.Memory(
+            irt.BinaryOperation(
+                irt.BinaryOperator.plus,
+                irt.Temporary(frame_pointer()),
+                irt.Constant(-16),
+            )
+        )
+
+        self.assertEqual(
+            self._comparison_lines(irt.RelationalOperator.le, slot, irt.Constant(0)),
+            ["cmpq $0, -16(%'s0)\n", "jle 'j0\n"],
+        )
+        self.assertEqual(
+            self._comparison_lines(
+                irt.RelationalOperator.ge, slot, irt.Temporary(self.value)
+            ),
+            ["cmpq %'s0, -16(%'s1)\n", "jge 'j0\n"],
+        )
+        self.assertEqual(
+            self._comparison_lines(
+                irt.RelationalOperator.ge, irt.Temporary(self.value), slot
+            ),
+            ["cmpq -16(%'s0), %'s1\n", "jge 'j0\n"],
+        )
+
+    def test_multiplication_by_word_size_is_a_shift(self):
+        self.assertEqual(
+            self._expression_lines(irt.BinaryOperator.mul, irt.Constant(8)),
+            ["movq %'s0, %'d0\n", "salq $3, %'d0\n", "movq %'s0, %'d0\n"],
+        )
+
+    def test_multiplication_by_small_constants_avoids_rax(self):
+        self.assertEqual(
+            self._expression_lines(irt.BinaryOperator.mul, irt.Constant(9)),
+            ["leaq (%'s0,%'s0,8), %'d0\n", "movq %'s0, %'d0\n"],
+        )
+        self.assertEqual(
+            self._expression_lines(irt.BinaryOperator.mul, irt.Constant(-7)),
+            ["imulq $-7, %'s0, %'d0\n", "movq %'s0, %'d0\n"],
+        )
+
+    def test_division_by_constant_does_not_divide(self):
+        self.assertEqual(
+            self._expression_lines(irt.BinaryOperator.div, irt.Constant(4)),
+            [
+                "movq %'s0, %'d0\n",
+                "sarq $63, %'d0\n",
+                "shrq $62, %'d0\n",
+                "addq %'s1, %'d0\n",
+                "sarq $2, %'d0\n",
+                "movq %'s0, %'d0\n",
+            ],
+        )
+        lines = self._expression_lines(irt.BinaryOperator.div, irt.Constant(10))
+        self.assertIn("imulq %'s1\n", lines)
+        self.assertNotIn("idivq %'s2\n", lines)
+
+    def test_addition_does_not_copy_its_operand(self):
+        other = TempManager.new_temp()
+        self.assertEqual(
+            self._expression_lines(irt.BinaryOperator.plus, irt.Temporary(other)),
+            ["leaq (%'s0,%'s1), %'d0\n", "movq %'s0, %'d0\n"],
+        )
+        self.assertEqual(
+            self._expression_lines(irt.BinaryOperator.minus, irt.Constant(16)),
+            ["leaq -16(%'s0), %'d0\n", "movq %'s0, %'d0\n"],
+        )
+
+    # Lines of the instructions that move the result of the operation on the value and
+    # the operand to a temporary.
+    def _expression_lines(
+        self, operator: irt.BinaryOperator, operand: irt.Expression
+    ) -> List[str]:
+        instructions = Codegen.codegen(
+            self.frame,
+            [
+                irt.Move(
+                    irt.Temporary(TempManager.new_temp()),
+                    irt.BinaryOperation(operator, irt.Temporary(self.value), operand),
+                )
+            ],
+        )
+        return [instruction.line for instruction in instructions]
+
+    def _comparison_lines(
+        self,
+        operator: irt.RelationalOperator,
+        left: irt.Expression,
+        right: irt.Expression,
+    ) -> List[str]:
+        instructions = Codegen.codegen(
+            self.frame, [irt.ConditionalJump(operator, left, right, "true", "false")]
+        )
+        return [instruction.line for instruction in instructions]
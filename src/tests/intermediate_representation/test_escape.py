@@ -0,0 +1,98 @@
+import unittest
+from typing import Dict
+
+import parser.ast_nodes as ast
+from intermediate_representation.escape import (
+    find_escape,
+    find_free_variables,
+    find_local_allocations,
+)
+from tests.utils.compilation_steps import parse_program
+
+
+class TestFreeVariables(unittest.TestCase):
+    """Checks which functions keep their static link and which ones receive the
+    variables of their enclosing functions as extra arguments."""
+
+    def test_function_without_free_variables_has_no_static_link(self):
+        functions = self._analyzed_functions("test4.tig")
+        self.assertFalse(functions["nfactor"].static_link)
+        self.assertEqual(functions["nfactor"].lifted_variables, [])
+
+    def test_function_reading_outer_variables_is_lifted(self):
+        functions = self._analyzed_functions("static_links.tig")
+        self.assertFalse(functions["below"].static_link)
+        self.assertEqual(functions["below"].lifted_variables, ["limit"])
+        self.assertFalse(functions["current"].static_link)
+        self.assertEqual(functions["current"].lifted_variables, ["counter"])
+        self.assertFalse(functions["square"].static_link)
+
+    def test_function_writing_outer_variable_keeps_static_link(self):
+        functions = self._analyzed_functions("static_links.tig")
+        self.assertTrue(functions["increment"].static_link)
+        self.assertEqual(functions["increment"].lifted_variables, [])
+
+    def test_function_reading_many_outer_variables_keeps_static_link(self):
+        functions = self._analyzed_functions("queens.tig")
+        self.assertTrue(functions["try"].static_link)
+        self.assertEqual(functions["try"].lifted_variables, [])
+        self.assertFalse(functions["printboard"].static_link)
+        self.assertEqual(functions["printboard"].lifted_variables, ["N", "col"])
+
+    def _analyzed_functions(self, file_name: str) -> Dict[str, ast.FunctionDec]:
+        program = parse_program(file_name)
+        find_escape(program)
+        find_free_variables(program)
+        functions = {}
+        for declaration in program.decs.declaration_list:
+            if isinstance(declaration, ast.FunctionDecBlock):
+                for function in declaration.function_dec_list:
+                    functions[function.name] = function
+        return functions
+
+
+class TestLocalAllocations(unittest.TestCase):
+    """Checks which records and arrays are allocated in the function that creates them
+    instead of in the heap."""
+
+    def test_objects_only_accessed_by_their_function_are_local(self):
+        variables = self._analyzed_variables("local_allocation.tig")
+        self.assertTrue(variables["local_point"].local_allocation)
+        self.assertTrue(variables["local_numbers"].local_allocation)
+
+    def test_objects_leaving_their_function_are_in_the_heap(self):
+        variables = self._analyzed_variables("local_allocation.tig")
+        self.assertFalse(variables["returned"].local_allocation)
+        self.assertFalse(variables["passed"].local_allocation)
+        self.assertFalse(variables["read_by_nested"].local_allocation)
+
+    def test_large_arrays_are_in_the_heap(self):
+        variables = self._analyzed_variables("local_allocation.tig")
+        self.assertFalse(variables["large"].local_allocation)
+        self.assertFalse(variables["result"].local_allocation)
+
+    def _analyzed_variables(self, file_name: str) -> Dict[str, ast.VariableDec]:
+        program = parse_program(file_name)
+        find_local_allocations(program)
+        variables = {}
+        self._collect_variables(program, variables)
+        return variables
+
+    # Collects the variable declarations of the let expressions of the program, and of
+    # the bodies of its functions.
+    def _collect_variables(
+        self, expression: ast.Expression, variables: Dict[str, ast.VariableDec]
+    ):
+        if isinstance(expression, ast.SeqExp):
+            for sequence_expression in expression.seq:
+                self._collect_variables(sequence_expression, variables)
+        elif isinstance(expression, ast.ForExp):
+            self._collect_variables(expression.body, variables)
+        elif isinstance(expression, ast.LetExp):
+            for declaration in expression.decs.declaration_list:
+                if isinstance(declaration, ast.VariableDec):
+                    variables[declaration.name] = declaration
+                elif isinstance(declaration, ast.FunctionDecBlock):
+                    for function in declaration.function_dec_list:
+                        self._collect_variables(function.body, variables)
+            self._collect_variables(expression.body, variables)
@@ -0,0 +1,75 @@
+import unittest
+from typing import List
+
+from activation_records.temp import TempLabel
+from intermediate_representation.call_graph import CallGraph
+from intermediate_representation.fragment import FragmentManager, ProcessFragment
+from intermediate_representation.inline import (
+    inline_functions,
+    called_functions,
+    only_uses_frame_slots,
+)
+from tests.utils.compilation_steps import semantic_analysis
+
+
+class TestInline(unittest.TestCase):
+    """Checks that calls to small non-recursive functions are replaced by their bodies,
+    and that the fragments of functions which are no longer called are removed."""
+
+    def setUp(self):
+        FragmentManager.fragment_list = []
+
+    def test_small_function_is_inlined(self):
+        semantic_analysis("test27.tig")
+        inline_functions()
+        self.assertEqual(self._fragment_names(), ["tigermain"])
+        self.assertEqual(self._calls_from("tigermain"), set())
+
+    def test_nested_small_functions_are_inlined(self):
+        semantic_analysis("test61.tig")
+        inline_functions()
+        self.assertEqual(self._fragment_names(), ["tigermain"])
+
+    def test_recursive_function_is_not_inlined(self):
+        semantic_analysis("test4.tig")
+        inline_functions()
+        self.assertEqual(len(self._fragment_names()), 2)
+        self.assertEqual(len(self._calls_from("tigermain")), 1)
+
+    def test_function_with_nested_functions_is_not_inlined(self):
+        semantic_analysis("merge.tig")
+        readint = CallGraph.function_order[2]
+        inline_functions()
+        self.assertIn(readint, self._fragment_names())
+
+    def test_inlined_nested_function_accesses_the_frame_of_its_caller(self):
+        # The static link of the copy of rd is the frame pointer of read itself, so the
+        # variables of read are still accessed as slots of its frame.
+        semantic_analysis("inlining.tig")
+        read = CallGraph.function_order[3]
+        inline_functions()
+        self.assertEqual(self._calls_from(read), set())
+        self.assertTrue(only_uses_frame_slots(self._body_of(read)))
+
+    def test_size_budget_limits_inlining(self):
+        semantic_analysis("test27.tig")
+        inline_functions(size_budget=0)
+        self.assertEqual(len(self._fragment_names()), 2)
+
+    def _fragment_names(self) -> List[TempLabel]:
+        return [
+            fragment.frame.name
+            for fragment in FragmentManager.get_fragments()
+            if isinstance(fragment, ProcessFragment)
+        ]
+
+    def _calls_from(self, function: TempLabel) -> set:
+        return called_functions(self._body_of(function)) & set(CallGraph.functions)
+
+    def _body_of(self, function: TempLabel):
+        for fragment in FragmentManager.get_fragments():
+            if (
+                isinstance(fragment, ProcessFragment)
+                and fragment.frame.name == function
+            ):
+                return fragment.body
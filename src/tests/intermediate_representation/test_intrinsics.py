@@ -0,0 +1,49 @@
+import unittest
+
+from intermediate_representation.intrinsics import Intrinsics
+from intermediate_representation.translate import call_expression
+from intermediate_representation.translated_expression import (
+    Expression,
+    convert_to_condition,
+)
+from intermediate_representation.tree import (
+    Call,
+    Constant,
+    ConditionalJump,
+    Name,
+    RelationalOperator,
+    Temporary,
+)
+
+
+class TestIntrinsics(unittest.TestCase):
+    def tearDown(self):
+        Intrinsics.initialize()
+
+    def test_call_with_constant_arguments_is_folded(self):
+        result = call_expression("not", None, None, [Expression(Constant(0))])
+
+        self.assertEqual(result, Expression(Constant(1)))
+
+    def test_call_used_as_condition_is_a_comparison(self):
+        condition = convert_to_condition(Expression(self._not_call()))
+
+        self.assertEqual(
+            condition.statement,
+            ConditionalJump(RelationalOperator.eq, Temporary(1), Constant(0)),
+        )
+
+    def test_disabled_intrinsics_are_called(self):
+        Intrinsics.initialize(enabled=False)
+
+        result = call_expression("not", None, None, [Expression(Constant(0))])
+        condition = convert_to_condition(Expression(self._not_call()))
+
+        self.assertEqual(result, Expression(Call(Name("not"), [Constant(0)])))
+        self.assertEqual(
+            condition.statement,
+            ConditionalJump(RelationalOperator.ne, self._not_call(), Constant(0)),
+        )
+
+    def _not_call(self) -> Call:
+        return Call(Name("not"), [Temporary(1)])
@@ -0,0 +1,87 @@
+import unittest
+from typing import List
+
+import intermediate_representation.tree as irt
+from activation_records.temp import TempLabel
+from canonical.linearize import linearize
+from intermediate_representation.call_graph import CallGraph
+from intermediate_representation.fragment import FragmentManager, ProcessFragment
+from intermediate_representation.tail_call import optimize_tail_calls
+from tests.utils.compilation_steps import semantic_analysis
+
+
+class TestTailCall(unittest.TestCase):
+    """Checks that calls in tail position become jumps: self calls jump back to the
+    start of the function and calls to other functions become tail calls."""
+
+    def setUp(self):
+        FragmentManager.fragment_list = []
+
+    def test_self_tail_call_becomes_loop(self):
+        semantic_analysis("tail_calls.tig")
+        sum_function = CallGraph.function_order[0]
+        optimize_tail_calls()
+        statements = self._statements(sum_function)
+        self.assertEqual(self._called_functions(statements), [])
+        self.assertTrue(
+            any(
+                isinstance(statement, irt.Jump)
+                and isinstance(statements[0], irt.Move)
+                and irt.Label(statement.labels[0]) in statements
+                for statement in statements
+            )
+        )
+
+    def test_mutual_tail_calls_become_tail_calls(self):
+        semantic_analysis("tail_calls.tig")
+        even_function, odd_function = CallGraph.function_order[1:3]
+        optimize_tail_calls()
+        for function, callee in [
+            (even_function, odd_function),
+            (odd_function, even_function),
+        ]:
+            statements = self._statements(function)
+            self.assertEqual(self._called_functions(statements), [])
+            self.assertIn(callee, self._tail_called_functions(statements))
+
+    def test_call_out_of_tail_position_is_kept(self):
+        semantic_analysis("test4.tig")
+        factorial_function = CallGraph.function_order[0]
+        optimize_tail_calls()
+        statements = self._statements(factorial_function)
+        self.assertEqual(self._called_functions(statements), [factorial_function])
+        self.assertEqual(self._tail_called_functions(statements), [])
+
+    def test_call_with_caller_frame_as_static_link_is_kept(self):
+        semantic_analysis("queens.tig")
+        main_function = CallGraph.function_order[-1]
+        optimize_tail_calls()
+        statements = self._statements(main_function)
+        self.assertEqual(len(self._called_functions(statements)), 1)
+        self.assertEqual(self._tail_called_functions(statements), [])
+
+    def _statements(self, function: TempLabel) -> List[irt.Statement]:
+        for fragment in FragmentManager.get_fragments():
+            if (
+                isinstance(fragment, ProcessFragment)
+                and fragment.frame.name == function
+            ):
+                return linearize(fragment.body)
+
+    def _called_functions(self, statements: List[irt.Statement]) -> List[TempLabel]:
+        return [
+            statement.expression.function.label
+            for statement in statements
+            if isinstance(statement, (irt.Move, irt.StatementExpression))
+            and isinstance(statement.expression, irt.Call)
+            and statement.expression.function.label in CallGraph.functions
+        ]
+
+    def _tail_called_functions(
+        self, statements: List[irt.Statement]
+    ) -> List[TempLabel]:
+        return [
+            statement.function.label
+            for statement in statements
+            if isinstance(statement, irt.TailCall)
+        ]
@@ -0,0 +1,181 @@
+import unittest
+from typing import List
+
+import instruction_selection.assembly as Assembly
+from activation_records.frame import (
+    Frame,
+    TempMap,
+    argument_registers,
+    caller_saved_registers,
+    frame_pointer,
+    sink,
+)
+from activation_records.temp import Temp, TempManager
+from register_allocation.allocation import RegisterAllocator
+
+
+class TestRegisterAllocator(unittest.TestCase):
+    def setUp(self):
+        TempMap.initialize()
+        self.frame = Frame(TempManager.new_label(), [])
+
+    def test_constant_is_rematerialized_instead_of_spilled(self):
+        constant = TempManager.new_temp()
+        definition = Assembly.Move(
+            line="movq $7, %'d0\n", source=[], destination=[constant]
+        )
+        loaded = [TempManager.new_temp() for _ in range(17)]
+        constant_use = self._use([constant])
+        instructions = (
+            [definition]
+            + [self._load(temp) for temp in loaded]
+            + [self._use(loaded), constant_use]
+        )
+
+        result = RegisterAllocator(self.frame).main(instructions)
+
+        # The constant is loaded again right before its use, and not kept in memory.
+        index = result.instructions.index(constant_use)
+        recomputation = result.instructions[index - 1]
+        self.assertEqual(recomputation.line, "movq $7, %'d0\n")
+        self.assertEqual(recomputation.destination, constant_use.source)
+        self.assertNotIn(constant, constant_use.source)
+        self.assertFalse(
+            any(instruction is definition for instruction in result.instructions)
+        )
+        self.assertFalse(
+            any(access.temporary == constant for access in result.slot_accesses)
+        )
+
+    def test_spilled_temporary_is_compared_in_memory(self):
+        spilled = TempManager.new_temp()
+        loaded = [TempManager.new_temp() for _ in range(14)]
+        comparison = Assembly.Operation(
+            line="cmpq %'s0, %'s1\n",
+            source=[spilled, loaded[0]],
+            destination=[],
+            jump=None,
+        )
+        # The other temporaries are used more often, so they are more costly to spill.
+        instructions = sink(
+            [self._load(spilled)]
+            + [self._load(temp) for temp in loaded]
+            + [self._use(loaded), self._use(loaded), comparison]
+        )
+
+        result = RegisterAllocator(self.frame).main(instructions)
+
+        self.assertEqual(comparison.line, "cmpq -8(%'s0), %'s1\n")
+        self.assertEqual(comparison.source[0], frame_pointer())
+        # The value is stored in the slot right after its definition.
+        definition, store = result.instructions[:2]
+        self.assertEqual(store.line, "movq %'s0, -8(%'s1)\n")
+        self.assertEqual(store.source[0], definition.destination[0])
+
+    def test_temporary_live_across_a_call_is_split_instead_of_spilled(self):
+        # Only five callee-saved registers can keep a value across the call.
+        across = [TempManager.new_temp() for _ in range(6)]
+        call = Assembly.Operation(
+            line="call f\n",
+            source=[],
+            destination=[
+                TempMap.register_to_temp[register]
+                for register in caller_saved_registers + argument_registers + ["rax"]
+            ],
+            jump=None,
+        )
+        instructions = sink(
+            [self._load(temp) for temp in across]
+            + [call]
+            + [self._use(across), self._use(across), self._use(across)]
+        )
+
+        result = RegisterAllocator(self.frame).main(instructions)
+
+        # One of the temporaries is copied into a new one around the call, which is the
+        # only one kept in memory. The copies become the store and load of its slot.
+        index = result.instructions.index(call)
+        store, load = result.instructions[index - 1], result.instructions[index + 1]
+        self.assertEqual(store.line, "movq %'s0, -8(%'s1)\n")
+        self.assertIn(store.source[0], across)
+        self.assertEqual(load.line, "movq -8(%'s0), %'d0\n")
+        self.assertEqual(load.destination, store.source[:1])
+        self.assertEqual(len(result.slot_accesses), 2)
+        self.assertFalse(
+            any(access.temporary in across for access in result.slot_accesses)
+        )
+
+    def test_pointer_live_across_a_collecting_call_is_kept_in_the_frame(self):
+        pointer = TempManager.new_temp(pointer=True)
+        output, allocation = self._call("print_num"), self._call("init_record")
+        instructions = sink(
+            [self._load(pointer), output, self._use([pointer])]
+            + [allocation, self._use([pointer])]
+        )
+
+        result = RegisterAllocator(self.frame).main(instructions)
+
+        # Printing never collects garbage, so the pointer only needs a slot during the
+        # allocation, where the collector finds it.
+        self.assertEqual(result.spilled_pointers, {id(allocation): [-8]})
+
+    def test_allocation_finishes_under_high_pressure(self):
+        values = [TempManager.new_temp() for _ in range(24)]
+        instructions = [self._load(temp) for temp in values] + [self._call("print_num")]
+        for value in values:
+            # The constant does not fit in the immediate of a multiplication.
+            constant = TempManager.new_temp()
+            instructions += [
+                Assembly.Move(
+                    line="movq $4294967299, %'d0\n", source=[], destination=[constant]
+                ),
+                self._use([value, constant]),
+            ]
+        instructions = sink(instructions + [self._use([temp]) for temp in values])
+
+        allocator = RoundCountingAllocator(self.frame)
+        allocator.main(instructions)
+
+        # The temporaries made by spilling, rematerializing or splitting are not spilled
+        # again, so only a few rounds are needed.
+        self.assertLessEqual(allocator.rounds, 4)
+
+    def _call(self, function: str) -> Assembly.Instruction:
+        return Assembly.Operation(
+            line=f"call {function}\n",
+            source=[],
+            destination=[
+                TempMap.register_to_temp[register]
+                for register in caller_saved_registers + argument_registers + ["rax"]
+            ],
+            jump=None,
+        )
+
+    def _load(self, temp: Temp) -> Assembly.Instruction:
+        return Assembly.Operation(
+            line=f"movq {8 * temp}(%'s0), %'d0\n",
+            source=[frame_pointer()],
+            destination=[temp],
+            jump=None,
+        )
+
+    # An instruction that only reads the temporaries.
+    def _use(self, temps: List[Temp]) -> Assembly.Instruction:
+        return Assembly.Operation(line="nop\n", source=temps, destination=[], jump=None)
+
+
+# Raises an error instead of running forever if the allocation does not finish.
+class RoundCountingAllocator(RegisterAllocator):
+    maximum_rounds = 20
+
+    def __init__(self, frame: Frame):
+        super().__init__(frame)
+        self.rounds = 0
+
+    def _rewrite_program(
+        self, instructions: List[Assembly.Instruction]
+    ) -> List[Assembly.Instruction]:
+        self.rounds += 1
+        if self.rounds > self.maximum_rounds:
+            raise RuntimeError("Register allocation does not finish")
+        return super()._rewrite_program(instructions)
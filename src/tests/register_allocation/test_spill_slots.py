@@ -0,0 +1,86 @@
+import unittest
+
+import instruction_selection.assembly as Assembly
+from activation_records.frame import Frame, TempMap, frame_pointer
+from activation_records.temp import Temp, TempManager
+from register_allocation.spill_slots import (
+    SlotAccess,
+    assign_spill_slots,
+    slot_placeholder,
+)
+
+
+class TestSpillSlots(unittest.TestCase):
+    def setUp(self):
+        TempMap.initialize()
+        self.frame = Frame(TempManager.new_label(), [])
+        self.accesses = []
+
+    def test_disjoint_temporaries_share_a_slot(self):
+        first, second = TempManager.new_temp(), TempManager.new_temp()
+        instructions = [
+            self._store(first),
+            self._load(first),
+            self._store(second),
+            self._load(second),
+        ]
+
+        assign_spill_slots(self.frame, instructions, self.accesses)
+
+        self.assertEqual(self.frame.offset, -8)
+        self.assertEqual(instructions[0].line, "movq %'s0, -8(%'s1)\n")
+        self.assertEqual(instructions[3].line, "movq -8(%'s0), %'d0\n")
+
+    def test_overlapping_temporaries_get_different_slots(self):
+        first, second = TempManager.new_temp(), TempManager.new_temp()
+        instructions = [
+            self._store(first),
+            self._store(second),
+            self._load(first),
+            self._load(second),
+        ]
+
+        assign_spill_slots(self.frame, instructions, self.accesses)
+
+        self.assertEqual(self.frame.offset, -16)
+        self.assertEqual(instructions[2].line, "movq -8(%'s0), %'d0\n")
+        self.assertEqual(instructions[3].line, "movq -16(%'s0), %'d0\n")
+
+    def test_temporary_live_around_a_loop_keeps_its_slot(self):
+        first, second = TempManager.new_temp(), TempManager.new_temp()
+        loop = TempManager.new_label()
+        instructions = [
+            self._store(first),
+            Assembly.Label(line=f"{loop}:\n", label=loop),
+            self._store(second),
+            self._load(second),
+            self._load(first),
+            Assembly.Operation(
+                line=f"jl {loop}\n", source=[], destination=[], jump=[loop, "done"]
+            ),
+            Assembly.Label(line="done:\n", label="done"),
+        ]
+
+        assign_spill_slots(self.frame, instructions, self.accesses)
+
+        self.assertEqual(self.frame.offset, -16)
+
+    def _store(self, temporary: Temp) -> Assembly.Instruction:
+        instruction = Assembly.Operation(
+            line=f"movq %'s0, {slot_placeholder}(%'s1)\n",
+            source=[TempManager.new_temp(), frame_pointer()],
+            destination=[],
+            jump=None,
+        )
+        self.accesses.append(SlotAccess(instruction, temporary, False, True))
+        return instruction
+
+    def _load(self, temporary: Temp) -> Assembly.Instruction:
+        instruction = Assembly.Operation(
+            line=f"movq {slot_placeholder}(%'s0), %'d0\n",
+            source=[frame_pointer()],
+            destination=[TempManager.new_temp()],
+            jump=None,
+        )
+        self.accesses.append(SlotAccess(instruction, temporary, True, False))
+        return instruction